@@ -3,18 +3,52 @@ AI Service Proxy - Secure backend proxy for AI services
 Handles API keys securely on the backend, never exposing them to frontend
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Request
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any, AsyncGenerator
+from contextlib import AsyncExitStack, aclosing
+from functools import partial
+import anyio
+import asyncio
 import httpx
 import json
 import os
+import re
+import time
+import uuid
 from datetime import datetime
 import logging
 
-from app.api.auth import get_current_user
+from app.api.auth import get_current_admin_user, get_current_user
 from app.models.employee import Employee
+from app.services.ai_cache import AIResponseCache, cache_key, is_deterministic
+from app.services.ai_clients import (
+    get_ai_client,
+    get_client_metrics,
+    record_first_token,
+    record_stream_finished,
+    record_transport_error
+)
+from app.services.ai_singleflight import Broadcast, SingleFlight, StreamFlights
+from app.services.ai_usage import (
+    AI_DAILY_REQUEST_QUOTAS,
+    AI_DAILY_TOKEN_QUOTAS,
+    SOURCE_CACHE,
+    SOURCE_COALESCED,
+    SOURCE_UPSTREAM,
+    QuotaReservation,
+    StreamUsageMeter,
+    check_quota,
+    estimate_tokens,
+    get_usage_summary,
+    prompt_text,
+    record_usage,
+    role_quota,
+    usage_from_response
+)
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +64,24 @@ ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 GROK_API_URL = "https://api.x.ai/v1/chat/completions"
 
+# Response cache for deterministic (temperature 0) requests
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", str(24 * 3600)))  # seconds
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))  # Memory tier, per worker
+AI_CACHE_MAX_ENTRY_KB = int(os.getenv("AI_CACHE_MAX_ENTRY_KB", "256"))
+AI_CACHE_DISK_PATH = os.getenv("AI_CACHE_DISK_PATH", "")  # SQLite file shared by workers; empty = memory only
+AI_CACHE_DISK_MAX_MB = int(os.getenv("AI_CACHE_DISK_MAX_MB", "100"))
+
+# Concurrent identical requests share one upstream call
+AI_COALESCE_ENABLED = os.getenv("AI_COALESCE_ENABLED", "true").lower() == "true"
+
+# Stream events that carry generated text (time-to-first-token)
+TOKEN_EVENT_PATTERNS = {
+    "anthropic": re.compile(rb'"type":\s*"content_block_delta"'),
+    "openai": re.compile(rb'"content":\s*"(?!")'),
+    "grok": re.compile(rb'"content":\s*"(?!")')
+}
+
 # Request/Response Models
 class AnthropicMessage(BaseModel):
     role: str = Field(..., pattern="^(user|assistant|system)$")
@@ -61,33 +113,264 @@ class GrokRequest(BaseModel):
     temperature: float = Field(default=0.7, ge=0, le=1)
     stream: bool = Field(default=False)
 
-# Rate limiting per user
-user_request_counts: Dict[str, Dict[str, int]] = {}
+response_cache = AIResponseCache(
+    maxsize=AI_CACHE_MAX_ENTRIES,
+    ttl=AI_CACHE_TTL,
+    max_entry_bytes=AI_CACHE_MAX_ENTRY_KB * 1024,
+    disk_path=AI_CACHE_DISK_PATH or None,
+    disk_max_bytes=AI_CACHE_DISK_MAX_MB * 1024 * 1024
+)
+
+completion_flights = SingleFlight()
+stream_flights = StreamFlights()
+
+PROVIDER_NAMES = ["anthropic", "openai", "grok"]
+
+async def enforce_quota(current_user: Employee, provider: str) -> QuotaReservation:
+    """Daily request and token quotas of the user's role (AI_DAILY_*_QUOTAS); reserves the request"""
+    reservation, refused = await check_quota(current_user.id, current_user.role, provider)
+    if refused:
+        raise HTTPException(status_code=429, detail=refused)
+    return reservation
+
+def error_status(error: BaseException) -> int:
+    """Status the proxy handlers answer with for an error, for the usage ledger"""
+    if isinstance(error, asyncio.CancelledError):
+        return 499  # Client went away before the answer
+    if isinstance(error, HTTPException):
+        return error.status_code
+    if isinstance(error, httpx.TimeoutException):
+        return 504
+    if isinstance(error, httpx.TransportError):
+        return 502
+    return 500
+
+async def pump_stream(
+    provider: str,
+    name: str,
+    url: str,
+    headers: dict,
+    payload: dict,
+    opened: asyncio.Future,
+    broadcast: Broadcast
+):
+    """
+    The single upstream stream behind every subscriber of a flight: resolves
+    opened once the upstream status is known, then publishes chunks as they arrive.
+    """
+    started = time.monotonic()
+    cleanup = AsyncExitStack()
+    first_token = None
+    completed = False
+    interrupted = None
+    try:
+        upstream = await cleanup.enter_async_context(
+            get_ai_client(provider).stream("POST", url, headers=headers, json=payload)
+        )
+        if upstream.status_code != 200:
+            body = (await upstream.aread()).decode(errors="replace")
+            logger.error(f"{name} API error: {upstream.status_code} - {body}")
+            raise HTTPException(status_code=upstream.status_code, detail=f"{name} API error: {body}")
+        opened.set_result(None)
+        
+        token_pattern = TOKEN_EVENT_PATTERNS[provider]
+        async for chunk in upstream.aiter_bytes():
+            if first_token is None and token_pattern.search(chunk):
+                first_token = time.monotonic() - started
+                record_first_token(provider, first_token)
+            await broadcast.publish(chunk)
+        completed = True
+    except Exception as e:
+        if not opened.done():
+            # Every subscriber raises it, so upstream errors still become a proper HTTP status
+            opened.set_exception(e)
+        else:
+            if isinstance(e, httpx.TransportError):
+                record_transport_error(provider)
+            logger.error(f"{name} stream interrupted: {str(e)}")
+            interrupted = e
+    finally:
+        # Also reached when the last subscriber disconnects and the flight is cancelled:
+        # closing the upstream response aborts the generation instead of draining it
+        with anyio.CancelScope(shield=True):
+            await cleanup.aclose()
+            await broadcast.finish(interrupted)
+        if not opened.done():
+            opened.cancel()
+        elif opened.exception() is None:
+            record_stream_finished(provider, completed)
+            ttft = f"{first_token * 1000:.0f}ms" if first_token is not None else "n/a"
+            logger.info(
+                f"{provider} stream {'completed' if completed else 'cancelled'}, "
+                f"first token {ttft}, total {time.monotonic() - started:.1f}s"
+            )
+
+async def metered_stream(chunks: AsyncGenerator[bytes, None], provider: str, usage: partial, started: float):
+    """Pass the subscriber's chunks through, recording its usage when the stream ends or the client leaves"""
+    meter = StreamUsageMeter(provider)
+    status_code = 499  # Unless the stream runs to its end: the client went away
+    try:
+        # aclosing: the flight must see this subscriber leave even when the client disconnects
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                meter.feed(chunk)
+                yield chunk
+        status_code = 200
+    except Exception as e:
+        # Upstream broke off mid-stream (already logged by pump_stream); the response just ends early
+        status_code = error_status(e)
+    finally:
+        input_tokens, output_tokens, estimated_output = meter.output()
+        usage(
+            status_code=status_code,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            latency_seconds=time.monotonic() - started,
+            estimated_output=estimated_output
+        )
+
+async def close_stream(stream: AsyncGenerator[bytes, None], reservation: QuotaReservation):
+    """Response background task: record a stream the client left now, and free a reservation it never used"""
+    await stream.aclose()
+    reservation.settle()
 
-def check_rate_limit(user_id: str, service: str, limit: int = 100) -> bool:
-    """Check if user has exceeded rate limit (100 requests per day per service)"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    key = f"{user_id}:{today}"
+def coalescing_allowed(http_request: Request) -> bool:
+    """Cache-Control: no-store also opts a request out of sharing an upstream call"""
+    return AI_COALESCE_ENABLED and "no-store" not in http_request.headers.get("cache-control", "").lower()
+
+async def open_stream(
+    provider: str,
+    name: str,
+    url: str,
+    headers: dict,
+    payload: dict,
+    http_request: Request,
+    user_id: str,
+    reservation: QuotaReservation
+) -> StreamingResponse:
+    """Join the in-flight upstream stream of an identical request, or start one"""
+    started = time.monotonic()
+    key = cache_key(provider, payload) if coalescing_allowed(http_request) else uuid.uuid4().hex
+    source = SOURCE_COALESCED if stream_flights.in_flight(key) else SOURCE_UPSTREAM
+    usage = partial(
+        record_usage, user_id=user_id, provider=provider, model=payload.get("model"),
+        source=source, prompt=prompt_text(payload), reservation=reservation
+    )
+    try:
+        chunks = await stream_flights.join(key, partial(pump_stream, provider, name, url, headers, payload))
+    except BaseException as e:
+        usage(status_code=error_status(e), input_tokens=None, output_tokens=None,
+              latency_seconds=time.monotonic() - started)
+        raise
+    stream = metered_stream(chunks, provider, usage, started)
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        # Keep reverse proxies from buffering the event stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Runs after the response, also when the client disconnected or the body never started
+        background=BackgroundTask(close_stream, stream, reservation)
+    )
+
+async def fetch_completion(
+    provider: str,
+    name: str,
+    url: str,
+    headers: dict,
+    payload: dict,
+    cache_entry: Optional[str]
+) -> bytes:
+    """One upstream call, shared by coalesced callers; stores the response when it is cacheable"""
+    started = time.monotonic()
+    response = await get_ai_client(provider).post(url, headers=headers, json=payload)
+    upstream_seconds = time.monotonic() - started
+    
+    if response.status_code != 200:
+        logger.error(f"{name} API error: {response.status_code} - {response.text}")
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"{name} API error: {response.text}"
+        )
     
-    if key not in user_request_counts:
-        user_request_counts[key] = {}
+    if cache_entry is not None:
+        if response_cache.disk_enabled:
+            await run_in_threadpool(response_cache.set, cache_entry, response.content, upstream_seconds)
+        else:
+            response_cache.set(cache_entry, response.content, upstream_seconds)
+    return response.content
+
+async def complete(
+    provider: str,
+    name: str,
+    url: str,
+    headers: dict,
+    payload: dict,
+    http_request: Request,
+    user_id: str,
+    reservation: QuotaReservation
+) -> Response:
+    """
+    Non-streaming completion. Deterministic requests are answered from the
+    response cache; clients opt out per request with Cache-Control: no-cache
+    (skip the lookup, refresh the entry) or no-store (bypass the cache).
+    Identical requests in flight at the same time share one upstream call.
+    """
+    started = time.monotonic()
+    usage = partial(
+        record_usage, user_id=user_id, provider=provider, model=payload.get("model"),
+        prompt=prompt_text(payload), reservation=reservation
+    )
+    cache_control = http_request.headers.get("cache-control", "").lower()
+    key = cache_status = None
+    if AI_CACHE_ENABLED and is_deterministic(payload):
+        if "no-store" in cache_control:
+            response_cache.record_miss(bypassed=True)
+            cache_status = "BYPASS"
+        else:
+            cache_status = "MISS"
+            key = cache_key(provider, payload)
+            if "no-cache" not in cache_control:
+                cached = response_cache.get_memory(key)
+                if cached is None and response_cache.disk_enabled:
+                    cached = await run_in_threadpool(response_cache.get_disk, key)
+                if cached is not None:
+                    input_tokens, output_tokens = usage_from_response(provider, cached.body)
+                    usage(source=SOURCE_CACHE, status_code=200, input_tokens=input_tokens,
+                          output_tokens=output_tokens, latency_seconds=time.monotonic() - started)
+                    age = int(max(time.time() - cached.stored_at, 0))
+                    return Response(
+                        content=cached.body,
+                        media_type="application/json",
+                        headers={"X-AI-Cache": "HIT", "Age": str(age)}
+                    )
+            response_cache.record_miss(bypassed="no-cache" in cache_control)
     
-    if service not in user_request_counts[key]:
-        user_request_counts[key][service] = 0
+    fetch = partial(fetch_completion, provider, name, url, headers, payload, key)
+    source = SOURCE_UPSTREAM
+    try:
+        if coalescing_allowed(http_request):
+            flight_key = cache_key(provider, payload)
+            if completion_flights.in_flight(flight_key):
+                source = SOURCE_COALESCED
+            body = await completion_flights.run(flight_key, fetch)
+        else:
+            body = await fetch()
+    except BaseException as e:
+        usage(source=source, status_code=error_status(e), input_tokens=None, output_tokens=None,
+              latency_seconds=time.monotonic() - started)
+        raise
     
-    if user_request_counts[key][service] >= limit:
-        return False
+    input_tokens, output_tokens = usage_from_response(provider, body)
+    usage(source=source, status_code=200, input_tokens=input_tokens, output_tokens=output_tokens,
+          latency_seconds=time.monotonic() - started, estimated_output=estimate_tokens(body.decode(errors="replace")))
     
-    user_request_counts[key][service] += 1
-    return True
-
-async def stream_response(response: httpx.Response) -> AsyncGenerator[bytes, None]:
-    """Stream response from AI service to client"""
-    async for chunk in response.aiter_bytes():
-        yield chunk
+    # Each caller gets its own Response; middleware adds headers to it
+    response_headers = {"X-AI-Cache": cache_status} if cache_status else {}
+    return Response(content=body, media_type="application/json", headers=response_headers)
 
 @router.post("/anthropic")
 async def proxy_anthropic(
+    http_request: Request,
     request: AnthropicRequest,
     current_user: Employee = Depends(get_current_user)
 ):
@@ -96,9 +379,8 @@ async def proxy_anthropic(
     if not ANTHROPIC_API_KEY:
         raise HTTPException(status_code=503, detail="Anthropic service not configured")
     
-    # Rate limiting
-    if not check_rate_limit(current_user.id, "anthropic"):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded (100 requests/day)")
+    # Daily quota
+    reservation = await enforce_quota(current_user, "anthropic")
     
     # Log request (without sensitive data)
     logger.info(f"Anthropic request from user {current_user.id}, model: {request.model}")
@@ -113,31 +395,27 @@ async def proxy_anthropic(
     payload = request.dict(exclude_none=True)
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                ANTHROPIC_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=30.0
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Anthropic API error: {response.status_code} - {response.text}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Anthropic API error: {response.text}"
-                )
-            
-            return response.json()
-            
+        if request.stream:
+            return await open_stream("anthropic", "Anthropic", ANTHROPIC_API_URL, headers, payload, http_request, current_user.id, reservation)
+        
+        return await complete("anthropic", "Anthropic", ANTHROPIC_API_URL, headers, payload, http_request, current_user.id, reservation)
+        
     except httpx.TimeoutException:
+        record_transport_error("anthropic")
         raise HTTPException(status_code=504, detail="Request to Anthropic timed out")
+    except httpx.TransportError as e:
+        record_transport_error("anthropic")
+        logger.error(f"Anthropic connection error: {str(e)}")
+        raise HTTPException(status_code=502, detail="Could not reach Anthropic")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Anthropic proxy error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/openai")
 async def proxy_openai(
+    http_request: Request,
     request: OpenAIRequest,
     current_user: Employee = Depends(get_current_user)
 ):
@@ -146,9 +424,8 @@ async def proxy_openai(
     if not OPENAI_API_KEY:
         raise HTTPException(status_code=503, detail="OpenAI service not configured")
     
-    # Rate limiting
-    if not check_rate_limit(current_user.id, "openai"):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded (100 requests/day)")
+    # Daily quota
+    reservation = await enforce_quota(current_user, "openai")
     
     # Log request
     logger.info(f"OpenAI request from user {current_user.id}, model: {request.model}")
@@ -162,45 +439,27 @@ async def proxy_openai(
     payload = request.dict(exclude_none=True)
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            if request.stream:
-                # Handle streaming response
-                response = await client.post(
-                    OPENAI_API_URL,
-                    headers=headers,
-                    json=payload,
-                    timeout=30.0,
-                    follow_redirects=True
-                )
-                return StreamingResponse(
-                    stream_response(response),
-                    media_type="text/event-stream"
-                )
-            else:
-                response = await client.post(
-                    OPENAI_API_URL,
-                    headers=headers,
-                    json=payload,
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
-                    raise HTTPException(
-                        status_code=response.status_code,
-                        detail=f"OpenAI API error: {response.text}"
-                    )
-                
-                return response.json()
-                
+        if request.stream:
+            return await open_stream("openai", "OpenAI", OPENAI_API_URL, headers, payload, http_request, current_user.id, reservation)
+        
+        return await complete("openai", "OpenAI", OPENAI_API_URL, headers, payload, http_request, current_user.id, reservation)
+        
     except httpx.TimeoutException:
+        record_transport_error("openai")
         raise HTTPException(status_code=504, detail="Request to OpenAI timed out")
+    except httpx.TransportError as e:
+        record_transport_error("openai")
+        logger.error(f"OpenAI connection error: {str(e)}")
+        raise HTTPException(status_code=502, detail="Could not reach OpenAI")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"OpenAI proxy error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/grok")
 async def proxy_grok(
+    http_request: Request,
     request: GrokRequest,
     current_user: Employee = Depends(get_current_user)
 ):
@@ -209,9 +468,8 @@ async def proxy_grok(
     if not GROK_API_KEY:
         raise HTTPException(status_code=503, detail="Grok service not configured")
     
-    # Rate limiting
-    if not check_rate_limit(current_user.id, "grok"):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded (100 requests/day)")
+    # Daily quota
+    reservation = await enforce_quota(current_user, "grok")
     
     # Log request
     logger.info(f"Grok request from user {current_user.id}, model: {request.model}")
@@ -225,53 +483,69 @@ async def proxy_grok(
     payload = request.dict(exclude_none=True)
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                GROK_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=30.0
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Grok API error: {response.status_code} - {response.text}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"Grok API error: {response.text}"
-                )
-            
-            return response.json()
-            
+        if request.stream:
+            return await open_stream("grok", "Grok", GROK_API_URL, headers, payload, http_request, current_user.id, reservation)
+        
+        return await complete("grok", "Grok", GROK_API_URL, headers, payload, http_request, current_user.id, reservation)
+        
     except httpx.TimeoutException:
+        record_transport_error("grok")
         raise HTTPException(status_code=504, detail="Request to Grok timed out")
+    except httpx.TransportError as e:
+        record_transport_error("grok")
+        logger.error(f"Grok connection error: {str(e)}")
+        raise HTTPException(status_code=502, detail="Could not reach Grok")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Grok proxy error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/usage")
 async def get_ai_usage(
+    days: int = Query(1, ge=1, le=90, description="Include a per-day history of this many days"),
     current_user: Employee = Depends(get_current_user)
 ):
-    """Get AI service usage statistics for current user"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    key = f"{current_user.id}:{today}"
-    
-    usage = user_request_counts.get(key, {})
+    """Get AI service usage statistics for current user (from the daily rollup)"""
+    summary = await get_usage_summary(current_user.id, days)
+    today = datetime.utcnow().date()
+    usage = summary.get(today, {})
+    request_limit = role_quota(AI_DAILY_REQUEST_QUOTAS, current_user.role)
+    token_limit = role_quota(AI_DAILY_TOKEN_QUOTAS, current_user.role)
     
-    return {
-        "date": today,
+    result = {
+        "date": today.isoformat(),
         "user_id": current_user.id,
-        "usage": {
-            "anthropic": usage.get("anthropic", 0),
-            "openai": usage.get("openai", 0),
-            "grok": usage.get("grok", 0)
+        "usage": {provider: usage.get(provider, {}).get("requests", 0) for provider in PROVIDER_NAMES},
+        "limits": {provider: request_limit for provider in PROVIDER_NAMES},
+        "tokens": {
+            provider: {
+                "input": usage.get(provider, {}).get("input_tokens", 0),
+                "output": usage.get(provider, {}).get("output_tokens", 0)
+            }
+            for provider in PROVIDER_NAMES
         },
-        "limits": {
-            "anthropic": 100,
-            "openai": 100,
-            "grok": 100
+        "token_quota": {
+            "limit": token_limit,
+            "used": sum(totals["input_tokens"] + totals["output_tokens"] for totals in usage.values())
         }
     }
+    if days > 1:
+        result["history"] = [
+            {"date": day.isoformat(), "usage": summary[day]}
+            for day in sorted(summary)
+        ]
+    return result
+
+@router.get("/metrics")
+async def get_ai_client_metrics(
+    current_user: Employee = Depends(get_current_admin_user)
+):
+    """Connection pool usage and handshake counts of the AI provider clients, response cache and coalescing stats"""
+    metrics = get_client_metrics()
+    metrics["cache"] = response_cache.stats()
+    metrics["coalescing"] = {"completions": completion_flights.stats(), "streams": stream_flights.stats()}
+    return metrics
 
 @router.get("/models")
 async def get_available_models(
@@ -26,12 +26,23 @@ from app.services.auth import (
     create_access_token,
     verify_token
 )
+from app.services.login_throttle import login_throttle
 
 router = APIRouter()
 
 # OAuth2 scheme for token extraction
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
+def enforce_login_throttle(identifier: str):
+    """Reject the attempt before any DB lookup or bcrypt work if the account is throttled"""
+    retry_after = login_throttle.check(identifier)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts. Please try again later.",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+        )
+
 @router.post("/login", response_model=LoginResponse)
 def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
@@ -39,6 +50,8 @@ def login(
 ):
     """Login with OAuth2 form data (username/password)"""
     
+    enforce_login_throttle(form_data.username)
+    
     # Find user by email or employee number
     employee = db.query(Employee).filter(
         (Employee.email == form_data.username) | 
@@ -46,6 +59,7 @@ def login(
     ).first()
     
     if not employee:
+        login_throttle.record_failure(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -54,12 +68,15 @@ def login(
     
     # Verify password
     if not verify_password(form_data.password, employee.password_hash):
+        login_throttle.record_failure(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    login_throttle.record_success(form_data.username)
+    
     # Check if employee is active
     if not employee.is_active or employee.status == EmployeeStatus.TERMINATED:
         raise HTTPException(
@@ -108,6 +125,8 @@ def login_json(
             detail="Email and password are required"
         )
     
+    enforce_login_throttle(email)
+    
     # Find user by email or employee number
     employee = db.query(Employee).filter(
         (Employee.email == email) | 
@@ -115,6 +134,7 @@ def login_json(
     ).first()
     
     if not employee:
+        login_throttle.record_failure(email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -123,12 +143,15 @@ def login_json(
     
     # Verify password
     if not verify_password(password, employee.password_hash):
+        login_throttle.record_failure(email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    login_throttle.record_success(email)
+    
     # Check if employee is active
     if not employee.is_active or employee.status == EmployeeStatus.TERMINATED:
         raise HTTPException(
@@ -3,98 +3,166 @@ File Management API Endpoints
 Upload, Download, Delete for HR documents
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, NamedTuple, Optional, Tuple
+import asyncio
+import base64
+import json
 import uuid
 import os
 from pathlib import Path
-import shutil
 from datetime import datetime
-import magic
+import logging
 
 from app.core.database import get_db
-from app.models.file import FileMetadata, FileCategory
+from app.models.file import FileBlob, FileMetadata, FileCategory
 from app.schemas.file import (
+    BatchUploadResponse,
+    BatchUploadResult,
     FileUploadResponse,
     FileListResponse, 
     FileMetadataResponse,
+    FileSearchHit,
+    FileSearchResponse,
+    FileStats,
     FileFilters
 )
-from app.api.auth import get_current_user
+from app.api.auth import get_current_admin_user, get_current_user, oauth2_scheme
+from app.core.cache import TTLCache
+from app.core.static_files import unlink_with_siblings
+from app.core.responses import (
+    SendfileResponse,
+    content_disposition,
+    decoded_file_response,
+    etag_matches,
+    not_modified,
+    offload_response
+)
 from app.models.employee import Employee
+from app.services.auth import verify_token
+from app.services.file_export import stream_employee_archive
+from app.services.file_stats import get_file_stats, record_file_added, record_file_moved, record_file_removed
+from app.services.file_search import ranked_join_condition, ranked_matches, search_files, visibility_filter
+from app.services.text_extraction import cancel_extraction, enqueue_extraction
+from app.services.thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_SIZES, get_derivative, render_uncached, supports_preview
+from app.services.file_storage import (
+    CODEC_AESGCM,
+    CODEC_IDENTITY,
+    UPLOAD_DIR,
+    FileTooLargeError,
+    StoredUpload,
+    file_store,
+    stage_file,
+    stage_upload,
+    encode_for_storage,
+    encode_staged,
+    acquire_blob,
+    iter_stored,
+    release_blob
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 # Configuration
-UPLOAD_DIR = Path("./uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = {'.pdf', '.doc', '.docx', '.jpg', '.jpeg', '.png', '.gif'}
+DOWNLOAD_AUTH_CACHE_TTL = int(os.getenv("DOWNLOAD_AUTH_CACHE_TTL", "60"))  # seconds
+# none | x-accel (nginx) | x-sendfile: let the reverse proxy stream download bytes
+FILE_DOWNLOAD_OFFLOAD = os.getenv("FILE_DOWNLOAD_OFFLOAD", "none").lower()
+FILE_OFFLOAD_INTERNAL_PREFIX = os.getenv("FILE_OFFLOAD_INTERNAL_PREFIX", "/_protected_uploads/")
 
-@router.post("/upload", response_model=FileUploadResponse, status_code=status.HTTP_201_CREATED)
-async def upload_file(
-    file: UploadFile = File(...),
-    category: Optional[str] = None,
-    employee_id: Optional[str] = None,
-    description: Optional[str] = None,
-    current_user: Employee = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Upload a file with metadata"""
-    
-    # Validate file size
-    if file.size > MAX_FILE_SIZE:
+FILE_COUNT_CACHE_TTL = int(os.getenv("FILE_COUNT_CACHE_TTL", "300"))  # seconds
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "25"))
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "4"))  # Files staged/encoded in parallel
+
+# (user_id, file_id) -> DownloadTarget of a recently authorized download
+download_auth_cache = TTLCache(maxsize=10000, ttl=DOWNLOAD_AUTH_CACHE_TTL)
+# (employee_id, category) -> total for GET /files; per worker, TTL bounds staleness across workers
+file_count_cache = TTLCache(maxsize=1024, ttl=FILE_COUNT_CACHE_TTL)
+
+def _file_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
+    )
+
+def _parse_category(category: Optional[str]) -> FileCategory:
+    if not category:
+        return FileCategory.OTHER
+    try:
+        return FileCategory(category)
+    except ValueError:
         raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid category. Allowed: {', '.join(c.value for c in FileCategory)}"
         )
+
+def _validate_upload(file: UploadFile):
+    """Reject a file by its declared size and extension before any bytes are stored"""
+    
+    # Cheap early reject when the client declared a size; the real limit is enforced while streaming
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise _file_too_large()
     
     # Validate file extension
-    file_extension = Path(file.filename).suffix.lower()
+    file_extension = Path(file.filename or "").suffix.lower()
     if file_extension not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File type not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
         )
+
+def _add_file_metadata(
+    db: Session,
+    stored: StoredUpload,
+    filename: str,
+    category: FileCategory,
+    description: Optional[str],
+    employee_id: Optional[str],
+    is_confidential: bool,
+    current_user: Employee
+) -> FileMetadata:
+    """Reference the blob and add the metadata row, extraction job and stats (caller commits)"""
     
-    # Generate unique filename
     file_id = str(uuid.uuid4())
-    filename = f"{file_id}{file_extension}"
-    file_path = UPLOAD_DIR / filename
     
-    # Save file to disk
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to save file"
-        )
-    
-    # Detect MIME type
-    mime_type = magic.from_file(str(file_path), mime=True)
+    # Content-addressed storage: identical content shares one blob
+    blob, deduplicated = acquire_blob(db, stored)
+    if deduplicated:
+        logger.info(f"Upload {file_id} deduplicated onto blob {blob.sha256[:12]} ({blob.ref_count} refs)")
     
     # Create metadata record
     file_metadata = FileMetadata(
         id=file_id,
-        filename=file.filename,
-        stored_filename=filename,
-        file_path=str(file_path),
-        file_size=file.size,
-        mime_type=mime_type,
-        category=FileCategory(category) if category else FileCategory.OTHER,
+        filename=filename,
+        stored_filename=blob.sha256,
+        file_path=blob.file_path,
+        file_size=stored.size,
+        mime_type=stored.mime_type,
+        file_hash=stored.sha256,
+        storage_codec=blob.codec,
+        encrypted_key=stored.wrapped_key,
+        category=category,
         description=description,
         employee_id=employee_id,
+        is_confidential=is_confidential,
         uploaded_by=current_user.id,
         uploaded_at=datetime.utcnow()
     )
     
     db.add(file_metadata)
-    db.commit()
-    db.refresh(file_metadata)
-    
+    enqueue_extraction(db, file_metadata)
+    record_file_added(db, file_metadata.category, file_metadata.employee_id, stored.size)
+    return file_metadata
+
+def _upload_response(file_metadata: FileMetadata) -> FileUploadResponse:
     return FileUploadResponse(
         id=file_metadata.id,
         filename=file_metadata.filename,
@@ -105,16 +173,188 @@ async def upload_file(
         uploaded_at=file_metadata.uploaded_at
     )
 
+@router.post("/upload", response_model=FileUploadResponse, status_code=status.HTTP_201_CREATED)
+async def upload_file(
+    file: UploadFile = File(...),
+    category: Optional[str] = None,
+    employee_id: Optional[str] = None,
+    description: Optional[str] = None,
+    is_confidential: bool = False,
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload a file with metadata (confidential files are encrypted at rest)"""
+    
+    _validate_upload(file)
+    file_category = _parse_category(category)
+    
+    # Stream to staging: size limit, SHA-256 and MIME sniffing in a single pass
+    try:
+        stored = await stage_upload(file, MAX_FILE_SIZE)
+    except FileTooLargeError:
+        raise _file_too_large()
+    except OSError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to save file"
+        )
+    
+    # Compressed or encrypted at rest, depending on content and confidentiality
+    stored = await run_in_threadpool(encode_for_storage, db, stored, is_confidential)
+    
+    file_metadata = _add_file_metadata(
+        db, stored, file.filename, file_category, description, employee_id, is_confidential, current_user
+    )
+    db.commit()
+    db.refresh(file_metadata)
+    invalidate_file_counts()
+    
+    return _upload_response(file_metadata)
+
+@router.post("/upload/batch", response_model=BatchUploadResponse, status_code=status.HTTP_201_CREATED)
+async def upload_files_batch(
+    response: Response,
+    files: List[UploadFile] = File(...),
+    category: Optional[str] = None,
+    employee_id: Optional[str] = None,
+    description: Optional[str] = None,
+    is_confidential: bool = False,
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload several files sharing the same metadata (e.g. an onboarding packet).
+    Files are staged and encoded concurrently, then all accepted files are
+    committed in one transaction. Every file gets its own result; rejected
+    files do not fail the others (207 Multi-Status when any failed).
+    """
+    
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many files. Maximum per batch: {UPLOAD_BATCH_MAX_FILES}"
+        )
+    file_category = _parse_category(category)
+    
+    results: List[Optional[BatchUploadResult]] = [None] * len(files)
+    
+    def fail(index: int, error: Exception):
+        if not isinstance(error, HTTPException):
+            logger.error(f"Batch upload of {files[index].filename} failed: {error}")
+            error = HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save file")
+        results[index] = BatchUploadResult(
+            filename=files[index].filename or "", status_code=error.status_code, error=error.detail
+        )
+    
+    # Stage in parallel threads: copy, SHA-256 and MIME sniffing per file
+    semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+    
+    async def stage(file: UploadFile) -> StoredUpload:
+        async with semaphore:
+            _validate_upload(file)
+            try:
+                return await run_in_threadpool(stage_file, file.file, MAX_FILE_SIZE)
+            except FileTooLargeError:
+                raise _file_too_large()
+    
+    staged = await asyncio.gather(*(stage(file) for file in files), return_exceptions=True)
+    accepted = {}
+    for index, outcome in enumerate(staged):
+        if isinstance(outcome, Exception):
+            fail(index, outcome)
+        else:
+            accepted[index] = outcome
+    
+    # Compression is skipped for content that is stored already; one lookup for the whole batch
+    hashes = {stored.sha256 for stored in accepted.values()}
+    already_stored = {sha for (sha,) in db.query(FileBlob.sha256).filter(FileBlob.sha256.in_(hashes))} if hashes else set()
+    
+    async def encode(stored: StoredUpload) -> StoredUpload:
+        async with semaphore:
+            return await run_in_threadpool(encode_staged, stored, is_confidential, stored.sha256 in already_stored)
+    
+    encoded = await asyncio.gather(*(encode(stored) for stored in accepted.values()), return_exceptions=True)
+    created = {}
+    for (index, stored), outcome in zip(list(accepted.items()), encoded):
+        if isinstance(outcome, Exception):
+            stored.path.unlink(missing_ok=True)
+            fail(index, outcome)
+            continue
+        
+        # A savepoint per file keeps one failing insert from aborting the batch transaction
+        staged_path = outcome.path
+        try:
+            with db.begin_nested():
+                created[index] = _add_file_metadata(
+                    db, outcome, files[index].filename, file_category, description, employee_id,
+                    is_confidential, current_user
+                )
+        except Exception as e:
+            # acquire_blob repoints outcome.path at the (possibly shared) blob; only the staged copy is ours
+            staged_path.unlink(missing_ok=True)
+            if outcome.path != staged_path and not db.query(FileBlob.sha256).filter(
+                FileBlob.sha256 == outcome.sha256
+            ).first():
+                # The staged file became a new blob whose row the savepoint just rolled back
+                outcome.path.unlink(missing_ok=True)
+            fail(index, e)
+    
+    if created:
+        db.commit()
+        invalidate_file_counts()
+    for index, file_metadata in created.items():
+        db.refresh(file_metadata)
+        results[index] = BatchUploadResult(
+            filename=file_metadata.filename,
+            status_code=status.HTTP_201_CREATED,
+            file=_upload_response(file_metadata)
+        )
+    
+    failed = len(files) - len(created)
+    if failed:
+        response.status_code = status.HTTP_207_MULTI_STATUS
+    return BatchUploadResponse(uploaded=len(created), failed=failed, results=results)
+
+def _encode_cursor(file_metadata: FileMetadata) -> str:
+    payload = json.dumps([file_metadata.uploaded_at.isoformat(), file_metadata.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        uploaded_at, file_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(uploaded_at), str(file_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def invalidate_file_counts():
+    """Forget cached list totals (uploads, deletes and re-filing change them)"""
+    file_count_cache.clear()
+
+def invalidate_deleted_files(file_ids: List[str]):
+    """Drop cache entries of files removed outside a request (retention sweeper)"""
+    for file_id in file_ids:
+        invalidate_download_cache(file_id)
+    invalidate_file_counts()
+
 @router.get("/", response_model=FileListResponse)
 def get_files(
     employee_id: Optional[str] = None,
     category: Optional[FileCategory] = None,
-    page: int = 1,
-    size: int = 50,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    page: int = Query(1, ge=1),
+    size: int = Query(50, ge=1, le=100),
     current_user: Employee = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get files with filters"""
+    """
+    Get files with filters, newest first. Pass next_cursor back as cursor to
+    page through large archives; page is only used for search results.
+    """
     
     query = db.query(FileMetadata)
     
@@ -125,20 +365,120 @@ def get_files(
     if category:
         query = query.filter(FileMetadata.category == category)
     
-    # Count total
-    total = query.count()
+    # Full-text search, most relevant first; confidential hits only for permitted users
+    ranked = ranked_matches(db, search) if search else None
+    if ranked is not None:
+        query = query.join(ranked, ranked_join_condition(ranked))
+        query = query.filter(visibility_filter(current_user))
+        query = query.order_by(ranked.c.score.desc(), FileMetadata.id)
+        
+        total = query.count() if include_total else None
+        files = query.offset((page - 1) * size).limit(size).all()
+        
+        return FileListResponse(
+            files=[FileMetadataResponse.from_orm(f) for f in files],
+            total=total,
+            page=page,
+            size=size
+        )
+    
+    # Totals are cached per filter combination; counting is a full index scan
+    total = None
+    if include_total:
+        count_key = (employee_id, category)
+        total = file_count_cache.get(count_key)
+        if total is None:
+            total = query.count()
+            file_count_cache.set(count_key, total)
+    
+    # Keyset pagination on (uploaded_at, id): every page costs the same, unlike OFFSET
+    query = query.order_by(FileMetadata.uploaded_at.desc(), FileMetadata.id.desc())
+    if cursor:
+        query = query.filter(tuple_(FileMetadata.uploaded_at, FileMetadata.id) < _decode_cursor(cursor))
+    elif page > 1:
+        query = query.offset((page - 1) * size)  # Clients that still send page numbers
     
-    # Apply pagination
-    offset = (page - 1) * size
-    files = query.offset(offset).limit(size).all()
+    files = query.limit(size + 1).all()
+    next_cursor = _encode_cursor(files[size - 1]) if len(files) > size else None
     
     return FileListResponse(
-        files=[FileMetadataResponse.from_orm(f) for f in files],
+        files=[FileMetadataResponse.from_orm(f) for f in files[:size]],
         total=total,
         page=page,
+        size=size,
+        next_cursor=next_cursor
+    )
+
+@router.get("/search", response_model=FileSearchResponse)
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    employee_id: Optional[str] = None,
+    category: Optional[FileCategory] = None,
+    page: int = Query(1, ge=1),
+    size: int = Query(20, ge=1, le=100),
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Full-text search over filename, description, tags and document text"""
+    
+    filters = []
+    if employee_id:
+        filters.append(FileMetadata.employee_id == employee_id)
+    if category:
+        filters.append(FileMetadata.category == category)
+    
+    hits = search_files(db, q, current_user, filters=filters, limit=size, offset=(page - 1) * size)
+    
+    return FileSearchResponse(
+        query=q,
+        hits=[
+            FileSearchHit(file=FileMetadataResponse.from_orm(f), score=score, snippet=snippet)
+            for f, score, snippet in hits
+        ],
+        page=page,
         size=size
     )
 
+@router.get("/export")
+def export_employee_files(
+    employee_id: str,
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Download all documents of an employee as one streamed ZIP archive"""
+    
+    if not (current_user.is_admin or current_user.id == employee_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    
+    employee = db.query(Employee).filter(Employee.id == employee_id).first()
+    if not employee:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Employee not found"
+        )
+    
+    filename = f"personalakte_{employee.employee_number or employee.id}_{datetime.utcnow():%Y-%m-%d}.zip"
+    return StreamingResponse(
+        stream_employee_archive(employee_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(filename), "Cache-Control": "private, no-store"}
+    )
+
+@router.get("/stats", response_model=FileStats)
+def file_statistics(
+    recent: int = Query(10, ge=0, le=50),
+    current_user: Employee = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Storage statistics for the admin dashboard (read from the summary table)"""
+    
+    stats = get_file_stats(db, recent=recent)
+    stats["recent_uploads"] = [FileMetadataResponse.from_orm(f) for f in stats["recent_uploads"]]
+    return FileStats(**stats)
+
 @router.get("/{file_id}", response_model=FileMetadataResponse)
 def get_file_metadata(
     file_id: str,
@@ -156,13 +496,148 @@ def get_file_metadata(
     
     return FileMetadataResponse.from_orm(file_metadata)
 
+class DownloadTarget(NamedTuple):
+    """What an authorized download needs, cached so revalidations can skip the DB"""
+    path: str
+    file_hash: Optional[str]
+    codec: Optional[str]
+    wrapped_key: Optional[str]
+    size: int
+    filename: str
+    mime_type: str
+    etag: Optional[str]
+    cache_control: str
+
+def _download_target(file_metadata: FileMetadata) -> DownloadTarget:
+    if file_metadata.file_hash:
+        # Content never changes for a given file id, so the hash is a strong validator
+        return DownloadTarget(
+            path=file_metadata.file_path,
+            file_hash=file_metadata.file_hash,
+            codec=file_metadata.storage_codec,
+            wrapped_key=file_metadata.encrypted_key,
+            size=file_metadata.file_size,
+            filename=file_metadata.filename,
+            mime_type=file_metadata.mime_type,
+            etag=f'"{file_metadata.file_hash}"',
+            cache_control="private, max-age=31536000, immutable"
+        )
+    return DownloadTarget(
+        path=file_metadata.file_path,
+        file_hash=None,
+        codec=file_metadata.storage_codec,
+        wrapped_key=file_metadata.encrypted_key,
+        size=file_metadata.file_size,
+        filename=file_metadata.filename,
+        mime_type=file_metadata.mime_type,
+        etag=None,
+        cache_control="private, no-cache"
+    )
+
+def invalidate_download_cache(file_id: str):
+    """Forget cached authorizations for a file after it changed or was deleted"""
+    download_auth_cache.invalidate(lambda key: key[1] == file_id)
+
 @router.get("/{file_id}/download")
 def download_file(
     file_id: str,
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    """Download file (supports Range, If-Range and If-None-Match)"""
+    
+    payload = verify_token(token)
+    if not payload or not payload.get("sub"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    # A recent full check for this user and file lets range requests and revalidations skip both DB lookups
+    cache_key = (payload["sub"], file_id)
+    target = download_auth_cache.get(cache_key)
+    if target is not None and not file_store.resolve(target.path, target.file_hash).exists():
+        # Moved since it was cached (storage migration); look it up again
+        download_auth_cache.pop(cache_key)
+        target = None
+    if target is None:
+        current_user = get_current_user(token, db)
+        
+        file_metadata = db.query(FileMetadata).filter(FileMetadata.id == file_id).first()
+        if not file_metadata:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="File not found"
+            )
+        
+        target = _download_target(file_metadata)
+        download_auth_cache.set((current_user.id, file_id), target)
+    
+    if target.etag and etag_matches(request.headers.get("If-None-Match"), target.etag):
+        return not_modified(target.etag, target.cache_control)
+    
+    file_path = file_store.resolve(target.path, target.file_hash)
+    if not file_path.exists():
+        download_auth_cache.pop(cache_key)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found on disk"
+        )
+    
+    headers = {"Cache-Control": target.cache_control}
+    if target.etag:
+        headers["ETag"] = target.etag
+    
+    # Compressed or encrypted at rest: neither the proxy nor sendfile can serve the bytes as stored
+    if target.codec and target.codec != CODEC_IDENTITY:
+        return decoded_file_response(
+            request=request,
+            read=lambda start, length: iter_stored(file_path, target.codec, start, length, target.wrapped_key),
+            size=target.size,
+            filename=target.filename,
+            media_type=target.mime_type,
+            headers=headers
+        )
+    
+    # Auth and metadata are done; the proxy streams the bytes without holding this worker
+    if FILE_DOWNLOAD_OFFLOAD in ("x-accel", "x-sendfile"):
+        return offload_response(
+            path=file_path,
+            root=UPLOAD_DIR,
+            mode=FILE_DOWNLOAD_OFFLOAD,
+            internal_prefix=FILE_OFFLOAD_INTERNAL_PREFIX,
+            filename=target.filename,
+            media_type=target.mime_type,
+            headers=headers
+        )
+    
+    return SendfileResponse(
+        path=file_path,
+        filename=target.filename,
+        media_type=target.mime_type,
+        headers=headers
+    )
+
+@router.get("/{file_id}/thumbnail")
+async def get_thumbnail(
+    file_id: str,
+    request: Request,
+    size: int = 256,
+    format: str = "webp",
     current_user: Employee = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Download file"""
+    """Thumbnail / preview image for an image or PDF (generated on first request)"""
+    
+    if format not in THUMBNAIL_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported format. Allowed: {', '.join(THUMBNAIL_FORMATS)}"
+        )
+    # Snap to a fixed size so the derivative cache stays bounded
+    size = next((s for s in THUMBNAIL_SIZES if s >= size), THUMBNAIL_SIZES[-1])
     
     file_metadata = db.query(FileMetadata).filter(FileMetadata.id == file_id).first()
     if not file_metadata:
@@ -171,18 +646,45 @@ def download_file(
             detail="File not found"
         )
     
-    file_path = Path(file_metadata.file_path)
-    if not file_path.exists():
+    if not supports_preview(file_metadata.mime_type):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found on disk"
+            detail="No preview available for this file type"
+        )
+    
+    content_key = file_metadata.file_hash or file_metadata.id
+    etag = f'"{content_key}-{size}.{format}"'
+    cache_control = "private, max-age=31536000, immutable"
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return not_modified(etag, cache_control)
+    
+    source = file_store.resolve(file_metadata.file_path, file_metadata.file_hash)
+    try:
+        if file_metadata.storage_codec == CODEC_AESGCM:
+            # Encrypted document: the preview is rendered per request and never cached in plaintext
+            content = await render_uncached(
+                source, file_metadata.mime_type, size, format, file_metadata.storage_codec, file_metadata.encrypted_key
+            )
+            return Response(
+                content=content,
+                media_type=f"image/{format}",
+                headers={"ETag": etag, "Cache-Control": cache_control}
+            )
+        path = await get_derivative(
+            source, content_key, file_metadata.mime_type, size, format,
+            codec=file_metadata.storage_codec
+        )
+    except Exception as e:
+        logger.error(f"Thumbnail generation failed for {file_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Preview could not be generated"
         )
     
-    from fastapi.responses import FileResponse
     return FileResponse(
-        path=file_path,
-        filename=file_metadata.filename,
-        media_type=file_metadata.mime_type
+        path=path,
+        media_type=f"image/{format}",
+        headers={"ETag": etag, "Cache-Control": cache_control}
     )
 
 @router.delete("/{file_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -200,14 +702,22 @@ def delete_file(
             detail="File not found"
         )
     
-    # Delete physical file
-    file_path = Path(file_metadata.file_path)
-    if file_path.exists():
-        file_path.unlink()
+    # Drop the blob reference in the same transaction; the blob GC reclaims the bytes
+    legacy_path = None
+    if not (file_metadata.file_hash and release_blob(db, file_metadata.file_hash)):
+        legacy_path = Path(file_metadata.file_path)
     
     # Delete metadata
+    cancel_extraction(db, file_id)
+    record_file_removed(db, file_metadata.category, file_metadata.employee_id, file_metadata.file_size)
     db.delete(file_metadata)
     db.commit()
+    invalidate_download_cache(file_id)
+    invalidate_file_counts()
+    
+    # Pre-dedup uploads own their file exclusively; remove it only after the commit succeeded
+    if legacy_path is not None:
+        unlink_with_siblings(legacy_path)
 
 @router.patch("/{file_id}", response_model=FileMetadataResponse)
 def update_file_metadata(
@@ -227,6 +737,8 @@ def update_file_metadata(
             detail="File not found"
         )
     
+    old_category, old_employee_id = file_metadata.category, file_metadata.employee_id
+    
     # Update fields
     if category is not None:
         file_metadata.category = category
@@ -235,9 +747,12 @@ def update_file_metadata(
     if employee_id is not None:
         file_metadata.employee_id = employee_id
     
+    record_file_moved(db, old_category, old_employee_id, file_metadata.category, file_metadata.employee_id, file_metadata.file_size)
     file_metadata.updated_at = datetime.utcnow()
     
     db.commit()
     db.refresh(file_metadata)
+    invalidate_download_cache(file_id)
+    invalidate_file_counts()
     
     return FileMetadataResponse.from_orm(file_metadata)
\ No newline at end of file
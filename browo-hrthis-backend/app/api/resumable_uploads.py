@@ -0,0 +1,333 @@
+"""
+Resumable Upload API Endpoints
+tus-style protocol for large files over unreliable connections:
+create a session, PATCH chunks at Upload-Offset, HEAD to resume
+"""
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import ObjectDeletedError
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+import aiofiles
+import fcntl
+import logging
+import os
+import uuid
+
+from app.core.database import get_db
+from app.models.file import FileMetadata, UploadSession
+from app.schemas.file import FileUploadResponse, UploadSessionResponse
+from app.api.auth import get_current_user
+from app.api.files import ALLOWED_EXTENSIONS, _parse_category, invalidate_file_counts
+from app.models.employee import Employee
+from app.services.file_storage import UPLOAD_DIR, acquire_blob, describe_file, encode_for_storage
+from app.services.file_stats import record_file_added
+from app.services.text_extraction import enqueue_extraction
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Configuration
+PARTIAL_DIR = UPLOAD_DIR / "partial"
+RESUMABLE_MAX_FILE_SIZE = int(os.getenv("RESUMABLE_MAX_FILE_SIZE", str(200 * 1024 * 1024)))  # 200MB
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+TUS_CONTENT_TYPE = "application/offset+octet-stream"
+
+def _session_url(upload_id: str) -> str:
+    return f"/hrthis/api/files/uploads/{upload_id}"
+
+def _get_session(db: Session, upload_id: str, current_user: Employee) -> UploadSession:
+    """Load a live session owned by the current user"""
+    session = db.query(UploadSession).filter(
+        UploadSession.id == upload_id,
+        UploadSession.created_by == current_user.id
+    ).first()
+    if not session or session.expires_at < datetime.utcnow():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found or expired"
+        )
+    return session
+
+def _created_response(file_metadata: FileMetadata) -> Response:
+    """201 with the file created from a finished session"""
+    body = FileUploadResponse(
+        id=file_metadata.id,
+        filename=file_metadata.filename,
+        file_size=file_metadata.file_size,
+        mime_type=file_metadata.mime_type,
+        category=file_metadata.category.value,
+        upload_url=f"/api/files/{file_metadata.id}",
+        uploaded_at=file_metadata.uploaded_at
+    )
+    return Response(
+        content=body.model_dump_json(),
+        status_code=status.HTTP_201_CREATED,
+        media_type="application/json",
+        headers={"Upload-Offset": str(file_metadata.file_size)}
+    )
+
+def _finished_response(db: Session, session: UploadSession) -> Response:
+    """Replay the 201 of a finished session, e.g. for a client that lost the original response"""
+    file_metadata = db.query(FileMetadata).filter(FileMetadata.id == session.file_id).first()
+    if not file_metadata:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Upload completed but the file has since been deleted"
+        )
+    return _created_response(file_metadata)
+
+def purge_expired_sessions(db: Session, limit: int = 100) -> int:
+    """Delete expired sessions and their partial files"""
+    expired = db.query(UploadSession).filter(
+        UploadSession.expires_at < datetime.utcnow()
+    ).limit(limit).all()
+
+    for session in expired:
+        Path(session.part_path).unlink(missing_ok=True)
+        db.delete(session)
+    if expired:
+        db.commit()
+        logger.info(f"Purged {len(expired)} expired upload sessions")
+    return len(expired)
+
+@router.post("", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+def create_upload_session(
+    response: Response,
+    filename: str,
+    upload_length: int = Header(..., alias="Upload-Length"),
+    category: Optional[str] = None,
+    employee_id: Optional[str] = None,
+    description: Optional[str] = None,
+    is_confidential: bool = False,
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create a resumable upload session for a file of Upload-Length bytes"""
+
+    if upload_length < 0 or upload_length > RESUMABLE_MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size: {RESUMABLE_MAX_FILE_SIZE // (1024*1024)}MB"
+        )
+
+    file_extension = Path(filename).suffix.lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File type not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+    file_category = _parse_category(category)
+
+    # Opportunistic cleanup keeps abandoned partial files bounded without a separate scheduler
+    purge_expired_sessions(db)
+
+    upload_id = uuid.uuid4().hex
+    PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+    part_path = PARTIAL_DIR / upload_id
+    part_path.touch()
+
+    session = UploadSession(
+        id=upload_id,
+        part_path=str(part_path),
+        upload_length=upload_length,
+        upload_offset=0,
+        filename=filename,
+        category=file_category,
+        description=description,
+        employee_id=employee_id,
+        is_confidential=is_confidential,
+        created_by=current_user.id,
+        expires_at=datetime.utcnow() + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    )
+    db.add(session)
+    db.commit()
+
+    response.headers["Location"] = _session_url(upload_id)
+    response.headers["Upload-Offset"] = "0"
+
+    return UploadSessionResponse(
+        id=upload_id,
+        upload_url=_session_url(upload_id),
+        upload_offset=0,
+        upload_length=upload_length,
+        expires_at=session.expires_at
+    )
+
+@router.head("/{upload_id}")
+def get_upload_offset(
+    upload_id: str,
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Report how many bytes the server has, so the client can resume from there"""
+
+    session = _get_session(db, upload_id, current_user)
+    headers = {
+        "Upload-Offset": str(session.upload_offset),
+        "Upload-Length": str(session.upload_length),
+        "Cache-Control": "no-store"
+    }
+    if session.file_id:
+        headers["Location"] = f"/api/files/{session.file_id}"
+    return Response(status_code=status.HTTP_200_OK, headers=headers)
+
+@router.patch("/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Append the request body at Upload-Offset; finalizes the file once all bytes arrived"""
+
+    if request.headers.get("Content-Type") != TUS_CONTENT_TYPE:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type must be {TUS_CONTENT_TYPE}"
+        )
+
+    session = _get_session(db, upload_id, current_user)
+    if session.file_id:
+        return _finished_response(db, session)
+    if upload_offset != session.upload_offset:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Offset mismatch, server has {session.upload_offset} bytes",
+            headers={"Upload-Offset": str(session.upload_offset)}
+        )
+
+    # Exclusive lock on the partial file guards against two PATCHes for the same session (any worker)
+    try:
+        lock_fd = os.open(session.part_path, os.O_RDWR)
+    except FileNotFoundError:
+        # Finalized (or cancelled) by a concurrent request in the meantime
+        db.expire(session)
+        session = _get_session(db, upload_id, current_user)
+        if session.file_id:
+            return _finished_response(db, session)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found or expired"
+        )
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise HTTPException(
+                status_code=status.HTTP_423_LOCKED,
+                detail="Another chunk for this upload is in progress"
+            )
+
+        # A PATCH that held the lock before us may have moved the offset since the check above
+        try:
+            db.refresh(session)
+        except ObjectDeletedError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload session not found or expired"
+            )
+        if session.file_id:
+            return _finished_response(db, session)
+        if upload_offset != session.upload_offset:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Offset mismatch, server has {session.upload_offset} bytes",
+                headers={"Upload-Offset": str(session.upload_offset)}
+            )
+
+        # Stream the body straight to disk; bytes that arrived before a disconnect are kept
+        offset = session.upload_offset
+        too_large = False
+        async with aiofiles.open(session.part_path, "r+b") as out:
+            await out.seek(offset)
+            try:
+                async for chunk in request.stream():
+                    if offset + len(chunk) > session.upload_length:
+                        too_large = True
+                        break
+                    await out.write(chunk)
+                    offset += len(chunk)
+            except ClientDisconnect:
+                logger.info(f"Client disconnected from upload {upload_id} at offset {offset}")
+            await out.truncate(offset)
+            await out.flush()
+            await run_in_threadpool(os.fsync, out.fileno())
+
+        session.upload_offset = offset
+        session.expires_at = datetime.utcnow() + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+        db.commit()
+
+        if too_large:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Chunk exceeds declared Upload-Length",
+                headers={"Upload-Offset": str(offset)}
+            )
+
+        if offset < session.upload_length:
+            return Response(
+                status_code=status.HTTP_204_NO_CONTENT,
+                headers={"Upload-Offset": str(offset)}
+            )
+
+        # Still under the lock, so a concurrent PATCH cannot finalize the same bytes twice
+        return await _finalize_upload(db, session, current_user)
+    finally:
+        os.close(lock_fd)
+
+async def _finalize_upload(db: Session, session: UploadSession, current_user: Employee):
+    """Turn a complete session into a blob reference and FileMetadata row"""
+
+    stored = await run_in_threadpool(describe_file, Path(session.part_path))
+    stored = await run_in_threadpool(encode_for_storage, db, stored, bool(session.is_confidential))
+    blob, deduplicated = acquire_blob(db, stored)
+
+    file_metadata = FileMetadata(
+        id=str(uuid.uuid4()),
+        filename=session.filename,
+        stored_filename=blob.sha256,
+        file_path=blob.file_path,
+        file_size=stored.size,
+        mime_type=stored.mime_type,
+        file_hash=stored.sha256,
+        storage_codec=blob.codec,
+        encrypted_key=stored.wrapped_key,
+        category=session.category,
+        description=session.description,
+        employee_id=session.employee_id,
+        is_confidential=bool(session.is_confidential),
+        uploaded_by=current_user.id,
+        uploaded_at=datetime.utcnow()
+    )
+    db.add(file_metadata)
+    enqueue_extraction(db, file_metadata)
+    record_file_added(db, file_metadata.category, file_metadata.employee_id, stored.size)
+    session.file_id = file_metadata.id
+    session.expires_at = datetime.utcnow() + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    db.commit()
+    db.refresh(file_metadata)
+    invalidate_file_counts()
+
+    logger.info(f"Resumable upload {session.id} finalized as file {file_metadata.id}"
+                f"{' (deduplicated)' if deduplicated else ''}")
+    return _created_response(file_metadata)
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def cancel_upload(
+    upload_id: str,
+    current_user: Employee = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Abort an upload session and discard received bytes"""
+
+    session = _get_session(db, upload_id, current_user)
+    Path(session.part_path).unlink(missing_ok=True)
+    db.delete(session)
+    db.commit()
@@ -3,9 +3,10 @@ Database Configuration
 SQLAlchemy setup for PostgreSQL
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import bindparam, create_engine, inspect, select, text, update
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
 import os
 from dotenv import load_dotenv
 
@@ -36,5 +37,36 @@ def get_db():
 def create_tables():
     """Create all database tables"""
     from app.models.employee import Employee
-    from app.models.file import FileMetadata
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    from app.models.file import FileMetadata, FileBlob, UploadSession, ExtractionJob, FileStatsBucket
+    from app.models.ai_usage import AIUsageEvent, AIUsageDaily
+    Base.metadata.create_all(bind=engine)
+
+    # create_all does not alter existing tables; add new nullable columns in place
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+    # Keyset pagination orders on uploaded_at; rows from before it had a default carry NULL.
+    # Values go through Python so they are stored in the same format as new uploads.
+    with engine.begin() as conn:
+        missing = conn.execute(
+            select(FileMetadata.id, FileMetadata.updated_at).where(FileMetadata.uploaded_at.is_(None))
+        ).all()
+        if missing:
+            conn.execute(
+                update(FileMetadata).where(FileMetadata.id == bindparam("file_id")),
+                [{"file_id": file_id, "uploaded_at": updated_at or datetime.utcnow()} for file_id, updated_at in missing]
+            )
+
+    # create_all skips indexes of tables that already exist; add new ones in place
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    from app.services.file_search import ensure_search_index
+    ensure_search_index(engine)
\ No newline at end of file
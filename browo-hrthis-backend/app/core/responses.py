@@ -0,0 +1,187 @@
+"""
+File Responses
+Response helpers for serving stored documents with HTTP caching semantics
+"""
+
+from fastapi.responses import FileResponse
+from pathlib import Path
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Send
+from typing import Callable, Iterator, Optional, Tuple
+from urllib.parse import quote
+import anyio
+import os
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """304 response carrying the validators the client cached"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+class HashedFileResponse(FileResponse):
+    """
+    FileResponse whose ETag is the content hash. Starlette's If-Range check
+    only knows its own mtime-based ETag, so it is extended to accept ours;
+    otherwise resumed range requests would always fall back to a full 200.
+    """
+
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:
+        if http_if_range == self.headers.get("etag"):
+            return True
+        return super()._should_use_range(http_if_range, stat_result)
+
+
+class SendfileResponse(HashedFileResponse):
+    """
+    Hands the open file to the server via the ASGI zero-copy send extension
+    when the server advertises it, so the server can sendfile() the bytes.
+    ASGI gives the application no socket to call os.sendfile on itself, and
+    uvicorn does not implement the extension, so under uvicorn this is the
+    chunked FileResponse with a larger buffer; zero-copy downloads in
+    production come from FILE_DOWNLOAD_OFFLOAD (the proxy's sendfile).
+    """
+
+    chunk_size = 256 * 1024
+
+    async def __call__(self, scope, receive, send):
+        self._zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _zerocopy_send(self, send: Send, status_code: int, offset: int, count: int, send_header_only: bool):
+        await send({"type": "http.response.start", "status": status_code, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            await send({
+                "type": ZEROCOPY_EXTENSION,
+                "file": file,
+                "offset": offset,
+                "count": count,
+                "more_body": False
+            })
+        finally:
+            file.close()
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if not self._zerocopy:
+            return await super()._handle_simple(send, send_header_only)
+        size = int(self.headers["content-length"])
+        await self._zerocopy_send(send, self.status_code, 0, size, send_header_only)
+
+    async def _handle_single_range(self, send: Send, start: int, end: int, file_size: int, send_header_only: bool) -> None:
+        if not self._zerocopy:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await self._zerocopy_send(send, 206, start, end - start, send_header_only)
+
+
+class RangeNotSatisfiable(ValueError):
+    """Range header does not overlap the content"""
+
+
+def parse_single_range(http_range: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end exclusive) of a single "bytes=" range; None when the header
+    should be ignored (malformed or multiple ranges), which serves the full body.
+    """
+    unit, _, spec = http_range.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            start, end = max(size - suffix, 0), size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+    except ValueError:
+        return None
+    if start >= end:
+        raise RangeNotSatisfiable(http_range)
+    return start, end
+
+
+def decoded_file_response(
+    request: Request,
+    read: Callable[[int, Optional[int]], Iterator[bytes]],
+    size: int,
+    filename: str,
+    media_type: str,
+    headers: dict
+) -> Response:
+    """
+    Streamed response for a file that is decoded on the fly (stored compressed),
+    where sendfile and proxy offload would ship the encoded bytes. read(start,
+    length) yields the original content; Content-Length and single byte ranges
+    (with If-Range against the ETag) refer to that decoded content.
+    """
+    headers = dict(headers)
+    headers["Content-Disposition"] = content_disposition(filename)
+    headers["Accept-Ranges"] = "bytes"
+    status_code, start, end = 200, 0, size
+
+    http_range = request.headers.get("range")
+    http_if_range = request.headers.get("if-range")
+    if http_range and (not http_if_range or http_if_range == headers.get("ETag")):
+        try:
+            byte_range = parse_single_range(http_range, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            status_code, (start, end) = 206, byte_range
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(read(start, end - start), status_code=status_code, media_type=media_type, headers=headers)
+
+
+def content_disposition(filename: str, disposition_type: str = "attachment") -> str:
+    """Content-Disposition header value, RFC 5987 encoded for non-ASCII names"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition_type}; filename*=utf-8''{quoted}"
+    return f'{disposition_type}; filename="{filename}"'
+
+
+def offload_response(
+    path: Path,
+    root: Path,
+    mode: str,
+    internal_prefix: str,
+    filename: str,
+    media_type: str,
+    headers: dict
+) -> Response:
+    """
+    Empty response telling the reverse proxy to stream the file itself:
+    x-accel  -> nginx X-Accel-Redirect to an internal location mapped onto root
+    x-sendfile -> X-Sendfile with the absolute path (Apache, lighttpd, Caddy plugins)
+    The proxy then handles Range requests and keeps the bytes out of the worker.
+    """
+    headers = dict(headers)
+    headers["Content-Disposition"] = content_disposition(filename)
+
+    if mode == "x-accel":
+        relative = Path(path).resolve().relative_to(root.resolve())
+        headers["X-Accel-Redirect"] = internal_prefix.rstrip("/") + "/" + quote(relative.as_posix())
+    else:
+        headers["X-Sendfile"] = str(Path(path).resolve())
+
+    return Response(status_code=200, media_type=media_type, headers=headers)
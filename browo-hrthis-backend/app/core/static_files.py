@@ -0,0 +1,249 @@
+"""
+Static Uploads
+Handler for the /uploads mount. Write-once names (content hashes, derivative
+keys, upload UUIDs) are marked immutable so browsers never revalidate them;
+other names must revalidate against the ETag. Everything is private: these
+are HR documents, shared proxies and CDNs must not store them. Precompressed .br/.gz
+siblings written by precompress_directory() are served to clients that accept
+them, and every file goes out through SendfileResponse (zero-copy only on
+servers with the ASGI zero-copy send extension; chunked under uvicorn). Staging and resumable-upload parts are never exposed.
+"""
+
+from pathlib import Path
+from typing import Iterator, Optional
+import logging
+import mimetypes
+import os
+import re
+import stat
+import zlib
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.core.responses import SendfileResponse
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip siblings are written without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+STATIC_IMMUTABLE_MAX_AGE = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", str(365 * 24 * 3600)))  # seconds
+PRECOMPRESS_MIN_SIZE = int(os.getenv("PRECOMPRESS_MIN_SIZE", "1024"))
+PRECOMPRESS_MIN_SAVINGS = float(os.getenv("PRECOMPRESS_MIN_SAVINGS", "0.1"))  # Keep a sibling only if it saves 10%
+PRECOMPRESS_BROTLI_QUALITY = int(os.getenv("PRECOMPRESS_BROTLI_QUALITY", "9"))
+PRECOMPRESS_EXTENSIONS = {".pdf", ".doc", ".txt", ".csv", ".json", ".xml", ".svg", ".html", ".css", ".js", ".md"}
+
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))  # Server preference order
+PRECOMPRESSED_SUFFIXES = tuple(suffix for _, suffix in ENCODINGS)
+PRIVATE_DIRS = {"tmp", "partial"}  # Staging and resumable-upload parts (file_storage, resumable_uploads)
+_TEMP_SUFFIXES = (".part", ".gc", ".zst", ".enc")
+_PROBE_SIZE = 64 * 1024
+_IMMUTABLE_NAME = re.compile(
+    r"^(?:[0-9a-f]{64}"                                   # blobs/ab/cd/<sha256>
+    r"|[0-9a-f]{64}-\d+\.\w+"                             # derivatives/<sha256>-<size>.<fmt>
+    r"|[0-9a-f]{8}-?(?:[0-9a-f]{4}-?){3}[0-9a-f]{12}\.\w+"  # legacy <uuid>.<ext>, never rewritten
+    r")$"
+)
+
+
+def cache_control(name: str) -> str:
+    if _IMMUTABLE_NAME.match(name):
+        return f"private, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+    return "private, no-cache"
+
+
+def unlink_with_siblings(path: Path):
+    """Remove an uploaded file and the .br/.gz siblings the build step wrote for it"""
+    path.unlink(missing_ok=True)
+    for suffix in PRECOMPRESSED_SUFFIXES:
+        path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows encoding (q=0 refuses it)"""
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip() not in (encoding, "*"):
+            continue
+        params = params.replace(" ", "")
+        return not (params.startswith("q=") and float(params[2:] or 0) == 0)
+    return False
+
+
+class UploadsStaticFiles(StaticFiles):
+    """StaticFiles with cache headers, precompressed variants and sendfile"""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        parts = Path(path).parts
+        if parts and (parts[0] in PRIVATE_DIRS or any(part.startswith(".") for part in parts)
+                      or parts[-1].endswith(_TEMP_SUFFIXES)):
+            raise HTTPException(status_code=404)
+
+        if parts and parts[-1].endswith(PRECOMPRESSED_SUFFIXES):
+            # A sibling outlives its original only if a delete missed it; never serve it alone
+            original = os.path.splitext(path)[0]
+            if await anyio.to_thread.run_sync(self._missing, original):
+                raise HTTPException(status_code=404)
+
+        if scope["method"] in ("GET", "HEAD") and Path(path).suffix.lower() in PRECOMPRESS_EXTENSIONS:
+            headers = Headers(scope=scope)
+            variant = await anyio.to_thread.run_sync(
+                self._select_variant, path, headers.get("accept-encoding", ""), "range" in headers
+            )
+            if variant is not None:
+                return self._file_response(*variant, scope=scope)
+
+        return await super().get_response(path, scope)
+
+    def _missing(self, path: str) -> bool:
+        try:
+            _, stat_result = self.lookup_path(path)
+        except OSError:
+            return True
+        return stat_result is None
+
+    def _select_variant(self, path: str, accept_encoding: str, ranged: bool) -> Optional[tuple]:
+        """(full path, stat, original name, encoding, has siblings) of the best representation"""
+        try:
+            full_path, stat_result = self.lookup_path(path)
+        except OSError:
+            return None
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            return None
+
+        name, chosen, has_siblings = os.path.basename(full_path), None, False
+        for encoding, suffix in ENCODINGS:
+            try:
+                sibling = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            # Older than the original means the original was replaced after the build step
+            if sibling.st_mtime < stat_result.st_mtime:
+                continue
+            has_siblings = True
+            # Ranges refer to the identity bytes clients usually resume from
+            if chosen is None and not ranged and accepts_encoding(accept_encoding, encoding):
+                chosen = (full_path + suffix, sibling, name, encoding)
+
+        if chosen is not None:
+            return chosen + (True,)
+        return full_path, stat_result, name, None, has_siblings
+
+    def _file_response(self, full_path: str, stat_result: os.stat_result, name: str,
+                       encoding: Optional[str], has_siblings: bool, scope: Scope) -> Response:
+        headers = {"Cache-Control": cache_control(name)}
+        if has_siblings:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        response = SendfileResponse(
+            full_path,
+            stat_result=stat_result,
+            media_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+            headers=headers
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        return self._file_response(str(full_path), stat_result, os.path.basename(full_path), None, False, scope)
+
+
+def _eligible(path: Path, size: int) -> bool:
+    return path.suffix.lower() in PRECOMPRESS_EXTENSIONS and size >= PRECOMPRESS_MIN_SIZE
+
+
+def _compressors() -> Iterator[tuple]:
+    """(sibling suffix, compressor factory) for each available encoding"""
+    if brotli is not None:
+        yield ".br", lambda: brotli.Compressor(quality=PRECOMPRESS_BROTLI_QUALITY)
+    yield ".gz", lambda: _GzipCompressor()
+
+
+class _GzipCompressor:
+    """gzip with the brotli.Compressor interface (process/finish)"""
+
+    def __init__(self):
+        self._zlib = zlib.compressobj(9, zlib.DEFLATED, 31)
+
+    def process(self, data: bytes) -> bytes:
+        return self._zlib.compress(data)
+
+    def finish(self) -> bytes:
+        return self._zlib.flush()
+
+
+def _worth_compressing(path: Path, factory) -> bool:
+    """Compress the first chunk only; already-compressed content (most PDFs) stops here"""
+    with open(path, "rb") as f:
+        probe = f.read(_PROBE_SIZE)
+    compressor = factory()
+    compressed = len(compressor.process(probe)) + len(compressor.finish())
+    return compressed <= len(probe) * (1 - PRECOMPRESS_MIN_SAVINGS)
+
+
+def precompress_file(path: Path, force: bool = False) -> dict:
+    """Write missing or stale .br/.gz siblings of one file; returns bytes written per suffix"""
+    original = path.stat()
+    written = {}
+    for suffix, factory in _compressors():
+        sibling = path.with_name(path.name + suffix)
+        try:
+            if not force and sibling.stat().st_mtime >= original.st_mtime:
+                continue
+        except FileNotFoundError:
+            pass
+        if not _worth_compressing(path, factory):
+            sibling.unlink(missing_ok=True)  # A stale one would never be served anyway
+            continue
+
+        partial = sibling.with_name(sibling.name + ".part")
+        compressor = factory()
+        with open(path, "rb") as source, open(partial, "wb") as out:
+            while chunk := source.read(_PROBE_SIZE):
+                out.write(compressor.process(chunk))
+            out.write(compressor.finish())
+        if partial.stat().st_size > original.st_size * (1 - PRECOMPRESS_MIN_SAVINGS):
+            partial.unlink()
+            sibling.unlink(missing_ok=True)
+            continue
+        # Same mtime as the original: the handler treats older siblings as stale
+        os.utime(partial, ns=(original.st_atime_ns, original.st_mtime_ns))
+        os.replace(partial, sibling)
+        written[suffix] = sibling.stat().st_size
+    return written
+
+
+def precompress_directory(root: Path, force: bool = False) -> dict:
+    """Build step: precompress every eligible file below root, skipping private and blob directories"""
+    report = {"scanned": 0, "eligible": 0, "written": 0, "bytes_in": 0, "bytes_out": 0}
+    for directory, subdirs, files in os.walk(root):
+        if Path(directory) == Path(root):
+            # Blob names carry no extension and their codec is chosen at upload
+            subdirs[:] = [d for d in subdirs if d not in PRIVATE_DIRS and d != "blobs"]
+        for filename in files:
+            path = Path(directory) / filename
+            report["scanned"] += 1
+            if filename.endswith(PRECOMPRESSED_SUFFIXES + _TEMP_SUFFIXES):
+                continue
+            size = path.stat().st_size
+            if not _eligible(path, size):
+                continue
+            report["eligible"] += 1
+            written = precompress_file(path, force=force)
+            if written:
+                report["written"] += len(written)
+                report["bytes_in"] += size * len(written)
+                report["bytes_out"] += sum(written.values())
+    logger.info(f"Precompressed {root}: {report}")
+    return report
@@ -3,8 +3,7 @@ HRthis Backend API
 FastAPI application for HR management system
 """
 
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Request, Response
 import os
 from pathlib import Path
 
@@ -18,8 +17,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Static file serving for uploads
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Static file serving for uploads (immutable caching, precompressed variants, sendfile)
+from app.core.static_files import UploadsStaticFiles
+app.mount("/uploads", UploadsStaticFiles(directory="uploads"), name="uploads")
 
 @app.get("/")
 def root_redirect():
@@ -40,8 +40,28 @@ def root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/.well-known/jwks.json")
+@app.get("/hrthis/.well-known/jwks.json")
+def jwks(request: Request):
+    """Public signing keys for local token verification"""
+    from app.services.auth import get_jwks
+    from app.services.jwt_keys import JWKS_MAX_AGE_SECONDS
+
+    document = get_jwks()
+    if document is None:
+        raise HTTPException(status_code=404, detail="Token signing is symmetric; no JWKS published")
+
+    body, etag = document
+    headers = {
+        "Cache-Control": f"public, max-age={JWKS_MAX_AGE_SECONDS}, stale-while-revalidate=60",
+        "ETag": etag
+    }
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/jwk-set+json", headers=headers)
+
 # Import routers
-from app.api import employees, auth, files, ai_proxy
+from app.api import employees, auth, files, resumable_uploads, ai_proxy
 from app.core.database import create_tables
 from app.hooks.database_hooks import DatabaseHooks
 from app.middleware.request_hooks import RequestHooksMiddleware
@@ -73,7 +93,7 @@ app.add_middleware(
     CORSSecurityMiddleware,
     allowed_origins=set(cors_origins),
     allowed_methods={"GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"},
-    allowed_headers={"Content-Type", "Authorization", "X-Request-ID"},
+    allowed_headers={"Content-Type", "Authorization", "X-Request-ID", "Upload-Length", "Upload-Offset", "Cache-Control"},
     allow_credentials=True,
     max_age=3600
 )
@@ -93,6 +113,19 @@ app.add_middleware(
 def startup_event():
     create_tables()
     
+    # Build file statistics for databases that predate the summary table
+    from app.core.database import SessionLocal
+    from app.services.file_stats import ensure_file_stats
+    db = SessionLocal()
+    try:
+        ensure_file_stats(db)
+    finally:
+        db.close()
+    
+    from app.services.file_encryption import encryption_enabled
+    if not encryption_enabled():
+        print("Warning: FILE_ENCRYPTION_KEY not set, confidential files are stored unencrypted")
+    
     # Register all database hooks
     DatabaseHooks.register_all_hooks()
     print("✅ Database hooks registered")
@@ -106,9 +139,35 @@ def startup_event():
         except Exception as e:
             print(f"Warning: Could not initialize demo users: {e}")
 
+@app.on_event("startup")
+async def start_background_workers():
+    from app.services.ai_clients import start_ai_clients
+    from app.services.ai_usage import start_usage_flusher
+    from app.services.retention import start_retention_sweeper
+    from app.services.text_extraction import start_extraction_worker
+    start_ai_clients()
+    start_usage_flusher()
+    start_extraction_worker()
+    start_retention_sweeper(on_batch=files.invalidate_deleted_files)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from app.services.ai_clients import close_ai_clients
+    from app.services.ai_usage import stop_usage_flusher
+    from app.services.retention import stop_retention_sweeper
+    from app.services.text_extraction import stop_extraction_worker
+    from app.services.thumbnails import shutdown_pool
+    stop_retention_sweeper()
+    await stop_extraction_worker()
+    await close_ai_clients()
+    await stop_usage_flusher()
+    ai_proxy.response_cache.close()
+    shutdown_pool()
+
 # Include routers with /hrthis prefix
 app.include_router(auth.router, prefix="/hrthis/api/auth", tags=["authentication"])
 app.include_router(employees.router, prefix="/hrthis/api/employees", tags=["employees"])
+app.include_router(resumable_uploads.router, prefix="/hrthis/api/files/uploads", tags=["file-management"])
 app.include_router(files.router, prefix="/hrthis/api/files", tags=["file-management"])
 app.include_router(ai_proxy.router, prefix="/hrthis/api/ai", tags=["ai-services"])
 
@@ -0,0 +1,50 @@
+"""
+AI Usage Models
+Per-call ledger of AI proxy usage and its daily per-user rollup
+"""
+
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, Date, DateTime, Index
+from app.core.database import Base
+from sqlalchemy.sql import func
+
+class AIUsageEvent(Base):
+    """One proxied AI call: who, which provider, tokens and latency"""
+    __tablename__ = "ai_usage_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=True)
+    source = Column(String, nullable=False, default="upstream")  # upstream, cache, coalesced
+    status_code = Column(Integer, nullable=False)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    tokens_estimated = Column(Boolean, nullable=False, default=False)  # Upstream reported no usage
+    latency_ms = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_ai_usage_events_user_created", "user_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<AIUsageEvent {self.id} {self.user_id} {self.provider}>"
+
+class AIUsageDaily(Base):
+    """Running daily totals per user and provider, updated with every ledger flush"""
+    __tablename__ = "ai_usage_daily"
+
+    day = Column(Date, primary_key=True)                # UTC
+    user_id = Column(String, primary_key=True)
+    provider = Column(String, primary_key=True)
+    requests = Column(Integer, nullable=False, default=0)
+    shared_requests = Column(Integer, nullable=False, default=0)  # Served from cache or a coalesced call
+    input_tokens = Column(BigInteger, nullable=False, default=0)  # Upstream calls only
+    output_tokens = Column(BigInteger, nullable=False, default=0)
+    latency_ms_total = Column(BigInteger, nullable=False, default=0)
+
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<AIUsageDaily {self.day} {self.user_id} {self.provider} {self.requests}>"
@@ -3,15 +3,13 @@ File Management Models
 SQLAlchemy models for file metadata and document management
 """
 
-from sqlalchemy import Column, String, Integer, DateTime, Enum, Text, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, DateTime, Enum, Text, ForeignKey, Index
+from app.core.database import Base
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from enum import Enum as PyEnum
 
-Base = declarative_base()
-
 class FileCategory(PyEnum):
     """Document categories for HR files"""
     PROFILE_PHOTO = "profile_photo"
@@ -39,7 +37,9 @@ class FileMetadata(Base):
     # File Properties
     file_size = Column(Integer, nullable=False)         # Size in bytes
     mime_type = Column(String, nullable=False)          # MIME type
-    file_hash = Column(String, nullable=True)           # SHA256 for deduplication
+    file_hash = Column(String, nullable=True, index=True)  # SHA256, key into file_blobs
+    storage_codec = Column(String(16), nullable=True)   # Encoding at rest (copied from the blob); NULL = identity
+    encrypted_key = Column(String, nullable=True)       # Per-file data key wrapped by the master key (aesgcm codec)
     
     # Categorization
     category = Column(Enum(FileCategory), default=FileCategory.OTHER)
@@ -56,12 +56,21 @@ class FileMetadata(Base):
     
     # Metadata
     uploaded_by = Column(String, ForeignKey("employees.id"), nullable=False)
-    uploaded_at = Column(DateTime, default=func.now())
+    uploaded_at = Column(DateTime, nullable=False, default=func.now())  # Keyset pagination key; backfilled by create_tables
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # Access Control
     is_confidential = Column(String, default=False)     # Requires special permissions
-    retention_date = Column(DateTime, nullable=True)    # Auto-delete date
+    retention_date = Column(DateTime, nullable=True)    # Auto-delete date, enforced by the retention sweeper
+    
+    # Keyset pagination: newest first, with and without the common list filters
+    __table_args__ = (
+        Index("ix_file_metadata_uploaded", "uploaded_at", "id"),
+        Index("ix_file_metadata_employee_uploaded", "employee_id", "uploaded_at", "id"),
+        Index("ix_file_metadata_category_uploaded", "category", "uploaded_at", "id"),
+        # Retention sweeper scans expired rows in (retention_date, id) order
+        Index("ix_file_metadata_retention", "retention_date", "id"),
+    )
     
     def __repr__(self):
         return f"<FileMetadata {self.filename} ({self.category.value})>"
@@ -83,6 +92,11 @@ class FileMetadata(Base):
                          'application/vnd.openxmlformats-officedocument.wordprocessingml.document']
         return self.mime_type in document_types
     
+    @property
+    def confidential(self):
+        """is_confidential as a bool (the column holds '0'/'1' strings)"""
+        return self.is_confidential not in (None, False, "0", "false", "False", "")
+    
     def to_dict(self):
         """Convert to dictionary for JSON serialization"""
         return {
@@ -101,7 +115,80 @@ class FileMetadata(Base):
             "isProcessed": self.is_processed,
             "extractedText": self.extracted_text,
             "uploadedBy": self.uploaded_by,
-            "uploadedAt": self.uploaded_at.isoformat(),
-            "updatedAt": self.updated_at.isoformat(),
+            "uploadedAt": self.uploaded_at.isoformat() if self.uploaded_at else None,
+            "updatedAt": self.updated_at.isoformat() if self.updated_at else None,
             "retentionDate": self.retention_date.isoformat() if self.retention_date else None
-        }
\ No newline at end of file
+        }
+
+class FileBlob(Base):
+    """Content-addressed blob on disk, shared by all metadata rows with the same hash"""
+    __tablename__ = "file_blobs"
+    
+    sha256 = Column(String(64), primary_key=True)
+    file_path = Column(String, nullable=False)          # Blob location on disk
+    file_size = Column(Integer, nullable=False)         # Size in bytes (original content)
+    codec = Column(String(16), nullable=True)           # Encoding at rest: NULL/identity, zstd or aesgcm
+    stored_size = Column(BigInteger, nullable=True)     # Bytes on disk after encoding; NULL = file_size
+    ref_count = Column(Integer, nullable=False, default=0)  # Number of FileMetadata rows using it
+    
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<FileBlob {self.sha256[:12]} refs={self.ref_count}>"
+
+class UploadSession(Base):
+    """Resumable upload in progress; bytes accumulate in part_path until upload_offset == upload_length"""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True)
+    part_path = Column(String, nullable=False)          # Partial file on disk
+    upload_length = Column(Integer, nullable=False)     # Declared total size in bytes
+    upload_offset = Column(Integer, nullable=False, default=0)  # Bytes received so far
+    
+    # Metadata applied to the FileMetadata row on completion
+    filename = Column(String, nullable=False)
+    category = Column(Enum(FileCategory), default=FileCategory.OTHER)
+    description = Column(Text, nullable=True)
+    employee_id = Column(String, ForeignKey("employees.id"), nullable=True)
+    is_confidential = Column(Boolean, default=False)
+    
+    created_by = Column(String, ForeignKey("employees.id"), nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
+    file_id = Column(String, nullable=True)             # Set on completion; the session stays as a tombstone until expiry
+    
+    def __repr__(self):
+        return f"<UploadSession {self.id} {self.upload_offset}/{self.upload_length}>"
+
+class ExtractionJob(Base):
+    """Durable queue entry for background text extraction of an uploaded file"""
+    __tablename__ = "extraction_jobs"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_id = Column(String, ForeignKey("file_metadata.id"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    claim_token = Column(String, nullable=True, index=True)  # Set by the worker that owns the job
+    
+    created_at = Column(DateTime, default=func.now())
+    claimed_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<ExtractionJob {self.id} {self.file_id} {self.status}>"
+
+class FileStatsBucket(Base):
+    """Running file count and size per category / per employee, maintained on upload and delete"""
+    __tablename__ = "file_stats"
+    
+    dimension = Column(String, primary_key=True)        # "category" or "employee"
+    key = Column(String, primary_key=True)              # Category value or employee id ("" = unassigned)
+    file_count = Column(Integer, nullable=False, default=0)
+    total_bytes = Column(BigInteger, nullable=False, default=0)
+    
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<FileStatsBucket {self.dimension}:{self.key} {self.file_count}>"
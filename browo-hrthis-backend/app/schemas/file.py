@@ -21,6 +21,27 @@ class FileUploadResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BatchUploadResult(BaseModel):
+    """Outcome for one file of a batch upload"""
+    filename: str
+    status_code: int
+    file: Optional[FileUploadResponse] = None
+    error: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    """Per-file results of a batch upload"""
+    uploaded: int
+    failed: int
+    results: List[BatchUploadResult]
+
+class UploadSessionResponse(BaseModel):
+    """State of a resumable upload session"""
+    id: str
+    upload_url: str
+    upload_offset: int
+    upload_length: int
+    expires_at: datetime
+
 class FileMetadataResponse(BaseModel):
     """File metadata response"""
     id: str
@@ -73,7 +94,21 @@ class FileMetadataResponse(BaseModel):
 class FileListResponse(BaseModel):
     """Paginated file list response"""
     files: List[FileMetadataResponse]
-    total: int
+    total: Optional[int] = None  # Omitted when include_total=false
+    page: int
+    size: int
+    next_cursor: Optional[str] = None  # Pass as ?cursor= for the next page
+
+class FileSearchHit(BaseModel):
+    """Single full-text search result"""
+    file: FileMetadataResponse
+    score: float
+    snippet: Optional[str] = None  # HTML-escaped excerpt, matches wrapped in <mark>
+
+class FileSearchResponse(BaseModel):
+    """Ranked full-text search results"""
+    query: str
+    hits: List[FileSearchHit]
     page: int
     size: int
 
@@ -101,6 +136,9 @@ class FileStats(BaseModel):
     total_size_mb: float
     files_by_category: dict
     files_by_employee: dict
+    stored_size_mb: float = 0.0                  # Blob storage on disk (deduplicated, after compression)
+    compression_ratio: Optional[float] = None    # Original / on-disk bytes of all blobs
+    blobs_by_codec: dict = {}
     recent_uploads: List[FileMetadataResponse]
 
 # Email Service Schemas (Browo AI Integration vorbereitet)
@@ -0,0 +1,171 @@
+"""
+AI Response Cache
+Caches upstream completions of deterministic requests (temperature 0), keyed
+by a SHA-256 of the canonical JSON of provider, model, messages, system and
+parameters. A per-worker LRU tier answers repeats in microseconds; an optional
+SQLite file shared by all workers keeps entries across restarts, bounded by
+TTL and a byte cap with least-recently-used eviction. Only the key hash and
+the response are stored, never the prompt.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from app.core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT = "v1"  # Part of every key; bump to invalidate all entries
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    stored_at: float         # Wall clock, for the Age header
+    upstream_seconds: float  # What the original upstream call took
+
+
+def is_deterministic(payload: dict) -> bool:
+    """Same input, same output: only temperature 0 requests are worth caching"""
+    return payload.get("temperature") == 0 and not payload.get("stream")
+
+
+def cache_key(provider: str, payload: dict) -> str:
+    """Canonical hash of everything that shapes the completion"""
+    canonical = json.dumps(
+        {key: value for key, value in payload.items() if key != "stream"},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(f"{CACHE_FORMAT}\n{provider}\n{canonical}".encode()).hexdigest()
+
+
+class AIResponseCache:
+    """Memory LRU in front of an optional SQLite tier, with hit/miss and saved-latency counters"""
+
+    def __init__(self, maxsize: int, ttl: float, max_entry_bytes: int,
+                 disk_path: Optional[str] = None, disk_max_bytes: int = 0):
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        self.memory_hits = self.disk_hits = self.misses = self.bypassed = self.stored = 0
+        self.saved_upstream_seconds = 0.0
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @property
+    def disk_enabled(self) -> bool:
+        return self._disk is not None
+
+    def _open_disk(self, path: str):
+        self._disk = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._disk.execute("PRAGMA journal_mode=WAL")
+        self._disk.execute("PRAGMA synchronous=NORMAL")
+        self._disk.execute(
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            "key TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, stored_at REAL NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL, upstream_seconds REAL NOT NULL)"
+        )
+        self._disk.execute("CREATE INDEX IF NOT EXISTS ix_ai_response_cache_last_access ON ai_response_cache (last_access)")
+        self._disk_bytes = self._disk.execute("SELECT COALESCE(SUM(size), 0) FROM ai_response_cache").fetchone()[0]
+
+    def get_memory(self, key: str) -> Optional[CachedResponse]:
+        cached = self.memory.get(key)
+        if cached is not None:
+            self._hit(cached, disk=False)
+        return cached
+
+    def get_disk(self, key: str) -> Optional[CachedResponse]:
+        """Blocking: call from a worker thread"""
+        now = time.time()
+        with self._lock:
+            row = self._disk.execute(
+                "SELECT body, stored_at, expires_at, upstream_seconds FROM ai_response_cache WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+            if row is not None:
+                self._disk.execute("UPDATE ai_response_cache SET last_access = ? WHERE key = ?", (now, key))
+        if row is None:
+            return None
+        body, stored_at, expires_at, upstream_seconds = row
+        cached = CachedResponse(bytes(body), stored_at, upstream_seconds)
+        self.memory.set(key, cached, ttl=expires_at - now)
+        self._hit(cached, disk=True)
+        return cached
+
+    def _hit(self, cached: CachedResponse, disk: bool):
+        with self._lock:
+            if disk:
+                self.disk_hits += 1
+            else:
+                self.memory_hits += 1
+            self.saved_upstream_seconds += cached.upstream_seconds
+
+    def record_miss(self, bypassed: bool = False):
+        with self._lock:
+            if bypassed:
+                self.bypassed += 1
+            else:
+                self.misses += 1
+
+    def set(self, key: str, body: bytes, upstream_seconds: float) -> bool:
+        """Store a response in both tiers (blocking when the disk tier is on); False if too large"""
+        if len(body) > self.max_entry_bytes:
+            return False
+        now = time.time()
+        self.memory.set(key, CachedResponse(body, now, upstream_seconds))
+        with self._lock:
+            self.stored += 1
+            if self._disk is None:
+                return True
+            self._disk.execute(
+                "INSERT OR REPLACE INTO ai_response_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, body, len(body), now, now + self.ttl, now, upstream_seconds)
+            )
+            self._disk_bytes += len(body)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict(now)
+        return True
+
+    def _evict(self, now: float):
+        """Drop expired rows, then least recently used ones until under the byte cap (lock held)"""
+        self._disk.execute("DELETE FROM ai_response_cache WHERE expires_at <= ?", (now,))
+        # Other workers write to the same file: recount instead of trusting the running total
+        self._disk_bytes = self._disk.execute("SELECT COALESCE(SUM(size), 0) FROM ai_response_cache").fetchone()[0]
+        while self._disk_bytes > self.disk_max_bytes:
+            rows = self._disk.execute(
+                "SELECT key, size FROM ai_response_cache ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            self._disk.executemany("DELETE FROM ai_response_cache WHERE key = ?", [(key,) for key, _ in rows])
+            self._disk_bytes -= sum(size for _, size in rows)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "stored": self.stored,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else None,
+            "saved_upstream_seconds": round(self.saved_upstream_seconds, 2),
+            "memory_entries": len(self.memory),
+            "disk_enabled": self.disk_enabled,
+            "disk_mb": round(self._disk_bytes / (1024 * 1024), 2) if self.disk_enabled else None
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
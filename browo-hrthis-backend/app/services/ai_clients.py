@@ -0,0 +1,171 @@
+"""
+AI Provider Clients
+One long-lived httpx.AsyncClient per AI provider, opened at app startup and
+closed at shutdown, so proxied requests reuse warm keep-alive (and, where the
+provider negotiates it, HTTP/2 multiplexed) connections instead of paying a
+TCP and TLS handshake each. Connection opens and handshakes are counted
+through httpcore's trace hook for the pool metrics, next to streaming
+time-to-first-token.
+"""
+
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Deque, Dict, Optional
+import importlib.util
+import logging
+import os
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "20"))  # Per provider
+AI_HTTP_MAX_KEEPALIVE = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "10"))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", "60"))  # seconds idle before a connection is dropped
+AI_HTTP_CONNECT_TIMEOUT = float(os.getenv("AI_HTTP_CONNECT_TIMEOUT", "5"))
+AI_HTTP_READ_TIMEOUT = float(os.getenv("AI_HTTP_READ_TIMEOUT", "60"))  # Between bytes; generations can pause
+AI_HTTP_WRITE_TIMEOUT = float(os.getenv("AI_HTTP_WRITE_TIMEOUT", "10"))
+AI_HTTP_POOL_TIMEOUT = float(os.getenv("AI_HTTP_POOL_TIMEOUT", "5"))  # Waiting for a free connection
+AI_HTTP2 = os.getenv("AI_HTTP2", "true").lower() == "true"
+
+PROVIDERS = ("anthropic", "openai", "grok")
+
+# HTTP/2 needs the optional h2 package (httpx[http2]); without it clients speak HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@dataclass
+class ClientMetrics:
+    requests: int = 0
+    errors: int = 0                # Transport failures (timeouts, refused, reset)
+    connections_opened: int = 0    # TCP connects
+    tls_handshakes: int = 0
+    http2_connections: int = 0
+    streams: int = 0
+    streams_cancelled: int = 0     # Client went away before the upstream finished
+
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+_metrics: Dict[str, ClientMetrics] = {provider: ClientMetrics() for provider in PROVIDERS}
+_first_token_seconds: Dict[str, Deque[float]] = {provider: deque(maxlen=1000) for provider in PROVIDERS}
+
+
+def _tracer(metrics: ClientMetrics):
+    async def trace(event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            metrics.connections_opened += 1
+        elif event == "connection.start_tls.complete":
+            metrics.tls_handshakes += 1
+        elif event == "http2.send_connection_init.complete":
+            metrics.http2_connections += 1
+    return trace
+
+
+def _create_client(provider: str) -> httpx.AsyncClient:
+    metrics = _metrics[provider]
+    trace = _tracer(metrics)
+
+    async def on_request(request: httpx.Request):
+        metrics.requests += 1
+        request.extensions["trace"] = trace
+
+    transport = httpx.AsyncHTTPTransport(
+        http2=AI_HTTP2 and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=AI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=AI_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=AI_HTTP_KEEPALIVE_EXPIRY
+        ),
+        retries=1  # Reconnect once if a pooled connection was closed by the peer
+    )
+    _transports[provider] = transport
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(
+            connect=AI_HTTP_CONNECT_TIMEOUT,
+            read=AI_HTTP_READ_TIMEOUT,
+            write=AI_HTTP_WRITE_TIMEOUT,
+            pool=AI_HTTP_POOL_TIMEOUT
+        ),
+        event_hooks={"request": [on_request]}
+    )
+
+
+def start_ai_clients():
+    """Open the provider clients (app startup)"""
+    if AI_HTTP2 and not HTTP2_AVAILABLE:
+        logger.warning("AI_HTTP2 is enabled but h2 is not installed; AI clients use HTTP/1.1")
+    for provider in PROVIDERS:
+        if provider not in _clients:
+            _clients[provider] = _create_client(provider)
+
+
+async def close_ai_clients():
+    """Close every pooled connection (app shutdown)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    _transports.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def get_ai_client(provider: str) -> httpx.AsyncClient:
+    """Shared client of a provider; opened on first use if startup did not run (scripts, tests)"""
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        client = _clients[provider] = _create_client(provider)
+    return client
+
+
+def record_transport_error(provider: str):
+    _metrics[provider].errors += 1
+
+
+def record_first_token(provider: str, seconds: float):
+    _first_token_seconds[provider].append(seconds)
+
+
+def record_stream_finished(provider: str, completed: bool):
+    _metrics[provider].streams += 1
+    if not completed:
+        _metrics[provider].streams_cancelled += 1
+
+
+def _percentiles_ms(samples: Deque[float]) -> Optional[dict]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 1)
+    return {"p50": pick(0.5), "p95": pick(0.95), "samples": len(ordered)}
+
+
+def _pool_snapshot(provider: str) -> Optional[dict]:
+    """Connections currently held by the provider's pool (httpcore keeps them on the transport)"""
+    pool = getattr(_transports.get(provider), "_pool", None)
+    if pool is None:
+        return None
+    connections = pool.connections
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "open": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "max": AI_HTTP_MAX_CONNECTIONS
+    }
+
+
+def get_client_metrics() -> dict:
+    """Per provider: request and handshake counters, the current pool state and recent time-to-first-token"""
+    result = {}
+    for provider, metrics in _metrics.items():
+        counters = asdict(metrics)
+        # Every request that did not open a connection rode on a pooled one
+        counters["connection_reuse_ratio"] = (
+            round(1 - metrics.connections_opened / metrics.requests, 3) if metrics.requests else None
+        )
+        counters["pool"] = _pool_snapshot(provider)
+        counters["time_to_first_token_ms"] = _percentiles_ms(_first_token_seconds[provider])
+        result[provider] = counters
+    return {"http2": AI_HTTP2 and HTTP2_AVAILABLE, "providers": result}
@@ -0,0 +1,169 @@
+"""
+AI Request Coalescing
+Concurrent identical requests share one upstream call. The call runs in its
+own task, so a caller that goes away never cancels it for the others; only
+when the last interested caller is gone is the upstream work cancelled.
+Streams are fanned out through a replayable broadcast: a subscriber joining
+mid-stream first receives every chunk sent so far, then the live ones.
+"""
+
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+def _retrieve(future: asyncio.Future):
+    """Mark a failed future as handled when nobody is left to await it"""
+    if future.done() and not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """Callers with the same key await one shared execution"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.leaders = 0
+        self.joined = 0
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(factory()))
+            call.task.add_done_callback(lambda task: (self._forget(key, call), _retrieve(task)))
+            self.leaders += 1
+        else:
+            self.joined += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody wants the result any more; later callers start a fresh call
+                self._forget(key, call)
+                call.task.cancel()
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "joined": self.joined, "in_flight": len(self._calls)}
+
+
+class Broadcast:
+    """Append-only chunk log that any number of subscribers read from the start"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None  # Why the stream ended early, if it did
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk: bytes):
+        self.chunks.append(chunk)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None):
+        self.error = error
+        self.finished = True
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        index = 0
+        while True:
+            if index < len(self.chunks):
+                index += 1
+                yield self.chunks[index - 1]
+                continue
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.chunks) or self.finished)
+
+
+class _StreamFlight:
+    def __init__(self):
+        self.opened: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.broadcast = Broadcast()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class StreamFlights:
+    """
+    Coalesces streaming requests. producer(opened, broadcast) opens the
+    upstream, resolves opened once the response status is known (or fails it
+    with the error every subscriber should raise), then publishes chunks and
+    finishes the broadcast, with the error if the upstream broke off.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _StreamFlight] = {}
+        self.leaders = 0
+        self.joined = 0
+
+    def _forget(self, key: str, flight: _StreamFlight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _leave(self, key: str, flight: _StreamFlight):
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.task.done():
+            # Last subscriber disconnected: stop the upstream generation
+            self._forget(key, flight)
+            flight.task.cancel()
+
+    async def join(
+        self,
+        key: str,
+        producer: Callable[[asyncio.Future, Broadcast], Awaitable[None]]
+    ) -> AsyncIterator[bytes]:
+        """Wait until the shared upstream stream is open; returns this subscriber's chunk iterator"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _StreamFlight()
+            flight.task = asyncio.ensure_future(producer(flight.opened, flight.broadcast))
+            flight.task.add_done_callback(
+                lambda task: (self._forget(key, flight), _retrieve(task), _retrieve(flight.opened))
+            )
+            self.leaders += 1
+        else:
+            self.joined += 1
+
+        flight.subscribers += 1
+        try:
+            await asyncio.shield(flight.opened)
+        except BaseException:
+            self._leave(key, flight)
+            raise
+        return self._consume(key, flight)
+
+    async def _consume(self, key: str, flight: _StreamFlight) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in flight.broadcast.subscribe():
+                yield chunk
+        finally:
+            self._leave(key, flight)
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "joined": self.joined, "in_flight": len(self._flights)}
@@ -0,0 +1,466 @@
+"""
+AI Usage Ledger
+Records every proxied AI call (tokens in/out, latency, where the answer came
+from) and enforces daily per-role quotas. Calls are buffered in memory and
+written in batches, each batch also adding to the ai_usage_daily rollup, so
+the request path never waits for the database. Quota checks read per-user
+daily totals kept in memory: the rollup value (reloaded every
+AI_USAGE_QUOTA_REFRESH seconds to see other workers) plus this worker's
+calls that are not flushed yet. A passed check reserves the request until the
+call is recorded, so concurrent calls and long streams cannot overrun it.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.ai_usage import AIUsageDaily, AIUsageEvent
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_quotas(value: str) -> Dict[str, int]:
+    """"USER=100,ADMIN=500" -> {"USER": 100, "ADMIN": 500}; 0 means unlimited"""
+    quotas = {}
+    for item in value.split(","):
+        role, _, limit = item.partition("=")
+        if role.strip() and limit.strip():
+            quotas[role.strip().upper()] = int(limit)
+    return quotas
+
+
+# Configuration
+AI_USAGE_FLUSH_INTERVAL = float(os.getenv("AI_USAGE_FLUSH_INTERVAL", "5"))  # seconds
+AI_USAGE_FLUSH_BATCH = int(os.getenv("AI_USAGE_FLUSH_BATCH", "500"))  # Flush early once this many calls are buffered
+AI_USAGE_MAX_BUFFER = int(os.getenv("AI_USAGE_MAX_BUFFER", "50000"))  # Oldest calls are dropped beyond this while the DB is down
+AI_USAGE_QUOTA_REFRESH = float(os.getenv("AI_USAGE_QUOTA_REFRESH", "30"))  # seconds
+AI_USAGE_EVENT_RETENTION_DAYS = int(os.getenv("AI_USAGE_EVENT_RETENTION_DAYS", "90"))  # Rollups are kept; 0 keeps events forever
+AI_DAILY_REQUEST_QUOTAS = _parse_quotas(os.getenv("AI_DAILY_REQUEST_QUOTAS", "USER=100,ADMIN=100,SUPERADMIN=100"))  # Per provider
+AI_DAILY_TOKEN_QUOTAS = _parse_quotas(os.getenv("AI_DAILY_TOKEN_QUOTAS", "USER=200000,ADMIN=1000000,SUPERADMIN=0"))  # All providers
+
+SOURCE_UPSTREAM = "upstream"
+SOURCE_CACHE = "cache"
+SOURCE_COALESCED = "coalesced"
+
+
+@dataclass
+class UsageRecord:
+    user_id: str
+    provider: str
+    model: Optional[str]
+    source: str
+    status_code: int
+    input_tokens: int
+    output_tokens: int
+    tokens_estimated: bool
+    latency_ms: int
+    created_at: datetime
+
+    @property
+    def billable_tokens(self) -> int:
+        """Only calls that reached the provider count against the token quota"""
+        return self.input_tokens + self.output_tokens if self.source == SOURCE_UPSTREAM else 0
+
+
+@dataclass
+class _DailyTotals:
+    """One user's usage today: flushed (from the rollup) plus buffered in this worker"""
+    loaded_at: float
+    requests: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    tokens: int = 0
+    pending_requests: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    pending_tokens: int = 0
+    reserved_requests: Dict[str, int] = field(default_factory=lambda: defaultdict(int))  # Checked, not recorded yet
+
+    def used_requests(self, provider: str) -> int:
+        return self.requests[provider] + self.pending_requests[provider] + self.reserved_requests[provider]
+
+    def used_tokens(self) -> int:
+        return self.tokens + self.pending_tokens
+
+
+_buffer: List[UsageRecord] = []
+_writing: List[UsageRecord] = []  # Batch of the flush in progress
+_totals: Dict[Tuple[date, str], _DailyTotals] = {}
+_flush_lock: Optional[asyncio.Lock] = None
+_flusher_task: Optional[asyncio.Task] = None
+
+
+class QuotaReservation:
+    """A request counted against the quota from the check until record_usage settles it"""
+
+    def __init__(self, totals: _DailyTotals, provider: str):
+        self._totals = totals
+        self._provider = provider
+        self._settled = False
+        totals.reserved_requests[provider] += 1
+
+    def settle(self):
+        if not self._settled:
+            self._settled = True
+            self._totals.reserved_requests[self._provider] -= 1
+
+
+def _get_flush_lock() -> asyncio.Lock:
+    global _flush_lock
+    if _flush_lock is None:
+        _flush_lock = asyncio.Lock()
+    return _flush_lock
+
+
+def _today() -> date:
+    return datetime.utcnow().date()
+
+
+def role_quota(quotas: Dict[str, int], role) -> Optional[int]:
+    """Daily limit of a role; None when unlimited or not configured"""
+    limit = quotas.get(getattr(role, "value", role) or "USER")
+    return limit or None
+
+
+# Token accounting
+
+def estimate_tokens(text: str) -> int:
+    """Rough count (~4 characters per token) for calls whose provider reported no usage"""
+    return (len(text) + 3) // 4
+
+
+def prompt_text(payload: dict) -> str:
+    return (payload.get("system") or "") + "".join(message["content"] for message in payload.get("messages", []))
+
+
+def usage_from_response(provider: str, body: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """Input and output tokens reported in a non-streaming response (None if absent)"""
+    try:
+        usage = json.loads(body).get("usage") or {}
+    except (ValueError, AttributeError):
+        return None, None
+    if provider == "anthropic":
+        return usage.get("input_tokens"), usage.get("output_tokens")
+    return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+
+class StreamUsageMeter:
+    """
+    Reads token usage out of an SSE stream as it passes through: Anthropic
+    reports it in message_start/message_delta, OpenAI-style streams only when
+    asked to, so generated text is also counted for an estimate.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.input_tokens: Optional[int] = None
+        self.output_tokens: Optional[int] = None
+        self.text_chars = 0
+        self._partial = b""
+
+    def feed(self, chunk: bytes):
+        lines = (self._partial + chunk).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            if line.startswith(b"data:"):
+                self._event(line[5:].strip())
+
+    def _event(self, data: bytes):
+        if not data or data == b"[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        if self.provider == "anthropic":
+            message_usage = (event.get("message") or {}).get("usage") or {}
+            usage = event.get("usage") or {}
+            self.input_tokens = message_usage.get("input_tokens", self.input_tokens)
+            self.output_tokens = usage.get("output_tokens", self.output_tokens)
+            self.text_chars += len((event.get("delta") or {}).get("text") or "")
+        else:
+            usage = event.get("usage") or {}
+            self.input_tokens = usage.get("prompt_tokens", self.input_tokens)
+            self.output_tokens = usage.get("completion_tokens", self.output_tokens)
+            for choice in event.get("choices") or []:
+                self.text_chars += len((choice.get("delta") or {}).get("content") or "")
+
+    def output(self) -> Tuple[Optional[int], Optional[int], int]:
+        return self.input_tokens, self.output_tokens, (self.text_chars + 3) // 4
+
+
+# Recording and quotas
+
+def record_usage(
+    user_id: str,
+    provider: str,
+    model: Optional[str],
+    source: str,
+    status_code: int,
+    prompt: str,
+    input_tokens: Optional[int],
+    output_tokens: Optional[int],
+    latency_seconds: float,
+    estimated_output: int = 0,
+    reservation: Optional[QuotaReservation] = None
+):
+    """Buffer one call for the next flush; it replaces the call's reservation in today's quota"""
+    if reservation is not None:
+        reservation.settle()
+    estimated = status_code == 200 and (input_tokens is None or output_tokens is None)
+    if status_code == 200:
+        input_tokens = estimate_tokens(prompt) if input_tokens is None else input_tokens
+        output_tokens = estimated_output if output_tokens is None else output_tokens
+    record = UsageRecord(
+        user_id=user_id,
+        provider=provider,
+        model=model,
+        source=source,
+        status_code=status_code,
+        input_tokens=input_tokens or 0,
+        output_tokens=output_tokens or 0,
+        tokens_estimated=estimated,
+        latency_ms=int(latency_seconds * 1000),
+        created_at=datetime.utcnow()
+    )
+
+    totals = _totals.get((record.created_at.date(), user_id))
+    if totals is not None:
+        totals.pending_requests[provider] += 1
+        totals.pending_tokens += record.billable_tokens
+
+    _buffer.append(record)
+    if len(_buffer) > AI_USAGE_MAX_BUFFER:
+        del _buffer[:len(_buffer) - AI_USAGE_MAX_BUFFER]
+        logger.error("AI usage buffer full, oldest records dropped")
+    if len(_buffer) >= AI_USAGE_FLUSH_BATCH and _flusher_task is not None:
+        asyncio.get_running_loop().create_task(flush_usage())
+
+
+def _load_totals(day: date, user_id: str) -> Tuple[Dict[str, int], int]:
+    """Today's rollup rows of a user: requests per provider and billable tokens"""
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            AIUsageDaily.provider, AIUsageDaily.requests, AIUsageDaily.input_tokens, AIUsageDaily.output_tokens
+        ).filter(AIUsageDaily.day == day, AIUsageDaily.user_id == user_id).all()
+    finally:
+        db.close()
+    return {row.provider: row.requests for row in rows}, sum(row.input_tokens + row.output_tokens for row in rows)
+
+
+async def _daily_totals(user_id: str) -> _DailyTotals:
+    day = _today()
+    totals = _totals.get((day, user_id))
+    if totals is not None and time.monotonic() - totals.loaded_at < AI_USAGE_QUOTA_REFRESH:
+        return totals
+
+    # Under the flush lock no batch can move from pending to the rollup between
+    # reading the rollup and applying it, which would count it twice or not at all
+    async with _get_flush_lock():
+        totals = _totals.get((day, user_id))
+        if totals is not None and time.monotonic() - totals.loaded_at < AI_USAGE_QUOTA_REFRESH:
+            return totals  # Refreshed by a concurrent check while this one waited
+        requests, tokens = await asyncio.to_thread(_load_totals, day, user_id)
+        if totals is None:
+            # Drop yesterday's entries as the first check of a new day comes in
+            for key in [key for key in _totals if key[0] != day]:
+                del _totals[key]
+            totals = _totals[(day, user_id)] = _DailyTotals(loaded_at=0)
+            for record in _buffer:
+                if record.user_id == user_id and record.created_at.date() == day:
+                    totals.pending_requests[record.provider] += 1
+                    totals.pending_tokens += record.billable_tokens
+        totals.requests = defaultdict(int, requests)
+        totals.tokens = tokens
+        totals.loaded_at = time.monotonic()
+        return totals
+
+
+async def check_quota(user_id: str, role, provider: str) -> Tuple[Optional[QuotaReservation], Optional[str]]:
+    """
+    (reservation, None) when the call may proceed, else (None, reason). A
+    dictionary lookup unless the totals are due for a refresh; pass the
+    reservation to record_usage.
+    """
+    totals = await _daily_totals(user_id)
+    request_limit = role_quota(AI_DAILY_REQUEST_QUOTAS, role)
+    if request_limit is not None and totals.used_requests(provider) >= request_limit:
+        return None, f"Daily limit of {request_limit} {provider} requests reached"
+    token_limit = role_quota(AI_DAILY_TOKEN_QUOTAS, role)
+    if token_limit is not None and totals.used_tokens() >= token_limit:
+        return None, f"Daily AI token quota of {token_limit} reached"
+    return QuotaReservation(totals, provider), None
+
+
+# Flushing
+
+def _bump_daily(db: Session, key: Tuple[date, str, str], delta: dict):
+    """Add to one rollup row, creating it on first use (same pattern as the file stats buckets)"""
+    day, user_id, provider = key
+    for _ in range(2):
+        updated = db.query(AIUsageDaily).filter(
+            AIUsageDaily.day == day,
+            AIUsageDaily.user_id == user_id,
+            AIUsageDaily.provider == provider
+        ).update({
+            getattr(AIUsageDaily, column): getattr(AIUsageDaily, column) + value
+            for column, value in delta.items()
+        }, synchronize_session=False)
+        if updated:
+            return
+        try:
+            with db.begin_nested():
+                db.add(AIUsageDaily(day=day, user_id=user_id, provider=provider, **delta))
+            return
+        except IntegrityError:
+            # Created concurrently by another worker; the update will find it now
+            continue
+    raise RuntimeError(f"Could not update AI usage rollup {key}")
+
+
+def _write_batch(batch: List[UsageRecord]):
+    """Insert the events and add them to the rollup in one transaction"""
+    rollup: Dict[Tuple[date, str, str], dict] = {}
+    for record in batch:
+        delta = rollup.setdefault(
+            (record.created_at.date(), record.user_id, record.provider),
+            {"requests": 0, "shared_requests": 0, "input_tokens": 0, "output_tokens": 0, "latency_ms_total": 0}
+        )
+        delta["requests"] += 1
+        if record.source == SOURCE_UPSTREAM:
+            delta["input_tokens"] += record.input_tokens
+            delta["output_tokens"] += record.output_tokens
+        else:
+            delta["shared_requests"] += 1
+        delta["latency_ms_total"] += record.latency_ms
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(AIUsageEvent), [
+            {column: getattr(record, column) for column in UsageRecord.__dataclass_fields__}
+            for record in batch
+        ])
+        for key, delta in rollup.items():
+            _bump_daily(db, key, delta)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def flush_usage():
+    """Write everything buffered so far; on failure the records stay buffered for the next attempt"""
+    global _writing
+    async with _get_flush_lock():
+        if not _buffer:
+            return
+        batch = _writing = _buffer[:]
+        del _buffer[:len(batch)]
+        try:
+            await asyncio.to_thread(_write_batch, batch)
+        except Exception:
+            logger.exception(f"AI usage flush of {len(batch)} records failed")
+            _buffer[:0] = batch
+            return
+        finally:
+            _writing = []
+
+        # Now part of the rollup: move them from pending to flushed in the quota totals
+        for record in batch:
+            totals = _totals.get((record.created_at.date(), record.user_id))
+            if totals is not None:
+                totals.pending_requests[record.provider] -= 1
+                totals.pending_tokens -= record.billable_tokens
+                totals.requests[record.provider] += 1
+                totals.tokens += record.billable_tokens
+
+
+def _prune_events():
+    cutoff = datetime.utcnow() - timedelta(days=AI_USAGE_EVENT_RETENTION_DAYS)
+    db = SessionLocal()
+    try:
+        deleted = db.query(AIUsageEvent).filter(AIUsageEvent.created_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    if deleted:
+        logger.info(f"Pruned {deleted} AI usage events older than {AI_USAGE_EVENT_RETENTION_DAYS} days")
+
+
+async def _run_flusher():
+    last_prune = 0.0
+    while True:
+        await asyncio.sleep(AI_USAGE_FLUSH_INTERVAL)
+        await flush_usage()
+        if AI_USAGE_EVENT_RETENTION_DAYS > 0 and time.monotonic() - last_prune > 3600:
+            last_prune = time.monotonic()
+            try:
+                await asyncio.to_thread(_prune_events)
+            except Exception:
+                logger.exception("AI usage event pruning failed")
+
+
+def start_usage_flusher():
+    """Flush the ledger periodically (app startup)"""
+    global _flusher_task
+    if _flusher_task is None:
+        _flusher_task = asyncio.get_running_loop().create_task(_run_flusher())
+
+
+async def stop_usage_flusher():
+    """Stop the schedule and write what is still buffered (app shutdown)"""
+    global _flusher_task
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+        _flusher_task = None
+    await flush_usage()
+
+
+# Reporting
+
+def _read_rollups(user_id: str, since: date) -> List[AIUsageDaily]:
+    db = SessionLocal()
+    try:
+        return db.query(AIUsageDaily).filter(
+            AIUsageDaily.user_id == user_id,
+            AIUsageDaily.day >= since
+        ).order_by(AIUsageDaily.day, AIUsageDaily.provider).all()
+    finally:
+        db.close()
+
+
+async def get_usage_summary(user_id: str, days: int = 1) -> Dict[date, Dict[str, dict]]:
+    """Per day and provider from the rollup, plus this worker's unflushed calls"""
+    since = _today() - timedelta(days=days - 1)
+    summary: Dict[date, Dict[str, dict]] = defaultdict(dict)
+
+    def bucket(day: date, provider: str) -> dict:
+        return summary[day].setdefault(provider, {
+            "requests": 0, "shared_requests": 0, "input_tokens": 0, "output_tokens": 0, "latency_ms_total": 0
+        })
+
+    for row in await asyncio.to_thread(_read_rollups, user_id, since):
+        totals = bucket(row.day, row.provider)
+        for column in totals:
+            totals[column] += getattr(row, column)
+    for record in _writing + _buffer:
+        if record.user_id == user_id and record.created_at.date() >= since:
+            totals = bucket(record.created_at.date(), record.provider)
+            totals["requests"] += 1
+            if record.source == SOURCE_UPSTREAM:
+                totals["input_tokens"] += record.input_tokens
+                totals["output_tokens"] += record.output_tokens
+            else:
+                totals["shared_requests"] += 1
+            totals["latency_ms_total"] += record.latency_ms
+    return summary
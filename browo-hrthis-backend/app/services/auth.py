@@ -6,14 +6,18 @@ Password hashing and JWT token management
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+import jwt as pyjwt
 import os
 from dotenv import load_dotenv
 
+from app.services.jwt_keys import ASYMMETRIC_ALGORITHMS, get_key_ring
+
 load_dotenv()
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-jwt-key-change-in-production")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")  # HS256, RS256 or EdDSA
+JWT_ISSUER = os.getenv("JWT_ISSUER", "hrthis-backend")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
 # Password hashing context
@@ -36,13 +40,41 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire})
+
+    if ALGORITHM in ASYMMETRIC_ALGORITHMS:
+        # Signed with the active private key; verifiers pick the public key by kid from the JWKS
+        signing_key = get_key_ring(ALGORITHM).active_key
+        to_encode.setdefault("iss", JWT_ISSUER)
+        return pyjwt.encode(
+            to_encode,
+            signing_key.private_key,
+            algorithm=ALGORITHM,
+            headers={"kid": signing_key.kid}
+        )
+
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def verify_token(token: str):
     """Verify and decode JWT token"""
+    if ALGORITHM in ASYMMETRIC_ALGORITHMS:
+        try:
+            kid = pyjwt.get_unverified_header(token).get("kid")
+            public_key = get_key_ring(ALGORITHM).get_public_key(kid)
+            if public_key is None:
+                return None
+            return pyjwt.decode(token, public_key, algorithms=[ALGORITHM], issuer=JWT_ISSUER)
+        except pyjwt.PyJWTError:
+            return None
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
     except JWTError:
-        return None
\ No newline at end of file
+        return None
+
+def get_jwks():
+    """Public JWKS document (body, etag) for asymmetric signing, None for HS256"""
+    if ALGORITHM not in ASYMMETRIC_ALGORITHMS:
+        return None
+    return get_key_ring(ALGORITHM).jwks()
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+File Encryption Service
+Chunked AES-256-GCM for confidential documents, following the STREAM
+construction: the plaintext is cut into fixed-size chunks and each chunk is
+sealed with the nonce (random prefix, chunk counter, last-chunk flag), so
+chunks cannot be reordered, dropped or truncated undetected, while any single
+chunk can still be decrypted on its own for range reads.
+Every file gets a random data key; only that key wrapped by the master key
+(FILE_ENCRYPTION_KEY) is stored, in FileMetadata.encrypted_key.
+"""
+
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import base64
+import hashlib
+import io
+import os
+import struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Configuration
+FILE_ENCRYPTION_KEY = os.getenv("FILE_ENCRYPTION_KEY", "")  # base64 of 32 bytes; unset = confidential files stay plaintext
+FILE_ENCRYPTION_OLD_KEYS = os.getenv("FILE_ENCRYPTION_OLD_KEYS", "")  # Comma-separated retired master keys (unwrap only)
+ENCRYPTION_CHUNK_SIZE = 64 * 1024
+
+# File layout: header, then chunks of ENCRYPTION_CHUNK_SIZE plaintext + tag. The
+# last chunk is the first one shorter than the chunk size (possibly empty).
+MAGIC = b"HRE1"
+TAG_SIZE = 16
+_HEADER = struct.Struct(">4sI7s")  # magic, chunk size, nonce prefix
+HEADER_SIZE = _HEADER.size
+_KEY_WRAP_AAD = b"hrthis-file-key"
+
+
+class DecryptionError(ValueError):
+    """Ciphertext was modified, truncated or belongs to another key"""
+
+
+def _key_id(key: bytes) -> str:
+    return hashlib.sha256(key).hexdigest()[:8]
+
+
+def _load_master_keys() -> Dict[str, bytes]:
+    keys = {}
+    for encoded in [FILE_ENCRYPTION_KEY] + FILE_ENCRYPTION_OLD_KEYS.split(","):
+        if not encoded.strip():
+            continue
+        key = base64.b64decode(encoded.strip())
+        if len(key) != 32:
+            raise ValueError("File encryption master keys must be 32 bytes, base64 encoded")
+        keys[_key_id(key)] = key
+    return keys
+
+
+_master_keys = _load_master_keys()
+_current_key_id: Optional[str] = _key_id(base64.b64decode(FILE_ENCRYPTION_KEY)) if FILE_ENCRYPTION_KEY else None
+
+
+def encryption_enabled() -> bool:
+    return _current_key_id is not None
+
+
+def new_data_key() -> Tuple[bytes, str]:
+    """Random per-file key and its wrapped form for storage ("<master key id>:<base64 nonce + sealed key>")"""
+    data_key = AESGCM.generate_key(bit_length=256)
+    nonce = os.urandom(12)
+    sealed = AESGCM(_master_keys[_current_key_id]).encrypt(nonce, data_key, _KEY_WRAP_AAD)
+    return data_key, f"{_current_key_id}:{base64.b64encode(nonce + sealed).decode()}"
+
+
+def unwrap_data_key(wrapped_key: str) -> bytes:
+    """Recover a file's data key with whichever configured master key wrapped it"""
+    key_id, _, payload = wrapped_key.partition(":")
+    master_key = _master_keys.get(key_id)
+    if master_key is None:
+        raise DecryptionError(f"Master key {key_id} is not configured")
+    raw = base64.b64decode(payload)
+    try:
+        return AESGCM(master_key).decrypt(raw[:12], raw[12:], _KEY_WRAP_AAD)
+    except InvalidTag:
+        raise DecryptionError("Data key could not be unwrapped")
+
+
+def encrypted_size(size: int, chunk_size: int = ENCRYPTION_CHUNK_SIZE) -> int:
+    """Bytes on disk for size bytes of plaintext"""
+    return HEADER_SIZE + size + (size // chunk_size + 1) * TAG_SIZE
+
+
+def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    return prefix + struct.pack(">IB", index, 1 if last else 0)
+
+
+def encrypt_file(source: Path, destination: Path, data_key: bytes, chunk_size: int = ENCRYPTION_CHUNK_SIZE) -> str:
+    """Encrypt source into destination one chunk at a time; returns the SHA-256 of the ciphertext"""
+    aead = AESGCM(data_key)
+    prefix = os.urandom(7)
+    header = _HEADER.pack(MAGIC, chunk_size, prefix)
+    hasher = hashlib.sha256(header)
+
+    with open(source, "rb") as plain, open(destination, "wb") as out:
+        out.write(header)
+        index = 0
+        while True:
+            chunk = plain.read(chunk_size)
+            last = len(chunk) < chunk_size
+            # The header is authenticated with every chunk, so it cannot be swapped either
+            sealed = aead.encrypt(_nonce(prefix, index, last), chunk, header)
+            out.write(sealed)
+            hasher.update(sealed)
+            if last:
+                break
+            index += 1
+
+    return hasher.hexdigest()
+
+
+class DecryptingReader(io.RawIOBase):
+    """
+    Seekable plaintext view of an encrypted file. Reads decrypt only the chunks
+    they touch, so a seek to any offset costs one chunk, not the bytes before it.
+    """
+
+    def __init__(self, path: Path, data_key: bytes):
+        self._file = open(path, "rb")
+        try:
+            self._header = self._file.read(HEADER_SIZE)
+            if len(self._header) != HEADER_SIZE:
+                raise DecryptionError("Encrypted file header is truncated")
+            magic, self.chunk_size, self._prefix = _HEADER.unpack(self._header)
+            if magic != MAGIC or self.chunk_size <= 0:
+                raise DecryptionError("Not an encrypted file")
+            stored = os.fstat(self._file.fileno()).st_size - HEADER_SIZE
+        except BaseException:
+            self._file.close()
+            raise
+        self._aead = AESGCM(data_key)
+        self.chunks = stored // (self.chunk_size + TAG_SIZE) + 1
+        self.size = max(stored - self.chunks * TAG_SIZE, 0)
+        self._position = 0
+        self._cached: Tuple[Optional[int], bytes] = (None, b"")
+        try:
+            # Only the last chunk carries the final flag: checking it up front catches truncation
+            self.read_chunk(self.chunks - 1)
+        except BaseException:
+            self._file.close()
+            raise
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.size}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def read_chunk(self, index: int) -> bytes:
+        """Decrypt and authenticate one chunk by its index"""
+        if self._cached[0] == index:
+            return self._cached[1]
+        self._file.seek(HEADER_SIZE + index * (self.chunk_size + TAG_SIZE))
+        sealed = self._file.read(self.chunk_size + TAG_SIZE)
+        try:
+            plain = self._aead.decrypt(_nonce(self._prefix, index, index == self.chunks - 1), sealed, self._header)
+        except InvalidTag:
+            raise DecryptionError(f"Chunk {index} failed authentication")
+        self._cached = (index, plain)
+        return plain
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.size - self._position
+        if size is not None and size >= 0:
+            remaining = min(size, remaining)
+        parts = []
+        while remaining > 0:
+            index, offset = divmod(self._position, self.chunk_size)
+            piece = self.read_chunk(index)[offset:offset + remaining]
+            if not piece:
+                raise DecryptionError(f"Chunk {index} is shorter than expected")
+            parts.append(piece)
+            self._position += len(piece)
+            remaining -= len(piece)
+        return b"".join(parts)
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
@@ -0,0 +1,220 @@
+"""
+File Search Service
+Full-text search over filename, description, tags and extracted text.
+SQLite uses an external-content FTS5 table kept in sync by triggers, PostgreSQL
+a GIN expression index; both are maintained incrementally by the database
+itself, so extraction write-backs become searchable on commit.
+"""
+
+from typing import Dict, List, Optional
+import html
+import logging
+import os
+import re
+
+from sqlalchemy import Float, Integer, String, literal, literal_column, or_, text, true
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models.employee import Employee
+from app.models.file import FileMetadata
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SEARCH_TEXT_CONFIG = os.getenv("SEARCH_TEXT_CONFIG", "simple")  # PostgreSQL text search configuration
+SEARCH_MAX_TERMS = 16
+SEARCH_SNIPPET_TOKENS = 16
+
+# Relevance weights: a hit in the filename counts more than one deep in the body
+WEIGHT_FILENAME, WEIGHT_DESCRIPTION, WEIGHT_TAGS, WEIGHT_BODY = 10.0, 4.0, 4.0, 1.0
+
+# Snippet markers are control characters so the document text can be HTML-escaped safely
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+# PostgreSQL: tsvector is capped at 1MB, so only the head of very long documents is indexed
+_PG_DOCUMENT = (
+    "setweight(to_tsvector(CAST(:config AS regconfig), coalesce(filename, '')), 'A') || "
+    "setweight(to_tsvector(CAST(:config AS regconfig), coalesce(description, '') || ' ' || coalesce(tags, '')), 'B') || "
+    "setweight(to_tsvector(CAST(:config AS regconfig), left(coalesce(extracted_text, ''), 200000)), 'D')"
+)
+
+_SQLITE_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS file_search USING fts5(
+        filename, description, tags, extracted_text,
+        content='file_metadata', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS file_search_ai AFTER INSERT ON file_metadata BEGIN
+        INSERT INTO file_search(rowid, filename, description, tags, extracted_text)
+        VALUES (new.rowid, new.filename, new.description, new.tags, new.extracted_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS file_search_ad AFTER DELETE ON file_metadata BEGIN
+        INSERT INTO file_search(file_search, rowid, filename, description, tags, extracted_text)
+        VALUES ('delete', old.rowid, old.filename, old.description, old.tags, old.extracted_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS file_search_au AFTER UPDATE OF filename, description, tags, extracted_text ON file_metadata BEGIN
+        INSERT INTO file_search(file_search, rowid, filename, description, tags, extracted_text)
+        VALUES ('delete', old.rowid, old.filename, old.description, old.tags, old.extracted_text);
+        INSERT INTO file_search(rowid, filename, description, tags, extracted_text)
+        VALUES (new.rowid, new.filename, new.description, new.tags, new.extracted_text);
+    END""",
+]
+
+
+def ensure_search_index(engine: Engine):
+    """Create the full-text index (idempotent, called from create_tables)"""
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_search'"
+            )).first()
+            for statement in _SQLITE_SCHEMA:
+                conn.execute(text(statement))
+            if not exists:
+                # Index rows that were uploaded before the search table existed
+                conn.execute(text("INSERT INTO file_search(file_search) VALUES ('rebuild')"))
+                logger.info("Built file_search FTS5 index")
+        elif dialect == "postgresql":
+            document = _PG_DOCUMENT.replace(":config", f"'{SEARCH_TEXT_CONFIG}'")
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_file_metadata_search ON file_metadata USING GIN (({document}))"
+            ))
+
+
+def rebuild_search_index(engine: Engine):
+    """
+    Re-index every document. The SQLite index is keyed by file_metadata's rowid,
+    which VACUUM may renumber, so run this after vacuuming the database.
+    """
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO file_search(file_search) VALUES ('rebuild')"))
+
+
+def _terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query, re.UNICODE)[:SEARCH_MAX_TERMS]
+
+
+def _match_expression(terms: List[str], dialect: str) -> str:
+    """Turn free text into an AND of (prefix) terms; user input never reaches the query parser raw"""
+    if dialect == "postgresql":
+        return " & ".join(f"{term}:*" if len(term) >= 3 else term for term in terms)
+    return " ".join(f'"{term}"*' if len(term) >= 3 else f'"{term}"' for term in terms)
+
+
+def visibility_filter(current_user: Employee):
+    """Confidential documents are only visible to admins, their employee and their uploader"""
+    if current_user.is_admin:
+        return true()
+    return or_(
+        FileMetadata.is_confidential.is_(None),
+        FileMetadata.is_confidential.in_(("0", "false", "False", "")),
+        FileMetadata.employee_id == current_user.id,
+        FileMetadata.uploaded_by == current_user.id
+    )
+
+
+def ranked_matches(db: Session, query: str):
+    """
+    Subquery of (file_id or file_rowid, score) for documents matching query,
+    higher score is more relevant; join it with ranked_join_condition().
+    Returns None when the query has no searchable terms.
+    """
+    terms = _terms(query)
+    if not terms:
+        return None
+
+    dialect = db.get_bind().dialect.name
+    match = _match_expression(terms, dialect)
+
+    if dialect == "sqlite":
+        # Keyed by rowid: joining back through the string primary key doubles the lookups
+        return text(
+            "SELECT rowid AS file_rowid, "
+            f"-bm25(file_search, {WEIGHT_FILENAME}, {WEIGHT_DESCRIPTION}, {WEIGHT_TAGS}, {WEIGHT_BODY}) AS score "
+            "FROM file_search WHERE file_search MATCH :match"
+        ).bindparams(match=match).columns(file_rowid=Integer, score=Float).subquery()
+    elif dialect == "postgresql":
+        statement = text(
+            f"SELECT id AS file_id, ts_rank_cd({_PG_DOCUMENT}, to_tsquery(CAST(:config AS regconfig), :match)) AS score "
+            f"FROM file_metadata WHERE ({_PG_DOCUMENT}) @@ to_tsquery(CAST(:config AS regconfig), :match)"
+        ).bindparams(match=match, config=SEARCH_TEXT_CONFIG)
+    else:
+        # No full-text support: unranked substring match
+        pattern = f"%{query.strip()}%"
+        columns = (FileMetadata.filename, FileMetadata.description, FileMetadata.tags, FileMetadata.extracted_text)
+        return db.query(
+            FileMetadata.id.label("file_id"), literal(1.0).label("score")
+        ).filter(or_(*(column.ilike(pattern) for column in columns))).subquery()
+
+    return statement.columns(file_id=String, score=Float).subquery()
+
+
+def ranked_join_condition(ranked):
+    """ON clause joining FileMetadata to a ranked_matches() subquery"""
+    if "file_rowid" in ranked.c:
+        return ranked.c.file_rowid == literal_column("file_metadata.rowid")
+    return ranked.c.file_id == FileMetadata.id
+
+
+def _render_snippet(raw: Optional[str]) -> Optional[str]:
+    if not raw:
+        return None
+    escaped = html.escape(raw.replace("\n", " "))
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def snippets(db: Session, query: str, file_ids: List[str]) -> Dict[str, str]:
+    """Highlighted excerpts for one page of hits (computed after ranking and paging)"""
+    terms = _terms(query)
+    if not terms or not file_ids:
+        return {}
+
+    dialect = db.get_bind().dialect.name
+    match = _match_expression(terms, dialect)
+    params = {"match": match, "start": _MARK_START, "end": _MARK_END}
+    placeholders = ", ".join(f":id{i}" for i in range(len(file_ids)))
+    params.update({f"id{i}": file_id for i, file_id in enumerate(file_ids)})
+
+    if dialect == "sqlite":
+        rows = db.execute(text(
+            f"SELECT file_metadata.id, snippet(file_search, -1, :start, :end, '…', {SEARCH_SNIPPET_TOKENS}) "
+            "FROM file_search JOIN file_metadata ON file_metadata.rowid = file_search.rowid "
+            f"WHERE file_search MATCH :match AND file_metadata.id IN ({placeholders})"
+        ), params)
+    elif dialect == "postgresql":
+        params["config"] = SEARCH_TEXT_CONFIG
+        rows = db.execute(text(
+            "SELECT id, ts_headline(CAST(:config AS regconfig), "
+            "coalesce(description, '') || ' ' || left(coalesce(extracted_text, ''), 200000), "
+            "to_tsquery(CAST(:config AS regconfig), :match), "
+            f"'StartSel=' || :start || ', StopSel=' || :end || ', MaxWords={SEARCH_SNIPPET_TOKENS * 2}, MinWords=5, MaxFragments=2') "
+            f"FROM file_metadata WHERE id IN ({placeholders})"
+        ), params)
+    else:
+        return {}
+
+    return {file_id: _render_snippet(raw) for file_id, raw in rows}
+
+
+def search_files(db: Session, query: str, current_user: Employee, filters=None, limit: int = 20, offset: int = 0):
+    """Ranked, access-filtered hits as (FileMetadata, score, snippet) tuples"""
+    ranked = ranked_matches(db, query)
+    if ranked is None:
+        return []
+
+    # Rank and page on ids only; sorting full rows would drag every match's text through the sorter
+    q = db.query(FileMetadata.id, ranked.c.score).join(ranked, ranked_join_condition(ranked))
+    q = q.filter(visibility_filter(current_user))
+    for condition in filters or ():
+        q = q.filter(condition)
+    page = q.order_by(ranked.c.score.desc(), FileMetadata.id).offset(offset).limit(limit).all()
+    if not page:
+        return []
+
+    ids = [file_id for file_id, _ in page]
+    files = {f.id: f for f in db.query(FileMetadata).filter(FileMetadata.id.in_(ids))}
+    excerpts = snippets(db, query, ids)
+    return [(files[file_id], float(score), excerpts.get(file_id)) for file_id, score in page if file_id in files]
@@ -0,0 +1,187 @@
+"""
+File Statistics Service
+Per-category and per-employee file counts and bytes, kept in the file_stats
+summary table. Every upload, delete and re-filing adjusts the affected
+buckets inside its own transaction, so the storage dashboard reads a handful
+of rows instead of aggregating file_metadata; reconcile_file_stats()
+recomputes the table from scratch to repair any drift. Blob storage is counted
+per codec the same way (original and on-disk bytes) for the compression ratio.
+"""
+
+from typing import Dict, List, Optional
+import logging
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.file import FileBlob, FileCategory, FileMetadata, FileStatsBucket
+
+logger = logging.getLogger(__name__)
+
+CATEGORY = "category"
+EMPLOYEE = "employee"
+BLOB_STORED = "blob_stored"      # Per codec: blobs and bytes on disk
+BLOB_ORIGINAL = "blob_original"  # Per codec: blobs and bytes before encoding
+
+
+def _category_key(category) -> str:
+    if isinstance(category, FileCategory):
+        return category.value
+    return category or FileCategory.OTHER.value
+
+
+def _bump(db: Session, dimension: str, key: str, files: int, size: int):
+    """Atomically add to one bucket, creating it on first use"""
+    for _ in range(2):
+        updated = db.query(FileStatsBucket).filter(
+            FileStatsBucket.dimension == dimension,
+            FileStatsBucket.key == key
+        ).update({
+            FileStatsBucket.file_count: FileStatsBucket.file_count + files,
+            FileStatsBucket.total_bytes: FileStatsBucket.total_bytes + size
+        }, synchronize_session=False)
+        if updated:
+            return
+        try:
+            with db.begin_nested():
+                db.add(FileStatsBucket(dimension=dimension, key=key, file_count=files, total_bytes=size))
+            return
+        except IntegrityError:
+            # Created concurrently; the update will find it now
+            continue
+    raise RuntimeError(f"Could not update file stats bucket {dimension}:{key}")
+
+
+def record_file_added(db: Session, category, employee_id: Optional[str], size: int):
+    """Count a new file (within the caller's transaction)"""
+    _bump(db, CATEGORY, _category_key(category), 1, size)
+    _bump(db, EMPLOYEE, employee_id or "", 1, size)
+
+
+def record_file_removed(db: Session, category, employee_id: Optional[str], size: int):
+    """Uncount a deleted file (within the caller's transaction)"""
+    _bump(db, CATEGORY, _category_key(category), -1, -size)
+    _bump(db, EMPLOYEE, employee_id or "", -1, -size)
+
+
+def record_file_moved(db: Session, old_category, old_employee_id: Optional[str],
+                      new_category, new_employee_id: Optional[str], size: int):
+    """Move a re-filed file between buckets (within the caller's transaction)"""
+    if _category_key(old_category) != _category_key(new_category):
+        _bump(db, CATEGORY, _category_key(old_category), -1, -size)
+        _bump(db, CATEGORY, _category_key(new_category), 1, size)
+    if (old_employee_id or "") != (new_employee_id or ""):
+        _bump(db, EMPLOYEE, old_employee_id or "", -1, -size)
+        _bump(db, EMPLOYEE, new_employee_id or "", 1, size)
+
+
+def record_blob_added(db: Session, codec: Optional[str], size: int, stored_size: Optional[int]):
+    """Count a newly written blob (within the caller's transaction)"""
+    _bump(db, BLOB_STORED, codec or "identity", 1, stored_size or size)
+    _bump(db, BLOB_ORIGINAL, codec or "identity", 1, size)
+
+
+def record_blob_removed(db: Session, codec: Optional[str], size: int, stored_size: Optional[int]):
+    """Uncount a deleted blob (within the caller's transaction)"""
+    _bump(db, BLOB_STORED, codec or "identity", -1, -(stored_size or size))
+    _bump(db, BLOB_ORIGINAL, codec or "identity", -1, -size)
+
+
+def _bucket_summary(file_count: int, total_bytes: int) -> dict:
+    return {"files": file_count, "size_mb": round(total_bytes / (1024 * 1024), 2)}
+
+
+def get_file_stats(db: Session, recent: int = 10) -> dict:
+    """Totals from the summary table plus the newest uploads (served by the uploaded_at index)"""
+    by_category: Dict[str, dict] = {}
+    by_employee: Dict[str, dict] = {}
+    blobs_by_codec: Dict[str, dict] = {}
+    total_files = total_bytes = stored_bytes = original_bytes = 0
+
+    for bucket in db.query(FileStatsBucket).filter(FileStatsBucket.file_count > 0):
+        summary = _bucket_summary(bucket.file_count, bucket.total_bytes)
+        if bucket.dimension == CATEGORY:
+            by_category[bucket.key] = summary
+            total_files += bucket.file_count
+            total_bytes += bucket.total_bytes
+        elif bucket.dimension == EMPLOYEE:
+            by_employee[bucket.key or "unassigned"] = summary
+        elif bucket.dimension == BLOB_STORED:
+            blobs_by_codec[bucket.key] = summary
+            stored_bytes += bucket.total_bytes
+        elif bucket.dimension == BLOB_ORIGINAL:
+            original_bytes += bucket.total_bytes
+
+    recent_uploads: List[FileMetadata] = db.query(FileMetadata).order_by(
+        FileMetadata.uploaded_at.desc(), FileMetadata.id.desc()
+    ).limit(recent).all()
+
+    return {
+        "total_files": total_files,
+        "total_size_mb": round(total_bytes / (1024 * 1024), 2),
+        "files_by_category": by_category,
+        "files_by_employee": by_employee,
+        "stored_size_mb": round(stored_bytes / (1024 * 1024), 2),
+        "compression_ratio": round(original_bytes / stored_bytes, 2) if stored_bytes else None,
+        "blobs_by_codec": blobs_by_codec,
+        "recent_uploads": recent_uploads
+    }
+
+
+def reconcile_file_stats(db: Session) -> dict:
+    """
+    Rebuild the summary table from file_metadata and file_blobs in one transaction and report
+    how far the incremental counters had drifted. On PostgreSQL the table is
+    locked first so uploads committing meanwhile are neither lost nor counted twice.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE file_stats IN EXCLUSIVE MODE"))
+
+    previous = {
+        (bucket.dimension, bucket.key): (bucket.file_count, bucket.total_bytes)
+        for bucket in db.query(FileStatsBucket)
+    }
+
+    actual = {}
+    for category, count, size in db.query(
+        FileMetadata.category, func.count(FileMetadata.id), func.coalesce(func.sum(FileMetadata.file_size), 0)
+    ).group_by(FileMetadata.category):
+        actual[(CATEGORY, _category_key(category))] = (count, int(size))
+    for employee_id, count, size in db.query(
+        FileMetadata.employee_id, func.count(FileMetadata.id), func.coalesce(func.sum(FileMetadata.file_size), 0)
+    ).group_by(FileMetadata.employee_id):
+        actual[(EMPLOYEE, employee_id or "")] = (count, int(size))
+    for codec, count, size, stored_size in db.query(
+        FileBlob.codec, func.count(FileBlob.sha256), func.coalesce(func.sum(FileBlob.file_size), 0),
+        func.coalesce(func.sum(func.coalesce(FileBlob.stored_size, FileBlob.file_size)), 0)
+    ).group_by(FileBlob.codec):
+        for dimension, total in ((BLOB_STORED, stored_size), (BLOB_ORIGINAL, size)):
+            key = (dimension, codec or "identity")
+            previous_count, previous_total = actual.get(key, (0, 0))
+            actual[key] = (previous_count + count, previous_total + int(total))
+
+    drifted = [key for key in set(previous) | set(actual) if previous.get(key, (0, 0)) != actual.get(key, (0, 0))]
+
+    db.query(FileStatsBucket).delete(synchronize_session=False)
+    db.add_all(
+        FileStatsBucket(dimension=dimension, key=key, file_count=count, total_bytes=size)
+        for (dimension, key), (count, size) in actual.items()
+    )
+    db.commit()
+
+    if drifted:
+        logger.warning(f"File stats reconciled, {len(drifted)} buckets had drifted")
+    return {"buckets": len(actual), "drifted": len(drifted)}
+
+
+def _has_buckets(db: Session, dimension: str) -> bool:
+    return db.query(FileStatsBucket.key).filter(FileStatsBucket.dimension == dimension).first() is not None
+
+
+def ensure_file_stats(db: Session):
+    """Build the summary table once for databases that predate it or its blob buckets (app startup)"""
+    files_missing = not _has_buckets(db, CATEGORY) and db.query(FileMetadata.id).first() is not None
+    blobs_missing = not _has_buckets(db, BLOB_STORED) and db.query(FileBlob.sha256).first() is not None
+    if files_missing or blobs_missing:
+        reconcile_file_stats(db)
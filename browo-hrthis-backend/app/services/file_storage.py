@@ -0,0 +1,498 @@
+"""
+File Storage Service
+Streaming upload pipeline and content-addressed blob storage.
+Uploads are hashed while streaming to a staging file, then either dropped
+(duplicate content) or moved to blobs/ab/cd/<sha256>. FileBlob.ref_count tracks
+how many metadata rows share a blob; unreferenced blobs are reclaimed by
+collect_unreferenced_blobs.
+New blobs can be zstd-compressed at rest (FILE_COMPRESSION=zstd), confidential
+files are encrypted (aesgcm, see file_encryption); the codec is recorded on the
+blob and its metadata rows, and readers decode while streaming.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from fastapi import UploadFile
+from pathlib import Path
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import BinaryIO, Iterator, Optional
+import aiofiles
+import aiofiles.os
+import hashlib
+import logging
+import magic
+import os
+import shutil
+import uuid
+
+try:
+    import zstandard
+except ImportError:  # Optional: compression at rest stays off without it
+    zstandard = None
+
+from app.models.file import FileBlob
+from app.services.file_encryption import DecryptingReader, encrypt_file, encryption_enabled, new_data_key, unwrap_data_key
+from app.services.file_stats import record_blob_added, record_blob_removed
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024  # 1MB read/write buffer
+
+# Storage layout
+UPLOAD_DIR = Path("./uploads")
+STAGING_DIR = UPLOAD_DIR / "tmp"
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+
+# Compression at rest
+FILE_COMPRESSION = os.getenv("FILE_COMPRESSION", "none").lower()  # none | zstd
+FILE_COMPRESSION_LEVEL = int(os.getenv("FILE_COMPRESSION_LEVEL", "3"))
+FILE_COMPRESSION_MIN_SAVINGS = float(os.getenv("FILE_COMPRESSION_MIN_SAVINGS", "0.1"))  # Fraction that must be saved
+COMPRESSION_MIN_SIZE = 4096  # Smaller files are not worth a frame header
+
+CODEC_IDENTITY = "identity"
+CODEC_ZSTD = "zstd"
+CODEC_AESGCM = "aesgcm"
+
+# Formats that are compressed already; zstd would only burn CPU on them
+INCOMPRESSIBLE_MIME_TYPES = {
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "application/zip",
+    "application/gzip",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+
+class FileTooLargeError(ValueError):
+    """Upload exceeded the configured size limit"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds maximum size of {max_size} bytes")
+        self.max_size = max_size
+
+
+@dataclass
+class StoredUpload:
+    """Result of streaming an upload to disk"""
+    path: Path
+    size: int
+    sha256: str
+    mime_type: str
+    codec: str = CODEC_IDENTITY
+    stored_size: Optional[int] = None  # Bytes on disk when encoded
+    wrapped_key: Optional[str] = None  # Data key of an encrypted file, wrapped by the master key
+
+
+async def stream_upload_to_disk(upload: UploadFile, destination: Path, max_size: int) -> StoredUpload:
+    """
+    Copy an upload to destination in CHUNK_SIZE pieces. The size limit is
+    enforced as bytes arrive (never trusting upload.size), the MIME type is
+    sniffed from the first buffer and the hash is computed on the same pass.
+    Data goes to a .part file that is renamed into place only on success.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    mime_type = None
+    part_path = destination.with_name(destination.name + ".part")
+
+    try:
+        async with aiofiles.open(part_path, "wb") as out:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+
+                if mime_type is None:
+                    mime_type = magic.from_buffer(chunk, mime=True)
+
+                hasher.update(chunk)
+                await out.write(chunk)
+
+        await aiofiles.os.replace(part_path, destination)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(part_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return StoredUpload(
+        path=destination,
+        size=size,
+        sha256=hasher.hexdigest(),
+        mime_type=mime_type or "application/x-empty"
+    )
+
+
+def stage_file(source: BinaryIO, max_size: int) -> StoredUpload:
+    """
+    Blocking counterpart of stage_upload for an upload the server has already
+    received (run in a threadpool). hashlib and file I/O release the GIL, so
+    several uploads stage in parallel.
+    """
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    destination = STAGING_DIR / uuid.uuid4().hex
+    part_path = destination.with_name(destination.name + ".part")
+    hasher = hashlib.sha256()
+    size = 0
+    mime_type = None
+
+    try:
+        with open(part_path, "wb") as out:
+            while chunk := source.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+                if mime_type is None:
+                    mime_type = magic.from_buffer(chunk, mime=True)
+                hasher.update(chunk)
+                out.write(chunk)
+        os.replace(part_path, destination)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+
+    return StoredUpload(
+        path=destination,
+        size=size,
+        sha256=hasher.hexdigest(),
+        mime_type=mime_type or "application/x-empty"
+    )
+
+
+def describe_file(path: Path) -> StoredUpload:
+    """Hash and sniff a file already on disk (blocking; run in a threadpool)"""
+    hasher = hashlib.sha256()
+    size = 0
+    mime_type = None
+
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if mime_type is None:
+                mime_type = magic.from_buffer(chunk, mime=True)
+            size += len(chunk)
+            hasher.update(chunk)
+
+    return StoredUpload(
+        path=path,
+        size=size,
+        sha256=hasher.hexdigest(),
+        mime_type=mime_type or "application/x-empty"
+    )
+
+
+class LocalFileStore:
+    """
+    Local disk storage. Blobs live in a two-level hashed tree (blobs/ab/cd/<sha256>),
+    so no directory grows beyond a few hundred entries however many files are
+    stored. Readers resolve paths through the store, which also finds a blob
+    that the layout migration moved but whose row still names the old path.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.blob_dir = root / "blobs"
+
+    def blob_path(self, sha256: str) -> Path:
+        """Sharded location of the blob for a content hash"""
+        return self.blob_dir / sha256[:2] / sha256[2:4] / sha256
+
+    def resolve(self, file_path: str, file_hash: Optional[str] = None) -> Path:
+        """On-disk location of a stored file (may not exist if the file is gone)"""
+        path = Path(file_path)
+        if file_hash and not path.exists():
+            sharded = self.blob_path(file_hash)
+            if sharded.exists():
+                return sharded
+        return path
+
+    def is_sharded(self, path: str, sha256: str) -> bool:
+        return Path(path) == self.blob_path(sha256)
+
+
+file_store = LocalFileStore(UPLOAD_DIR)
+
+
+def blob_path(sha256: str) -> Path:
+    """Location of the blob for a content hash"""
+    return file_store.blob_path(sha256)
+
+
+def should_compress(mime_type: str) -> bool:
+    """Whether new blobs of this type are compressed at rest"""
+    if FILE_COMPRESSION != CODEC_ZSTD or zstandard is None:
+        return False
+    return mime_type not in INCOMPRESSIBLE_MIME_TYPES and not mime_type.startswith(("video/", "audio/"))
+
+
+def compress_staged(stored: StoredUpload) -> StoredUpload:
+    """
+    Re-encode a staged upload with zstd when that saves at least
+    FILE_COMPRESSION_MIN_SAVINGS (blocking; run in a threadpool). The first
+    chunk is compressed as a probe, so incompressible content such as scanned
+    PDFs costs one chunk of CPU rather than a pass over the whole file.
+    """
+    if stored.codec != CODEC_IDENTITY or stored.size < COMPRESSION_MIN_SIZE or not should_compress(stored.mime_type):
+        return stored
+
+    compressor = zstandard.ZstdCompressor(level=FILE_COMPRESSION_LEVEL)
+    max_ratio = 1 - FILE_COMPRESSION_MIN_SAVINGS
+    with open(stored.path, "rb") as source:
+        probe = source.read(CHUNK_SIZE)
+    if len(compressor.compress(probe)) > len(probe) * max_ratio:
+        return stored
+
+    part_path = stored.path.with_name(stored.path.name + ".zst")
+    try:
+        with open(stored.path, "rb") as source, open(part_path, "wb") as out:
+            compressor.copy_stream(source, out, size=stored.size, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+        stored_size = part_path.stat().st_size
+        if stored_size > stored.size * max_ratio:
+            part_path.unlink()
+            return stored
+        os.replace(part_path, stored.path)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+
+    stored.codec = CODEC_ZSTD
+    stored.stored_size = stored_size
+    return stored
+
+
+def encrypt_staged(stored: StoredUpload) -> StoredUpload:
+    """
+    Replace a staged upload with its encryption under a fresh data key
+    (blocking; run in a threadpool). The blob is then keyed by the ciphertext
+    hash, so an encrypted file never shares storage with any other file.
+    """
+    data_key, wrapped_key = new_data_key()
+    part_path = stored.path.with_name(stored.path.name + ".enc")
+    try:
+        sha256 = encrypt_file(stored.path, part_path, data_key)
+        stored_size = part_path.stat().st_size
+        os.replace(part_path, stored.path)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+
+    stored.sha256 = sha256
+    stored.codec = CODEC_AESGCM
+    stored.stored_size = stored_size
+    stored.wrapped_key = wrapped_key
+    return stored
+
+
+def encode_staged(stored: StoredUpload, confidential: bool = False, already_stored: bool = False) -> StoredUpload:
+    """
+    Encrypt a confidential upload (when a master key is configured), otherwise
+    compress it unless its content is stored already (a duplicate is dropped
+    anyway). Blocking and without database access, so uploads can be encoded in parallel.
+    """
+    if confidential and encryption_enabled():
+        return encrypt_staged(stored)
+    if not already_stored:
+        compress_staged(stored)
+    return stored
+
+
+def encode_for_storage(db: Session, stored: StoredUpload, confidential: bool = False) -> StoredUpload:
+    """encode_staged() for one upload, looking up whether its content is stored already"""
+    already_stored = should_compress(stored.mime_type) and db.get(FileBlob, stored.sha256) is not None
+    return encode_staged(stored, confidential, already_stored)
+
+
+def open_stored(path: Path, codec: Optional[str], wrapped_key: Optional[str] = None) -> BinaryIO:
+    """Readable stream of a stored file's original bytes, decoded on the fly"""
+    if codec == CODEC_AESGCM:
+        return DecryptingReader(path, unwrap_data_key(wrapped_key))
+    source = open(path, "rb")
+    if not codec or codec == CODEC_IDENTITY:
+        return source
+    if codec == CODEC_ZSTD and zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(source, read_size=CHUNK_SIZE, closefd=True)
+    source.close()
+    raise RuntimeError(f"Cannot decode stored file {path.name}: codec {codec} unavailable")
+
+
+def iter_stored(path: Path, codec: Optional[str], start: int = 0, length: Optional[int] = None,
+                wrapped_key: Optional[str] = None, chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    """
+    Original bytes [start, start + length) in chunks with constant memory.
+    Encrypted files seek straight to the chunk holding start; compressed files
+    have no random access and are decoded from the beginning instead.
+    """
+    with open_stored(path, codec, wrapped_key) as reader:
+        if start:
+            reader.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = reader.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+@contextmanager
+def materialized(path: Path, codec: Optional[str], directory: Optional[Path] = None,
+                 wrapped_key: Optional[str] = None) -> Iterator[Path]:
+    """
+    Plain file with the original bytes for tools that need a path. Encoded
+    files are decoded to an owner-only temp file that is removed on exit.
+    """
+    if not codec or codec == CODEC_IDENTITY:
+        yield path
+        return
+
+    directory = directory or STAGING_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    plain = directory / f"{uuid.uuid4().hex}{path.suffix}"
+    try:
+        with open_stored(path, codec, wrapped_key) as reader, \
+                open(os.open(plain, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as out:
+            shutil.copyfileobj(reader, out, CHUNK_SIZE)
+        yield plain
+    finally:
+        plain.unlink(missing_ok=True)
+
+
+async def stage_upload(upload: UploadFile, max_size: int) -> StoredUpload:
+    """Stream an upload into the staging area (hash is unknown until the end)"""
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    return await stream_upload_to_disk(upload, STAGING_DIR / uuid.uuid4().hex, max_size)
+
+
+def acquire_blob(db: Session, stored: StoredUpload) -> tuple:
+    """
+    Take a reference on the blob for a staged upload, creating it if needed.
+    Runs inside the caller's transaction; the caller commits together with
+    the FileMetadata row. Returns (blob, deduplicated).
+    """
+    path = blob_path(stored.sha256)
+    for _ in range(2):
+        updated = db.query(FileBlob).filter(FileBlob.sha256 == stored.sha256).update(
+            {FileBlob.ref_count: FileBlob.ref_count + 1, FileBlob.updated_at: datetime.utcnow()},
+            synchronize_session=False
+        )
+        if updated:
+            # Same content already stored: the staged copy is redundant
+            if stored.path != path:
+                stored.path.unlink(missing_ok=True)
+            blob = db.get(FileBlob, stored.sha256)
+            db.refresh(blob)
+            stored.path = Path(blob.file_path)
+            return blob, True
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(stored.path, path)
+        stored.path = path
+
+        blob = FileBlob(
+            sha256=stored.sha256,
+            file_path=str(path),
+            file_size=stored.size,
+            codec=stored.codec,
+            stored_size=stored.stored_size or stored.size,
+            ref_count=1
+        )
+        try:
+            with db.begin_nested():
+                db.add(blob)
+            record_blob_added(db, blob.codec, blob.file_size, blob.stored_size)
+            return blob, False
+        except IntegrityError:
+            # A concurrent upload created the blob first; take a reference on theirs
+            logger.info(f"Blob {stored.sha256[:12]} created concurrently, retrying as duplicate")
+
+    raise RuntimeError(f"Could not acquire blob {stored.sha256}")
+
+
+def release_blob(db: Session, sha256: str) -> bool:
+    """Drop one reference (within the caller's transaction); False if no blob exists"""
+    updated = db.query(FileBlob).filter(
+        FileBlob.sha256 == sha256,
+        FileBlob.ref_count > 0
+    ).update(
+        {FileBlob.ref_count: FileBlob.ref_count - 1, FileBlob.updated_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    return bool(updated)
+
+
+def delete_unreferenced_blob(db: Session, sha256: str, file_path: str) -> Optional[int]:
+    """
+    Delete one blob if it is still unreferenced; returns the bytes freed, or
+    None when a concurrent upload re-referenced it. The file is first renamed
+    aside, then the row is deleted only if ref_count is still zero; if that
+    delete matches nothing the file is restored. Commits.
+    """
+    from app.services.thumbnails import purge_derivatives
+
+    path = Path(file_path)
+    doomed = path.with_name(path.name + ".gc")
+    try:
+        os.replace(path, doomed)
+    except FileNotFoundError:
+        doomed = None
+
+    blob = db.query(FileBlob.codec, FileBlob.file_size, FileBlob.stored_size).filter(FileBlob.sha256 == sha256).first()
+    deleted = db.query(FileBlob).filter(
+        FileBlob.sha256 == sha256,
+        FileBlob.ref_count <= 0
+    ).delete(synchronize_session=False)
+    if deleted:
+        record_blob_removed(db, blob.codec, blob.file_size, blob.stored_size)
+    db.commit()
+
+    if not deleted:
+        if doomed is not None:
+            if path.exists():
+                doomed.unlink()
+            else:
+                os.replace(doomed, path)
+        return None
+
+    freed = 0
+    if doomed is not None:
+        freed = doomed.stat().st_size
+        doomed.unlink()
+    purge_derivatives(sha256)
+    return freed
+
+
+def collect_unreferenced_blobs(db: Session, grace_seconds: int = BLOB_GC_GRACE_SECONDS, limit: int = 1000) -> dict:
+    """Delete blobs whose ref_count dropped to zero more than grace_seconds ago"""
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    candidates = db.query(FileBlob.sha256, FileBlob.file_path).filter(
+        FileBlob.ref_count <= 0,
+        FileBlob.updated_at < cutoff
+    ).limit(limit).all()
+
+    stats = {"scanned": len(candidates), "deleted": 0, "bytes_freed": 0, "skipped": 0}
+    for sha256, file_path in candidates:
+        freed = delete_unreferenced_blob(db, sha256, file_path)
+        if freed is None:
+            stats["skipped"] += 1
+        else:
+            stats["deleted"] += 1
+            stats["bytes_freed"] += freed
+
+    logger.info(f"Blob GC: {stats}")
+    return stats
@@ -0,0 +1,237 @@
+"""
+JWT Signing Keys
+Asymmetric key ring (RS256 / EdDSA) with rotation and a cached JWKS document
+"""
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+from pathlib import Path
+from typing import Dict, List, Optional
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+JWT_KEYS_DIR = Path(os.getenv("JWT_KEYS_DIR", "./keys"))
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")  # Defaults to the newest key past the activation delay
+JWT_KEYS_RELOAD_SECONDS = int(os.getenv("JWT_KEYS_RELOAD_SECONDS", "60"))
+JWT_KEYS_MISS_RELOAD_SECONDS = int(os.getenv("JWT_KEYS_MISS_RELOAD_SECONDS", "5"))  # Min gap between reloads forced by unknown kids
+JWKS_MAX_AGE_SECONDS = int(os.getenv("JWKS_MAX_AGE_SECONDS", "300"))
+# New keys are published this long before they sign, so cached JWKS copies (max-age + stale-while-revalidate) know them
+JWT_KEY_ACTIVATION_DELAY_SECONDS = int(os.getenv("JWT_KEY_ACTIVATION_DELAY_SECONDS", str(JWKS_MAX_AGE_SECONDS + 60)))
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "EdDSA"}
+
+
+class SigningKey:
+    """A private key loaded from disk together with its public JWK"""
+
+    def __init__(self, kid: str, algorithm: str, private_key, created_at: float):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.created_at = created_at
+
+    def to_jwk(self) -> dict:
+        """Public part of the key as a JWK dict"""
+        if self.algorithm == "EdDSA":
+            jwk = OKPAlgorithm.to_jwk(self.public_key, as_dict=True)
+        else:
+            jwk = RSAAlgorithm.to_jwk(self.public_key, as_dict=True)
+        jwk.update({"kid": self.kid, "alg": self.algorithm, "use": "sig"})
+        return jwk
+
+
+class KeyRing:
+    """
+    Keys live as PEM files in JWT_KEYS_DIR (<kid>.pem). Every key on disk is
+    published in the JWKS so tokens signed before a rotation keep verifying;
+    the active key (JWT_ACTIVE_KID, else the newest key older than
+    JWT_KEY_ACTIVATION_DELAY_SECONDS) signs new tokens, so verifiers with a
+    cached JWKS already know it. Rotate with rotate_jwt_key.py; retire a key by
+    deleting its file once its tokens have expired. A token with an unknown kid
+    forces a (rate-limited) reload, so keys added by another worker verify
+    right away.
+    """
+
+    def __init__(self, algorithm: str, keys_dir: Path = JWT_KEYS_DIR):
+        self.algorithm = algorithm
+        self.keys_dir = keys_dir
+        self._keys: Dict[str, SigningKey] = {}
+        self._active_kid: Optional[str] = None
+        self._jwks_body: bytes = b'{"keys": []}'
+        self._jwks_etag: str = ""
+        self._loaded_at = 0.0
+        self._missed_at = 0.0
+        self._dir_mtime = None
+        self._activates_at: Optional[float] = None  # When a published newer key becomes eligible to sign
+        self._lock = threading.Lock()
+
+    def _refresh(self, force: bool = False):
+        """Reload keys if the directory changed (checked at most every JWT_KEYS_RELOAD_SECONDS unless forced)"""
+        now = time.monotonic()
+        if not force and self._keys and now - self._loaded_at < JWT_KEYS_RELOAD_SECONDS:
+            return
+
+        with self._lock:
+            if not force and self._keys and now - self._loaded_at < JWT_KEYS_RELOAD_SECONDS:
+                return
+            self._loaded_at = now
+
+            self.keys_dir.mkdir(parents=True, exist_ok=True)
+            mtime = self.keys_dir.stat().st_mtime
+            activation_due = self._activates_at is not None and time.time() >= self._activates_at
+            if not force and self._keys and mtime == self._dir_mtime and not activation_due:
+                return
+
+            if not self._load_keys():
+                # First start (or algorithm switch): bootstrap a key so signing works out of the box
+                self._bootstrap()
+                mtime = self.keys_dir.stat().st_mtime
+            self._dir_mtime = mtime
+
+    def _bootstrap(self):
+        """Create the first key; the file lock keeps workers starting together on one shared key"""
+        with open(self.keys_dir / ".bootstrap.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not self._load_keys():
+                self._generate_key()
+                self._load_keys()
+
+    def _load_keys(self) -> bool:
+        """Load all keys matching the algorithm; False if there are none"""
+        keys = {}
+        for pem_path in self.keys_dir.glob("*.pem"):
+            try:
+                private_key = serialization.load_pem_private_key(pem_path.read_bytes(), password=None)
+            except (ValueError, TypeError) as e:
+                logger.error(f"Skipping unreadable JWT key {pem_path.name}: {e}")
+                continue
+
+            if self.algorithm == "EdDSA" and not isinstance(private_key, ed25519.Ed25519PrivateKey):
+                continue
+            if self.algorithm == "RS256" and not isinstance(private_key, rsa.RSAPrivateKey):
+                continue
+
+            kid = pem_path.stem
+            keys[kid] = SigningKey(kid, self.algorithm, private_key, pem_path.stat().st_mtime)
+
+        if not keys:
+            return False
+
+        now = time.time()
+        if JWT_ACTIVE_KID and JWT_ACTIVE_KID in keys:
+            active_kid = JWT_ACTIVE_KID
+        else:
+            # A fresh key only signs once it has been published long enough; on bootstrap there is no other
+            ready = [k for k in keys.values() if now - k.created_at >= JWT_KEY_ACTIVATION_DELAY_SECONDS]
+            active_kid = max(ready or keys.values(), key=lambda k: k.created_at).kid
+        pending = [
+            k.created_at + JWT_KEY_ACTIVATION_DELAY_SECONDS for k in keys.values()
+            if k.created_at > keys[active_kid].created_at
+        ]
+
+        jwks_body = json.dumps(
+            {"keys": [key.to_jwk() for key in sorted(keys.values(), key=lambda k: k.kid)]},
+            separators=(",", ":")
+        ).encode()
+
+        self._keys = keys
+        self._active_kid = active_kid
+        self._activates_at = None if JWT_ACTIVE_KID in keys or not pending else min(pending)
+        self._jwks_body = jwks_body
+        self._jwks_etag = '"' + hashlib.sha256(jwks_body).hexdigest()[:32] + '"'
+        logger.info(f"Loaded {len(keys)} JWT signing key(s), active kid: {active_kid}")
+        return True
+
+    def _generate_key(self) -> str:
+        """Create a new key file; it is published on next reload and signs after the activation delay"""
+        if self.algorithm == "EdDSA":
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        else:
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+        pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+        kid = time.strftime("%Y%m%d%H%M%S", time.gmtime()) + "-" + os.urandom(4).hex()
+        key_path = self.keys_dir / f"{kid}.pem"
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(pem)
+
+        logger.info(f"Generated new {self.algorithm} JWT signing key: {kid}")
+        return kid
+
+    def rotate(self) -> str:
+        """Generate a new signing key; it is published at once and becomes active after the activation delay"""
+        with self._lock:
+            self.keys_dir.mkdir(parents=True, exist_ok=True)
+            kid = self._generate_key()
+            self._load_keys()
+            self._dir_mtime = self.keys_dir.stat().st_mtime
+            self._loaded_at = time.monotonic()
+        return kid
+
+    def activate(self, kid: str):
+        """Make a key active now, skipping the activation delay (e.g. the current key is compromised)"""
+        with self._lock:
+            key_path = self.keys_dir / f"{kid}.pem"
+            if not key_path.exists():
+                raise KeyError(kid)
+            # Backdating marks the key as published long enough; touching the
+            # directory makes other workers reload on their next check
+            backdated = time.time() - JWT_KEY_ACTIVATION_DELAY_SECONDS
+            os.utime(key_path, (backdated, backdated))
+            os.utime(self.keys_dir)
+            self._load_keys()
+            self._dir_mtime = self.keys_dir.stat().st_mtime
+            self._loaded_at = time.monotonic()
+
+    @property
+    def active_key(self) -> SigningKey:
+        self._refresh()
+        return self._keys[self._active_kid]
+
+    def get_public_key(self, kid: Optional[str]):
+        """Public key for a kid, or None if unknown"""
+        if not kid:
+            return None
+        self._refresh()
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._missed_at >= JWT_KEYS_MISS_RELOAD_SECONDS:
+            # Possibly rotated or bootstrapped by another process since the last reload
+            self._missed_at = time.monotonic()
+            self._refresh(force=True)
+            key = self._keys.get(kid)
+        return key.public_key if key else None
+
+    @property
+    def kids(self) -> List[str]:
+        self._refresh()
+        return list(self._keys)
+
+    def jwks(self) -> tuple:
+        """Serialized JWKS document and its ETag"""
+        self._refresh()
+        return self._jwks_body, self._jwks_etag
+
+
+_key_rings: Dict[str, KeyRing] = {}
+
+
+def get_key_ring(algorithm: str) -> KeyRing:
+    """Process-wide key ring for an asymmetric algorithm"""
+    if algorithm not in _key_rings:
+        _key_rings[algorithm] = KeyRing(algorithm)
+    return _key_rings[algorithm]
@@ -0,0 +1,95 @@
+"""
+JWT Verifier
+Local token verification against a remote JWKS endpoint with key caching.
+Meant for services (Browo AI, edge proxies) that validate HRthis tokens
+without calling back into this backend.
+"""
+
+from typing import Dict, Optional
+import httpx
+import jwt
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JWKS_TTL = 300        # Used when the endpoint sends no max-age
+MIN_REFETCH_INTERVAL = 30     # Throttle refetches triggered by unknown kids
+
+
+class JWKSVerifier:
+    """Verifies tokens using public keys fetched from a JWKS URL"""
+
+    def __init__(
+        self,
+        jwks_url: str,
+        algorithms=("RS256", "EdDSA"),
+        issuer: Optional[str] = "hrthis-backend",
+        timeout: float = 5.0
+    ):
+        self.jwks_url = jwks_url
+        self.algorithms = list(algorithms)
+        self.issuer = issuer
+        self.timeout = timeout
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._etag: Optional[str] = None
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        """Fetch the JWKS, honouring ETag and Cache-Control max-age"""
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        response = httpx.get(self.jwks_url, headers=headers, timeout=self.timeout)
+        self._last_fetch = time.monotonic()
+
+        max_age = DEFAULT_JWKS_TTL
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        if match:
+            max_age = int(match.group(1))
+        self._expires_at = self._last_fetch + max_age
+
+        if response.status_code == 304:
+            return
+        response.raise_for_status()
+
+        keys = {}
+        for jwk in response.json().get("keys", []):
+            try:
+                keys[jwk["kid"]] = jwt.PyJWK(jwk)
+            except (KeyError, jwt.PyJWKError) as e:
+                logger.warning(f"Ignoring unusable JWK from {self.jwks_url}: {e}")
+        self._keys = keys
+        self._etag = response.headers.get("ETag")
+
+    def _get_key(self, kid: str) -> Optional[jwt.PyJWK]:
+        now = time.monotonic()
+        key = self._keys.get(kid)
+        if key is not None and now < self._expires_at:
+            return key
+
+        with self._lock:
+            key = self._keys.get(kid)
+            expired = time.monotonic() >= self._expires_at
+            # Unknown kid usually means a rotation happened; refetch, but not more than once per interval
+            if expired or (key is None and time.monotonic() - self._last_fetch >= MIN_REFETCH_INTERVAL):
+                try:
+                    self._fetch()
+                except httpx.HTTPError as e:
+                    # Keep serving cached keys if the endpoint is briefly unavailable
+                    logger.error(f"JWKS fetch from {self.jwks_url} failed: {e}")
+                key = self._keys.get(kid)
+        return key
+
+    def verify(self, token: str) -> Optional[dict]:
+        """Return the token claims, or None if the token is invalid"""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = self._get_key(kid) if kid else None
+            if key is None:
+                return None
+            return jwt.decode(token, key.key, algorithms=self.algorithms, issuer=self.issuer)
+        except jwt.PyJWTError:
+            return None
@@ -0,0 +1,125 @@
+"""
+Login Throttle
+Per-account limiter for login attempts, checked before any password hashing
+"""
+
+from collections import OrderedDict
+from typing import List, Optional
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LOGIN_ATTEMPTS_PER_MINUTE = float(os.getenv("LOGIN_ATTEMPTS_PER_MINUTE", "10"))
+LOGIN_ATTEMPTS_BURST = int(os.getenv("LOGIN_ATTEMPTS_BURST", "5"))
+# Lockout in seconds after the n-th consecutive failure (last value repeats)
+LOGIN_BACKOFF_SCHEDULE = [
+    float(s) for s in os.getenv("LOGIN_BACKOFF_SCHEDULE", "0,0,0,1,2,5,15,30,60,300").split(",")
+]
+LOGIN_THROTTLE_MAX_ENTRIES = int(os.getenv("LOGIN_THROTTLE_MAX_ENTRIES", "100000"))
+LOGIN_THROTTLE_IDLE_SECONDS = int(os.getenv("LOGIN_THROTTLE_IDLE_SECONDS", "3600"))
+
+
+class _AccountState:
+    """Fixed-size state per identifier (GCRA arrival time + failure streak)"""
+    __slots__ = ("tat", "failures", "blocked_until", "last_seen")
+
+    def __init__(self, now: float):
+        self.tat = now
+        self.failures = 0
+        self.blocked_until = 0.0
+        self.last_seen = now
+
+
+class LoginThrottle:
+    """
+    GCRA rate limit plus an exponential-style backoff on consecutive failures.
+    Entries are kept in LRU order, so idle eviction and the memory ceiling are
+    both O(1) pops from the front of the dict.
+    """
+
+    def __init__(
+        self,
+        attempts_per_minute: float = LOGIN_ATTEMPTS_PER_MINUTE,
+        burst: int = LOGIN_ATTEMPTS_BURST,
+        backoff_schedule: Optional[List[float]] = None,
+        max_entries: int = LOGIN_THROTTLE_MAX_ENTRIES,
+        idle_seconds: int = LOGIN_THROTTLE_IDLE_SECONDS
+    ):
+        self.emission_interval = 60.0 / attempts_per_minute
+        self.tolerance = self.emission_interval * max(burst - 1, 0)
+        self.backoff_schedule = backoff_schedule or LOGIN_BACKOFF_SCHEDULE
+        self.max_entries = max_entries
+        self.idle_seconds = idle_seconds
+        self._entries: "OrderedDict[str, _AccountState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(identifier: str) -> str:
+        return identifier.strip().lower()
+
+    def _evict(self, now: float):
+        """Drop idle entries from the LRU end and enforce the memory ceiling"""
+        while self._entries:
+            key, state = next(iter(self._entries.items()))
+            if len(self._entries) > self.max_entries or now - state.last_seen > self.idle_seconds:
+                self._entries.popitem(last=False)
+            else:
+                break
+
+    def _touch(self, key: str, now: float) -> _AccountState:
+        state = self._entries.get(key)
+        if state is None:
+            state = _AccountState(now)
+            self._entries[key] = state
+        else:
+            self._entries.move_to_end(key)
+        state.last_seen = now
+        self._evict(now)
+        return state
+
+    def check(self, identifier: str) -> Optional[float]:
+        """Consume one attempt; returns seconds to wait if throttled, else None"""
+        key = self._key(identifier)
+        now = time.monotonic()
+
+        with self._lock:
+            state = self._touch(key, now)
+
+            if state.blocked_until > now:
+                return state.blocked_until - now
+
+            tat = max(state.tat, now)
+            if tat - now > self.tolerance:
+                return tat - self.tolerance - now
+
+            state.tat = tat + self.emission_interval
+            return None
+
+    def record_failure(self, identifier: str):
+        """Extend the lockout according to the backoff schedule"""
+        key = self._key(identifier)
+        now = time.monotonic()
+
+        with self._lock:
+            state = self._touch(key, now)
+            state.failures += 1
+            delay = self.backoff_schedule[min(state.failures, len(self.backoff_schedule)) - 1]
+            if delay > 0:
+                state.blocked_until = now + delay
+                logger.warning(f"Login backoff for '{key}': {state.failures} failures, locked {delay:.0f}s")
+
+    def record_success(self, identifier: str):
+        """Forget the failure streak after a successful login"""
+        with self._lock:
+            self._entries.pop(self._key(identifier), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared instance used by the auth endpoints
+login_throttle = LoginThrottle()
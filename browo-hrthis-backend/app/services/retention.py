@@ -0,0 +1,184 @@
+"""
+Retention Service
+Enforces FileMetadata.retention_date: expired documents are deleted in small
+batches, each its own short transaction, with a throttle on the files removed
+per second. Deleted rows drop out of the index scan, so an interrupted sweep
+simply continues where it stopped on the next run.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.core.static_files import unlink_with_siblings
+from app.models.file import FileMetadata
+from app.services.file_storage import collect_unreferenced_blobs, release_blob
+from app.services.file_stats import record_file_removed
+from app.services.text_extraction import cancel_extraction
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RETENTION_SWEEP_INTERVAL_HOURS = float(os.getenv("RETENTION_SWEEP_INTERVAL_HOURS", "24"))  # 0 disables the in-app sweeper
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "200"))
+RETENTION_MAX_FILES_PER_SECOND = float(os.getenv("RETENTION_MAX_FILES_PER_SECOND", "50"))
+
+
+@dataclass
+class SweepReport:
+    dry_run: bool
+    files: int = 0
+    bytes: int = 0
+    batches: int = 0
+    blobs_deleted: int = 0
+    bytes_freed: int = 0
+    by_category: Dict[str, int] = field(default_factory=dict)
+    oldest_retention_date: Optional[datetime] = None
+
+    def count(self, file_metadata):
+        self.files += 1
+        self.bytes += file_metadata.file_size or 0
+        category = file_metadata.category.value if file_metadata.category else "other"
+        self.by_category[category] = self.by_category.get(category, 0) + 1
+        if self.oldest_retention_date is None:
+            self.oldest_retention_date = file_metadata.retention_date
+
+
+def _expired_batch(db: Session, now: datetime, batch_size: int, after: Optional[tuple] = None) -> List:
+    """Next expired rows in (retention_date, id) order, served by the retention_date index"""
+    query = db.query(
+        FileMetadata.id, FileMetadata.file_hash, FileMetadata.file_path,
+        FileMetadata.file_size, FileMetadata.category, FileMetadata.employee_id, FileMetadata.retention_date
+    ).filter(FileMetadata.retention_date <= now)
+    if after is not None:
+        retention_date, file_id = after
+        query = query.filter(or_(
+            FileMetadata.retention_date > retention_date,
+            and_(FileMetadata.retention_date == retention_date, FileMetadata.id > file_id)
+        ))
+    return query.order_by(FileMetadata.retention_date, FileMetadata.id).limit(batch_size).all()
+
+
+def _delete_batch(db: Session, rows: List, now: datetime, report: SweepReport) -> List[str]:
+    """Delete one batch in a single transaction, then reclaim storage; returns deleted ids"""
+    deleted_ids, legacy_paths = [], []
+
+    for row in rows:
+        # Conditional delete: a concurrent sweep or a retention change since the scan wins
+        deleted = db.query(FileMetadata).filter(
+            FileMetadata.id == row.id,
+            FileMetadata.retention_date <= now
+        ).delete(synchronize_session=False)
+        if not deleted:
+            continue
+
+        cancel_extraction(db, row.id)
+        record_file_removed(db, row.category, row.employee_id, row.file_size)
+        if not (row.file_hash and release_blob(db, row.file_hash)):
+            legacy_paths.append(Path(row.file_path))
+        deleted_ids.append(row.id)
+        report.count(row)
+
+    db.commit()
+
+    # Bytes go only after the metadata delete is durable. Released blobs are left to the
+    # blob GC: an upload of the same content may re-reference them within the grace window
+    for path in legacy_paths:
+        unlink_with_siblings(path)
+
+    return deleted_ids
+
+
+def sweep_expired_files(
+    now: Optional[datetime] = None,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    max_files_per_second: float = RETENTION_MAX_FILES_PER_SECOND,
+    dry_run: bool = False,
+    max_batches: Optional[int] = None,
+    on_batch: Optional[Callable[[List[str]], None]] = None
+) -> SweepReport:
+    """Delete (or with dry_run only report) every file whose retention date has passed"""
+    now = now or datetime.utcnow()
+    report = SweepReport(dry_run=dry_run)
+    db = SessionLocal()
+    cursor = None
+
+    try:
+        while max_batches is None or report.batches < max_batches:
+            started = time.monotonic()
+            rows = _expired_batch(db, now, batch_size, after=cursor)
+            if not rows:
+                break
+            report.batches += 1
+            # Page past every row seen: dry runs delete nothing, and rows that changed
+            # concurrently would otherwise come back and end the sweep early
+            cursor = (rows[-1].retention_date, rows[-1].id)
+
+            if dry_run:
+                for row in rows:
+                    report.count(row)
+                db.rollback()
+                continue
+
+            deleted_ids = _delete_batch(db, rows, now, report)
+            if on_batch and deleted_ids:
+                on_batch(deleted_ids)
+
+            # Throttle so a large backlog does not saturate the disk or hold the database
+            if max_files_per_second > 0:
+                remaining = len(rows) / max_files_per_second - (time.monotonic() - started)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+        # Blobs released at least BLOB_GC_GRACE_SECONDS ago, typically by the previous sweep
+        if not dry_run:
+            stats = collect_unreferenced_blobs(db)
+            report.blobs_deleted = stats["deleted"]
+            report.bytes_freed = stats["bytes_freed"]
+    finally:
+        db.close()
+
+    logger.info(
+        f"Retention sweep{' (dry run)' if dry_run else ''}: {report.files} files, "
+        f"{report.bytes / (1024 * 1024):.2f}MB in {report.batches} batches, {report.blobs_deleted} blobs deleted"
+    )
+    return report
+
+
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+async def _run_schedule(interval_seconds: float, on_batch: Optional[Callable[[List[str]], None]]):
+    while True:
+        try:
+            await asyncio.to_thread(sweep_expired_files, on_batch=on_batch)
+        except Exception:
+            logger.exception("Retention sweep failed")
+        await asyncio.sleep(interval_seconds)
+
+
+def start_retention_sweeper(on_batch: Optional[Callable[[List[str]], None]] = None):
+    """Sweep periodically inside the API process (app startup)"""
+    global _sweeper_task
+    if RETENTION_SWEEP_INTERVAL_HOURS <= 0 or _sweeper_task is not None:
+        return
+    _sweeper_task = asyncio.get_running_loop().create_task(
+        _run_schedule(RETENTION_SWEEP_INTERVAL_HOURS * 3600, on_batch)
+    )
+
+
+def stop_retention_sweeper():
+    """Cancel the in-app schedule (app shutdown); a running batch finishes in its thread"""
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        _sweeper_task = None
@@ -0,0 +1,185 @@
+"""
+Storage Layout Migration
+Moves stored files into the sharded blob layout while the API keeps serving:
+- blobs still in the flat blobs/<sha256> layout are relinked to blobs/ab/cd/<sha256>
+- legacy uploads/<uuid>.<ext> files are hashed and turned into (deduplicated) blobs,
+  confidential ones encrypted on the way
+Every file is hard-linked to its new location first, the rows are switched in
+a short transaction and the old name is removed only after the commit, so a
+reader always finds the file under either path.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from sqlalchemy.orm import Session
+
+from app.core.static_files import unlink_with_siblings
+from app.models.file import FileBlob, FileMetadata
+from app.services.file_storage import CODEC_AESGCM, STAGING_DIR, acquire_blob, describe_file, encode_for_storage, file_store
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MigrationReport:
+    dry_run: bool
+    blobs_moved: int = 0
+    legacy_converted: int = 0
+    deduplicated: int = 0
+    missing: int = 0
+    failed: int = 0
+
+
+def _link(source: Path, destination: Path):
+    """Hard link (no data copy, same filesystem); falls back to a copy across devices"""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source, destination)
+    except FileExistsError:
+        pass
+    except OSError:
+        tmp = destination.with_name(destination.name + ".part")
+        shutil.copy2(source, tmp)
+        os.replace(tmp, destination)
+
+
+def _move_blob(db: Session, sha256: str, old_path: str, report: MigrationReport):
+    source, destination = Path(old_path), file_store.blob_path(sha256)
+    if not source.exists():
+        report.missing += 1
+        return
+    if report.dry_run:
+        report.blobs_moved += 1
+        return
+
+    _link(source, destination)
+    switched = db.query(FileBlob).filter(
+        FileBlob.sha256 == sha256,
+        FileBlob.file_path == old_path
+    ).update({FileBlob.file_path: str(destination)}, synchronize_session=False)
+    if switched:
+        db.query(FileMetadata).filter(FileMetadata.file_hash == sha256).update(
+            {FileMetadata.file_path: str(destination)}, synchronize_session=False
+        )
+    db.commit()
+
+    if switched:
+        source.unlink(missing_ok=True)
+        report.blobs_moved += 1
+    else:
+        # Blob was collected or moved concurrently; drop our copy unless it is in use
+        if not db.query(FileBlob).filter(FileBlob.file_path == str(destination)).first():
+            destination.unlink(missing_ok=True)
+
+
+def _convert_legacy(db: Session, file_metadata: FileMetadata, report: MigrationReport):
+    source = Path(file_metadata.file_path)
+    if not source.exists():
+        report.missing += 1
+        return
+    if report.dry_run:
+        report.legacy_converted += 1
+        return
+
+    # acquire_blob consumes its input, so give it a second name for the same inode
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    staged = STAGING_DIR / uuid.uuid4().hex
+    _link(source, staged)
+    try:
+        stored = encode_for_storage(db, describe_file(staged), file_metadata.confidential)
+        blob, deduplicated = acquire_blob(db, stored)
+        switched = db.query(FileMetadata).filter(
+            FileMetadata.id == file_metadata.id,
+            FileMetadata.file_path == file_metadata.file_path,
+            FileMetadata.file_hash.is_(None)
+        ).update({
+            FileMetadata.file_hash: blob.sha256,
+            FileMetadata.stored_filename: blob.sha256,
+            FileMetadata.file_path: blob.file_path,
+            FileMetadata.storage_codec: blob.codec,
+            FileMetadata.encrypted_key: stored.wrapped_key,
+            # Text extracted while the file was plain must not outlive its encryption
+            FileMetadata.extracted_text: None if blob.codec == CODEC_AESGCM else FileMetadata.extracted_text
+        }, synchronize_session=False)
+        if not switched:
+            # Row was deleted or changed meanwhile: undo the reference (and a blob only we created)
+            blob_file = Path(blob.file_path)
+            db.rollback()
+            if not deduplicated and db.get(FileBlob, stored.sha256) is None:
+                blob_file.unlink(missing_ok=True)
+            return
+        db.commit()
+    except Exception:
+        db.rollback()
+        staged.unlink(missing_ok=True)
+        raise
+
+    unlink_with_siblings(source)
+    report.legacy_converted += 1
+    if deduplicated:
+        report.deduplicated += 1
+
+
+def migrate_storage_layout(
+    db: Session,
+    batch_size: int = 200,
+    pause_seconds: float = 0.1,
+    dry_run: bool = False,
+    max_batches: Optional[int] = None
+) -> MigrationReport:
+    """Run the migration in keyset-ordered batches; safe to interrupt and re-run"""
+    report = MigrationReport(dry_run=dry_run)
+    batches = 0
+
+    # Phase 1: flat blobs -> sharded blobs (zero-ref blobs are left to the GC)
+    last_sha = ""
+    while max_batches is None or batches < max_batches:
+        rows = db.query(FileBlob.sha256, FileBlob.file_path).filter(
+            FileBlob.sha256 > last_sha,
+            FileBlob.ref_count > 0
+        ).order_by(FileBlob.sha256).limit(batch_size).all()
+        db.rollback()
+        if not rows:
+            break
+        for sha256, file_path in rows:
+            if file_store.is_sharded(file_path, sha256):
+                continue
+            try:
+                _move_blob(db, sha256, file_path, report)
+            except OSError as e:
+                db.rollback()
+                report.failed += 1
+                logger.warning(f"Could not move blob {sha256[:12]}: {e}")
+        last_sha = rows[-1].sha256
+        batches += 1
+        time.sleep(pause_seconds)
+
+    # Phase 2: pre-dedup uploads -> content-addressed blobs
+    last_id = ""
+    while max_batches is None or batches < max_batches:
+        rows = db.query(FileMetadata).filter(
+            FileMetadata.id > last_id,
+            FileMetadata.file_hash.is_(None)
+        ).order_by(FileMetadata.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        db.expunge_all()
+        for file_metadata in rows:
+            try:
+                _convert_legacy(db, file_metadata, report)
+            except OSError as e:
+                report.failed += 1
+                logger.warning(f"Could not convert file {file_metadata.id}: {e}")
+        batches += 1
+        time.sleep(pause_seconds)
+
+    logger.info(f"Storage layout migration: {report}")
+    return report
@@ -0,0 +1,309 @@
+"""
+Storage Reconciliation
+Finds files on disk that no row references and rows whose file is gone, online
+and in constant memory. The sharded blob tree is walked in hash order with
+os.scandir (one small shard directory is sorted at a time) and merged against
+a keyset scan of file_blobs in the same order, so neither side is ever loaded
+whole. Flat directories (legacy uploads, pre-migration blobs) have no order to
+merge on and are checked with batched lookups instead.
+Files younger than the grace period are never touched: uploads write the file
+before the row commits.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List
+import logging
+import os
+import re
+import time
+
+from sqlalchemy.orm import Session
+
+from app.core.static_files import PRECOMPRESSED_SUFFIXES
+from app.models.file import FileBlob, FileMetadata
+from app.services.file_storage import BLOB_GC_GRACE_SECONDS, STAGING_DIR, UPLOAD_DIR, delete_unreferenced_blob, file_store
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "1000"))
+RECONCILE_MAX_ENTRIES_PER_SECOND = float(os.getenv("RECONCILE_MAX_ENTRIES_PER_SECOND", "5000"))  # Filesystem entries
+RECONCILE_EXAMPLES = 20  # Ids/paths kept per finding for the report
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+_TEMP_SUFFIXES = (".part", ".gc", ".zst", ".enc")  # Left behind by interrupted writes and GC
+
+
+@dataclass
+class ReconcileReport:
+    repair: bool
+    files_scanned: int = 0
+    blob_rows_scanned: int = 0
+    orphan_files: int = 0            # On disk, no row references them
+    orphan_bytes: int = 0
+    files_removed: int = 0
+    bytes_freed: int = 0
+    stale_temp_files: int = 0        # Abandoned staging/.part/.gc files
+    skipped_recent: int = 0          # Candidates still inside the grace period
+    missing_blob_files: int = 0      # file_blobs rows whose file is gone
+    blob_rows_removed: int = 0       # ...and that nothing referenced, so they were deleted
+    dangling_files: int = 0          # file_metadata rows whose content is gone (reported, never deleted)
+    examples: dict = field(default_factory=dict)
+
+    def example(self, finding: str, value: str):
+        values = self.examples.setdefault(finding, [])
+        if len(values) < RECONCILE_EXAMPLES:
+            values.append(value)
+
+
+class _Throttle:
+    """Caps filesystem entries per second so a scan does not starve the API of disk I/O"""
+
+    def __init__(self, per_second: float):
+        self.per_second = per_second
+        self.started = time.monotonic()
+        self.count = 0
+
+    def tick(self, entries: int = 1):
+        if self.per_second <= 0:
+            return
+        self.count += entries
+        ahead = self.count / self.per_second - (time.monotonic() - self.started)
+        if ahead > 0.05:
+            time.sleep(ahead)
+
+
+def _sorted_subdirs(path: Path, width: int) -> List[os.DirEntry]:
+    with os.scandir(path) as entries:
+        return sorted(
+            (e for e in entries if len(e.name) == width and e.is_dir(follow_symlinks=False)),
+            key=lambda e: e.name
+        )
+
+
+def _iter_sharded_files(throttle: _Throttle) -> Iterator[os.DirEntry]:
+    """Files of the sharded blob tree (blobs/ab/cd/<sha256>) in name order"""
+    if not file_store.blob_dir.is_dir():
+        return
+    for first in _sorted_subdirs(file_store.blob_dir, 2):
+        for second in _sorted_subdirs(Path(first.path), 2):
+            with os.scandir(second.path) as entries:
+                shard = sorted((e for e in entries if e.is_file(follow_symlinks=False)), key=lambda e: e.name)
+            throttle.tick(len(shard))
+            yield from shard
+
+
+def _iter_blob_rows(db: Session, batch_size: int) -> Iterator:
+    """file_blobs in sha256 order, one keyset batch at a time"""
+    last_sha = ""
+    while True:
+        rows = db.query(FileBlob.sha256, FileBlob.file_path, FileBlob.ref_count).filter(
+            FileBlob.sha256 > last_sha
+        ).order_by(FileBlob.sha256).limit(batch_size).all()
+        db.rollback()
+        if not rows:
+            return
+        yield from rows
+        last_sha = rows[-1].sha256
+
+
+def _is_old(entry: os.DirEntry, cutoff: float) -> bool:
+    return entry.stat(follow_symlinks=False).st_mtime < cutoff
+
+
+def _remove_stale(entry: os.DirEntry, cutoff: float, report: ReconcileReport):
+    """Interrupted-write leftovers: nothing can reference them"""
+    if not _is_old(entry, cutoff):
+        report.skipped_recent += 1
+        return
+    report.stale_temp_files += 1
+    report.example("stale_temp_files", entry.path)
+    if report.repair:
+        size = entry.stat(follow_symlinks=False).st_size
+        Path(entry.path).unlink(missing_ok=True)
+        report.files_removed += 1
+        report.bytes_freed += size
+
+
+def _handle_orphan_blob(db: Session, entry: os.DirEntry, cutoff: float, report: ReconcileReport):
+    if not _is_old(entry, cutoff):
+        report.skipped_recent += 1
+        return
+    size = entry.stat(follow_symlinks=False).st_size
+    report.orphan_files += 1
+    report.orphan_bytes += size
+    report.example("orphan_files", entry.path)
+    if not report.repair:
+        return
+
+    # Rename aside first; an upload that adopted this content meanwhile gets its file back
+    path = Path(entry.path)
+    doomed = path.with_name(path.name + ".gc")
+    try:
+        os.replace(path, doomed)
+    except FileNotFoundError:
+        return
+    if db.query(FileBlob.sha256).filter(FileBlob.sha256 == entry.name).first() is not None:
+        db.rollback()
+        os.replace(doomed, path)
+        return
+    db.rollback()
+    doomed.unlink()
+    report.files_removed += 1
+    report.bytes_freed += size
+
+
+def _handle_missing_blob(db: Session, row, report: ReconcileReport):
+    # A row still naming a flat (pre-migration) path is fine if that file exists
+    if file_store.resolve(row.file_path, row.sha256).exists():
+        return
+    report.missing_blob_files += 1
+    report.example("missing_blob_files", row.sha256)
+    if row.ref_count <= 0:
+        if report.repair and delete_unreferenced_blob(db, row.sha256, row.file_path) is not None:
+            report.blob_rows_removed += 1
+        return
+    # Referenced content is lost: surface the affected documents, never delete them
+    dangling = db.query(FileMetadata.id).filter(FileMetadata.file_hash == row.sha256).all()
+    db.rollback()
+    report.dangling_files += len(dangling)
+    for (file_id,) in dangling:
+        report.example("dangling_files", file_id)
+
+
+def _merge_blobs(db: Session, batch_size: int, cutoff: float, throttle: _Throttle, report: ReconcileReport):
+    """Sorted merge of the sharded tree against file_blobs"""
+    files = (e for e in _iter_sharded_files(throttle) if not _stale_or_skip(e, cutoff, report))
+    rows = _iter_blob_rows(db, batch_size)
+    entry, row = next(files, None), next(rows, None)
+
+    while entry is not None or row is not None:
+        if row is None or (entry is not None and entry.name < row.sha256):
+            report.files_scanned += 1
+            _handle_orphan_blob(db, entry, cutoff, report)
+            entry = next(files, None)
+        elif entry is None or row.sha256 < entry.name:
+            report.blob_rows_scanned += 1
+            _handle_missing_blob(db, row, report)
+            row = next(rows, None)
+        else:
+            report.files_scanned += 1
+            report.blob_rows_scanned += 1
+            entry, row = next(files, None), next(rows, None)
+
+
+def _stale_or_skip(entry: os.DirEntry, cutoff: float, report: ReconcileReport) -> bool:
+    """Filter for the merge: handles temp leftovers, drops anything that is not a blob name"""
+    if entry.name.endswith(_TEMP_SUFFIXES):
+        _remove_stale(entry, cutoff, report)
+        return True
+    return _SHA256.match(entry.name) is None
+
+
+def _flush_flat(db: Session, batch: List[os.DirEntry], column, cutoff: float, report: ReconcileReport):
+    """Batched lookup for unordered directories: one IN query per batch of entries"""
+    if not batch:
+        return
+    paths = {str(Path(entry.path)): entry for entry in batch}
+    referenced = {path for (path,) in db.query(column).filter(column.in_(paths))}
+    db.rollback()
+    for path, entry in paths.items():
+        if path in referenced:
+            continue
+        if not _is_old(entry, cutoff):
+            report.skipped_recent += 1
+            continue
+        size = entry.stat(follow_symlinks=False).st_size
+        report.orphan_files += 1
+        report.orphan_bytes += size
+        report.example("orphan_files", path)
+        if report.repair:
+            Path(path).unlink(missing_ok=True)
+            report.files_removed += 1
+            report.bytes_freed += size
+    batch.clear()
+
+
+def _scan_flat(db: Session, directory: Path, column, batch_size: int, cutoff: float,
+               throttle: _Throttle, report: ReconcileReport):
+    """Files directly inside directory that no row's column references"""
+    if not directory.is_dir():
+        return
+    batch: List[os.DirEntry] = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            throttle.tick()
+            report.files_scanned += 1
+            if entry.name.endswith(_TEMP_SUFFIXES):
+                _remove_stale(entry, cutoff, report)
+                continue
+            # Precompressed siblings (precompress_uploads.py) live as long as their original
+            if entry.name.endswith(PRECOMPRESSED_SUFFIXES) and os.path.exists(os.path.splitext(entry.path)[0]):
+                continue
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                _flush_flat(db, batch, column, cutoff, report)
+    _flush_flat(db, batch, column, cutoff, report)
+
+
+def _scan_staging(cutoff: float, throttle: _Throttle, report: ReconcileReport):
+    """Staged uploads that never reached the blob store"""
+    if not STAGING_DIR.is_dir():
+        return
+    with os.scandir(STAGING_DIR) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                throttle.tick()
+                report.files_scanned += 1
+                _remove_stale(entry, cutoff, report)
+
+
+def _scan_unblobbed_rows(db: Session, batch_size: int, throttle: _Throttle, report: ReconcileReport):
+    """file_metadata rows without a blob row (legacy files): their own file must exist"""
+    last_id = ""
+    while True:
+        rows = db.query(FileMetadata.id, FileMetadata.file_path, FileMetadata.file_hash).outerjoin(
+            FileBlob, FileBlob.sha256 == FileMetadata.file_hash
+        ).filter(
+            FileMetadata.id > last_id,
+            FileBlob.sha256.is_(None)
+        ).order_by(FileMetadata.id).limit(batch_size).all()
+        db.rollback()
+        if not rows:
+            return
+        for row in rows:
+            throttle.tick()
+            if not file_store.resolve(row.file_path, row.file_hash).exists():
+                report.dangling_files += 1
+                report.example("dangling_files", row.id)
+        last_id = rows[-1].id
+
+
+def reconcile_storage(
+    db: Session,
+    repair: bool = False,
+    batch_size: int = RECONCILE_BATCH_SIZE,
+    max_entries_per_second: float = RECONCILE_MAX_ENTRIES_PER_SECOND,
+    grace_seconds: int = BLOB_GC_GRACE_SECONDS
+) -> ReconcileReport:
+    """
+    Compare ./uploads with the database. Without repair only reports; with
+    repair removes orphan and stale files (past the grace period) and deletes
+    unreferenced blob rows whose file is gone. Metadata rows whose content is
+    lost are only reported.
+    """
+    report = ReconcileReport(repair=repair)
+    throttle = _Throttle(max_entries_per_second)
+    cutoff = time.time() - grace_seconds
+
+    _merge_blobs(db, batch_size, cutoff, throttle, report)
+    _scan_flat(db, file_store.blob_dir, FileBlob.file_path, batch_size, cutoff, throttle, report)
+    _scan_flat(db, UPLOAD_DIR, FileMetadata.file_path, batch_size, cutoff, throttle, report)
+    _scan_staging(cutoff, throttle, report)
+    _scan_unblobbed_rows(db, batch_size, throttle, report)
+
+    logger.info(f"Storage reconciliation{'' if repair else ' (report only)'}: {report}")
+    return report
@@ -0,0 +1,402 @@
+"""
+Text Extraction Service
+Background worker that fills FileMetadata.extracted_text. Uploads only enqueue
+a durable ExtractionJob row; workers claim jobs in batches, run the extractors
+in a resource-capped process pool and write results back in one transaction
+per batch, so upload latency never depends on parsing. Encrypted files are
+never extracted: their text would sit in the database and FTS index in plain.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+import asyncio
+import logging
+import os
+import re
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+import uuid
+import zipfile
+import xml.etree.ElementTree as ET
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.file import ExtractionJob, FileMetadata
+from app.services.file_storage import CODEC_AESGCM, file_store, materialized
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+EXTRACTION_WORKER_ENABLED = os.getenv("EXTRACTION_WORKER_ENABLED", "true").lower() == "true"
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+EXTRACTION_BATCH_SIZE = int(os.getenv("EXTRACTION_BATCH_SIZE", "8"))
+EXTRACTION_POLL_SECONDS = float(os.getenv("EXTRACTION_POLL_SECONDS", "5"))
+EXTRACTION_TIMEOUT = int(os.getenv("EXTRACTION_TIMEOUT", "60"))  # seconds per job
+EXTRACTION_MEMORY_LIMIT_MB = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", "512"))  # per worker process, 0 = unlimited
+EXTRACTION_MAX_ATTEMPTS = int(os.getenv("EXTRACTION_MAX_ATTEMPTS", "3"))
+EXTRACTION_MAX_CHARS = int(os.getenv("EXTRACTION_MAX_CHARS", "1000000"))
+EXTRACTION_OCR_ENABLED = os.getenv("EXTRACTION_OCR_ENABLED", "false").lower() == "true"
+EXTRACTION_OCR_LANGUAGES = os.getenv("EXTRACTION_OCR_LANGUAGES", "deu+eng")
+EXTRACTION_OCR_MAX_PAGES = int(os.getenv("EXTRACTION_OCR_MAX_PAGES", "10"))
+
+PDFTOTEXT = shutil.which("pdftotext")  # poppler-utils
+PDFTOPPM = shutil.which("pdftoppm")
+TESSERACT = shutil.which("tesseract")  # optional, only used with EXTRACTION_OCR_ENABLED
+
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+DOCX_MAX_XML_BYTES = 50 * 1024 * 1024  # Refuse zip bombs before inflating them
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# A claimed job whose worker died is handed out again after this long
+STALE_CLAIM_SECONDS = EXTRACTION_TIMEOUT * 3
+
+# Errors that are final: the job is not retried
+FILE_GONE = "File no longer exists"
+FILE_ENCRYPTED = "Encrypted files are not extracted"
+
+
+class ExtractionResult(NamedTuple):
+    job_id: int
+    file_id: str
+    claim_token: str
+    text: Optional[str]
+    error: Optional[str]
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def _ocr_available() -> bool:
+    return EXTRACTION_OCR_ENABLED and TESSERACT is not None
+
+
+def can_extract(mime_type: Optional[str], filename: Optional[str] = None) -> bool:
+    """Whether an extractor exists for this file type"""
+    mime_type = mime_type or ""
+    if mime_type == "application/pdf":
+        return PDFTOTEXT is not None
+    if mime_type == DOCX_MIME_TYPE or (filename or "").lower().endswith(".docx"):
+        return True
+    return mime_type.startswith("image/") and _ocr_available()
+
+
+def enqueue_extraction(db: Session, file_metadata: FileMetadata) -> Optional[ExtractionJob]:
+    """
+    Queue text extraction for a new upload within the caller's transaction.
+    Deduplicated uploads reuse the text already extracted for the same blob.
+    """
+    if not can_extract(file_metadata.mime_type, file_metadata.filename):
+        return None
+    if file_metadata.storage_codec == CODEC_AESGCM:
+        return None
+
+    if file_metadata.file_hash:
+        sibling = db.query(FileMetadata.extracted_text).filter(
+            FileMetadata.file_hash == file_metadata.file_hash,
+            FileMetadata.id != file_metadata.id,
+            FileMetadata.extracted_text.isnot(None)
+        ).first()
+        if sibling is not None:
+            file_metadata.extracted_text = sibling.extracted_text
+            file_metadata.is_processed = True
+            return None
+
+    job = ExtractionJob(file_id=file_metadata.id, status="pending")
+    db.add(job)
+    return job
+
+
+def cancel_extraction(db: Session, file_id: str) -> int:
+    """Drop queued jobs of a file that is being deleted"""
+    return db.query(ExtractionJob).filter(
+        ExtractionJob.file_id == file_id
+    ).delete(synchronize_session=False)
+
+
+# --- Extractors (run inside pool worker processes) ---
+
+def _limit_worker_resources():
+    """Pool initializer: cap address space so a hostile document cannot exhaust memory"""
+    if EXTRACTION_MEMORY_LIMIT_MB > 0:
+        limit = EXTRACTION_MEMORY_LIMIT_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Shutdown is driven by the parent
+
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout(f"Extraction exceeded {EXTRACTION_TIMEOUT}s")
+
+
+def _run_tool(args: List[str]) -> bytes:
+    return subprocess.run(
+        args,
+        check=True,
+        timeout=EXTRACTION_TIMEOUT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    ).stdout
+
+
+def _extract_pdf(path: str) -> str:
+    text = _run_tool([PDFTOTEXT, "-q", "-enc", "UTF-8", path, "-"]).decode("utf-8", "replace")
+    if text.strip() or not (_ocr_available() and PDFTOPPM):
+        return text
+
+    # No text layer: scanned document, OCR the first pages
+    with tempfile.TemporaryDirectory() as workdir:
+        prefix = os.path.join(workdir, "page")
+        _run_tool([PDFTOPPM, "-r", "200", "-gray", "-png", "-f", "1", "-l", str(EXTRACTION_OCR_MAX_PAGES), path, prefix])
+        pages = sorted(name for name in os.listdir(workdir) if name.endswith(".png"))
+        return "\n\f".join(_extract_image(os.path.join(workdir, name)) for name in pages)
+
+
+def _extract_docx(path: str) -> str:
+    paragraphs = []
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo("word/document.xml")
+        if info.file_size > DOCX_MAX_XML_BYTES:
+            raise ValueError("document.xml too large")
+
+        with archive.open(info) as document:
+            current = []
+            for event, element in ET.iterparse(document, events=("end",)):
+                if element.tag == f"{WORD_NAMESPACE}t" and element.text:
+                    current.append(element.text)
+                elif element.tag == f"{WORD_NAMESPACE}tab":
+                    current.append("\t")
+                elif element.tag == f"{WORD_NAMESPACE}p":
+                    paragraphs.append("".join(current))
+                    current = []
+                    element.clear()
+    return "\n".join(paragraphs)
+
+
+def _extract_image(path: str) -> str:
+    return _run_tool([TESSERACT, path, "stdout", "-l", EXTRACTION_OCR_LANGUAGES]).decode("utf-8", "replace")
+
+
+def extract_text(path: str, mime_type: str, filename: str, codec: Optional[str] = None,
+                 wrapped_key: Optional[str] = None) -> str:
+    """Extract plain text from one stored file (pool worker entry point)"""
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.alarm(EXTRACTION_TIMEOUT)
+    try:
+        with materialized(Path(path), codec, wrapped_key=wrapped_key) as plain:
+            if mime_type == "application/pdf":
+                text = _extract_pdf(str(plain))
+            elif mime_type == DOCX_MIME_TYPE or filename.lower().endswith(".docx"):
+                text = _extract_docx(str(plain))
+            elif mime_type.startswith("image/"):
+                text = _extract_image(str(plain))
+            else:
+                raise ValueError(f"No extractor for {mime_type}")
+    finally:
+        signal.alarm(0)
+
+    # Collapse runs of blank lines/spaces; the text feeds search, not layout
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n\s*\n+", "\n\n", text).strip()
+    return text[:EXTRACTION_MAX_CHARS]
+
+
+# --- Worker ---
+
+class ExtractionWorker:
+    """Claims queued jobs, extracts in a process pool and writes back per batch"""
+
+    def __init__(self, workers: int = EXTRACTION_WORKERS, batch_size: int = EXTRACTION_BATCH_SIZE,
+                 poll_seconds: float = EXTRACTION_POLL_SECONDS):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(workers)  # One job per pool process, so timeouts never include queueing
+        self._stopping = asyncio.Event()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_limit_worker_resources)
+        return self._pool
+
+    def _reset_pool(self):
+        """Replace the pool after a crash or a worker that ignored its timeout"""
+        if self._pool is None:
+            return
+        # ProcessPoolExecutor cannot cancel a running call; kill the processes outright
+        for process in list((self._pool._processes or {}).values()):
+            process.kill()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    def claim_batch(self) -> List[tuple]:
+        """Atomically take ownership of up to batch_size pending (or stale) jobs"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            claimable = or_(
+                ExtractionJob.status == "pending",
+                (ExtractionJob.status == "running") & (ExtractionJob.claimed_at < now - timedelta(seconds=STALE_CLAIM_SECONDS))
+            )
+            candidate_ids = [row.id for row in db.query(ExtractionJob.id).filter(claimable)
+                             .order_by(ExtractionJob.id).limit(self.batch_size)]
+            if not candidate_ids:
+                return []
+
+            token = uuid.uuid4().hex
+            # The status condition is re-checked per row, so concurrent workers never share a job
+            db.query(ExtractionJob).filter(ExtractionJob.id.in_(candidate_ids), claimable).update({
+                ExtractionJob.status: "running",
+                ExtractionJob.claim_token: token,
+                ExtractionJob.claimed_at: now,
+                ExtractionJob.attempts: ExtractionJob.attempts + 1
+            }, synchronize_session=False)
+            db.commit()
+
+            return db.query(
+                ExtractionJob.id, ExtractionJob.file_id, ExtractionJob.claim_token,
+                FileMetadata.file_path, FileMetadata.file_hash, FileMetadata.storage_codec,
+                FileMetadata.encrypted_key, FileMetadata.mime_type, FileMetadata.filename
+            ).outerjoin(FileMetadata, FileMetadata.id == ExtractionJob.file_id).filter(
+                ExtractionJob.claim_token == token
+            ).all()
+        finally:
+            db.close()
+
+    async def _process(self, job) -> ExtractionResult:
+        if job.file_path is None:
+            return ExtractionResult(job.id, job.file_id, job.claim_token, None, FILE_GONE)
+        if job.storage_codec == CODEC_AESGCM:
+            # Queued before the file was encrypted
+            return ExtractionResult(job.id, job.file_id, job.claim_token, None, FILE_ENCRYPTED)
+
+        path = str(file_store.resolve(job.file_path, job.file_hash))
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._slots:
+                future = loop.run_in_executor(
+                    self._get_pool(), extract_text, path, job.mime_type or "", job.filename or "",
+                    job.storage_codec, job.encrypted_key
+                )
+                # The in-process alarm should fire first; this is the backstop for stuck native code
+                text = await asyncio.wait_for(future, timeout=EXTRACTION_TIMEOUT + 10)
+            return ExtractionResult(job.id, job.file_id, job.claim_token, text, None)
+        except asyncio.TimeoutError:
+            self._reset_pool()
+            return ExtractionResult(job.id, job.file_id, job.claim_token, None, "Worker timed out")
+        except BrokenProcessPool:
+            self._reset_pool()
+            return ExtractionResult(job.id, job.file_id, job.claim_token, None, "Worker process died")
+        except MemoryError:
+            return ExtractionResult(job.id, job.file_id, job.claim_token, None, "Memory limit exceeded")
+        except Exception as e:
+            return ExtractionResult(job.id, job.file_id, job.claim_token, None, f"{type(e).__name__}: {e}"[:1000])
+
+    def write_back(self, results: List[ExtractionResult]):
+        """Persist a batch of results in a single transaction"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            for result in results:
+                owned = db.query(ExtractionJob).filter(
+                    ExtractionJob.id == result.job_id,
+                    ExtractionJob.claim_token == result.claim_token
+                )
+                if result.error is None:
+                    db.query(FileMetadata).filter(FileMetadata.id == result.file_id).update({
+                        FileMetadata.extracted_text: result.text,
+                        FileMetadata.is_processed: True
+                    }, synchronize_session=False)
+                    owned.update({
+                        ExtractionJob.status: "done",
+                        ExtractionJob.finished_at: now,
+                        ExtractionJob.last_error: None,
+                        ExtractionJob.claim_token: None
+                    }, synchronize_session=False)
+                else:
+                    logger.warning(f"Text extraction failed for file {result.file_id}: {result.error}")
+                    retry = result.file_id is not None and result.error not in (FILE_GONE, FILE_ENCRYPTED)
+                    owned.update({
+                        ExtractionJob.status: "pending" if retry else "failed",
+                        ExtractionJob.last_error: result.error,
+                        ExtractionJob.claim_token: None,
+                        ExtractionJob.finished_at: None if retry else now
+                    }, synchronize_session=False)
+                    # Jobs that keep failing are parked instead of retried forever
+                    db.query(ExtractionJob).filter(
+                        ExtractionJob.id == result.job_id,
+                        ExtractionJob.status == "pending",
+                        ExtractionJob.attempts >= EXTRACTION_MAX_ATTEMPTS
+                    ).update({
+                        ExtractionJob.status: "failed",
+                        ExtractionJob.finished_at: now
+                    }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def run_once(self) -> int:
+        """Process one batch; returns the number of jobs handled"""
+        jobs = await asyncio.to_thread(self.claim_batch)
+        if not jobs:
+            return 0
+        results = await asyncio.gather(*(self._process(job) for job in jobs))
+        await asyncio.to_thread(self.write_back, results)
+        done = sum(1 for result in results if result.error is None)
+        logger.info(f"Text extraction batch: {done}/{len(results)} succeeded")
+        return len(results)
+
+    async def run(self):
+        """Poll for jobs until stop() is called"""
+        logger.info(f"Text extraction worker started ({self.workers} processes)")
+        while not self._stopping.is_set():
+            try:
+                handled = await self.run_once()
+            except Exception:
+                logger.exception("Text extraction batch failed")
+                handled = 0
+            if handled < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stop(self):
+        self._stopping.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_worker: Optional[ExtractionWorker] = None
+_worker_task: Optional[asyncio.Task] = None
+
+
+def start_extraction_worker():
+    """Run the worker inside the API process (app startup)"""
+    global _worker, _worker_task
+    if not EXTRACTION_WORKER_ENABLED or _worker_task is not None:
+        return
+    _worker = ExtractionWorker()
+    _worker_task = asyncio.get_running_loop().create_task(_worker.run())
+
+
+async def stop_extraction_worker():
+    """Stop the in-process worker (app shutdown)"""
+    global _worker, _worker_task
+    if _worker_task is None:
+        return
+    _worker.stop()
+    try:
+        await asyncio.wait_for(_worker_task, timeout=5)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        _worker_task.cancel()
+    _worker, _worker_task = None, None
@@ -0,0 +1,160 @@
+"""
+Thumbnail Service
+Lazily generated, disk-cached image derivatives (thumbnails, WebP variants,
+first-page PDF previews). Rendering runs in a process pool so Pillow work
+never blocks the event loop; concurrent requests for the same derivative
+share one render (singleflight).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+
+from PIL import Image, ImageOps
+
+from app.services.file_storage import UPLOAD_DIR, materialized
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DERIVATIVES_DIR = UPLOAD_DIR / "derivatives"
+THUMBNAIL_SIZES = (64, 128, 256, 512, 1024)  # Longest edge in pixels
+THUMBNAIL_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+PDF_RENDER_TIMEOUT = int(os.getenv("PDF_RENDER_TIMEOUT", "30"))  # seconds
+
+PDFTOPPM = shutil.which("pdftoppm")  # poppler-utils; PDF previews are skipped without it
+
+_pool: Optional[ProcessPoolExecutor] = None
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def derivative_path(content_hash: str, size: int, fmt: str) -> Path:
+    """Cache location of a derivative, keyed by content hash, size and format"""
+    return DERIVATIVES_DIR / content_hash[:2] / f"{content_hash}-{size}.{fmt}"
+
+
+def purge_derivatives(content_hash: str) -> int:
+    """Remove every cached derivative of a blob (called by blob GC)"""
+    removed = 0
+    for path in (DERIVATIVES_DIR / content_hash[:2]).glob(f"{content_hash}-*"):
+        path.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+
+def supports_preview(mime_type: str) -> bool:
+    """Whether a derivative can be produced for this MIME type"""
+    if mime_type.startswith("image/"):
+        return True
+    return mime_type == "application/pdf" and PDFTOPPM is not None
+
+
+def _render_pdf_first_page(source: str, size: int, workdir: str) -> str:
+    """Rasterize page 1 of a PDF to PNG with pdftoppm"""
+    prefix = os.path.join(workdir, "page")
+    subprocess.run(
+        [PDFTOPPM, "-f", "1", "-l", "1", "-singlefile", "-scale-to", str(size), "-png", source, prefix],
+        check=True,
+        timeout=PDF_RENDER_TIMEOUT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return prefix + ".png"
+
+
+def render_derivative(source: str, destination: str, mime_type: str, size: int, fmt: str,
+                      codec: Optional[str] = None, wrapped_key: Optional[str] = None) -> str:
+    """Produce one derivative (runs inside a pool worker process)"""
+    with tempfile.TemporaryDirectory() as workdir, \
+            materialized(Path(source), codec, Path(workdir), wrapped_key) as plain:
+        source = str(plain)
+        if mime_type == "application/pdf":
+            source = _render_pdf_first_page(source, size, workdir)
+
+        with Image.open(source) as image:
+            # JPEG decoders can downscale while decoding, which is much cheaper than a full decode
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+            if fmt == "jpeg" or image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if fmt == "webp" and "A" in image.getbands() else "RGB")
+
+            Path(destination).parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = f"{destination}.{uuid.uuid4().hex}.tmp"
+            if fmt == "webp":
+                image.save(tmp_path, THUMBNAIL_FORMATS[fmt], quality=80, method=4)
+            else:
+                image.save(tmp_path, THUMBNAIL_FORMATS[fmt], quality=82, optimize=True, progressive=True)
+            os.replace(tmp_path, destination)
+
+    return destination
+
+
+def render_derivative_bytes(source: str, mime_type: str, size: int, fmt: str,
+                            codec: Optional[str], wrapped_key: Optional[str]) -> bytes:
+    """
+    Render without caching (pool worker); used for encrypted sources, whose
+    previews must not enter the derivative cache. The decrypted source and the
+    render exist only in an owner-only temp directory removed before returning.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        destination = os.path.join(workdir, f"derivative.{fmt}")
+        render_derivative(source, destination, mime_type, size, fmt, codec, wrapped_key)
+        with open(destination, "rb") as f:
+            return f.read()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+    return _pool
+
+
+def shutdown_pool():
+    """Stop the render workers (app shutdown)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def get_derivative(source: Path, content_hash: str, mime_type: str, size: int, fmt: str,
+                         codec: Optional[str] = None) -> Path:
+    """Return the cached derivative, rendering it on first request"""
+    destination = derivative_path(content_hash, size, fmt)
+    if destination.exists():
+        return destination
+
+    key = str(destination)
+    future = _inflight.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            _get_pool(), render_derivative, str(source), key, mime_type, size, fmt, codec
+        )
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+        logger.info(f"Rendering {fmt} derivative {size}px for {content_hash[:12]}")
+
+    # shield: one caller disconnecting must not cancel the render others are waiting for
+    await asyncio.shield(future)
+    return destination
+
+
+async def render_uncached(source: Path, mime_type: str, size: int, fmt: str,
+                          codec: Optional[str], wrapped_key: Optional[str]) -> bytes:
+    """Render a derivative without caching it on disk"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_pool(), render_derivative_bytes, str(source), mime_type, size, fmt, codec, wrapped_key
+    )
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+File encryption benchmark
+Measures the chunked AES-GCM codec against a plain copy of the same file:
+encryption and decryption throughput, overhead per MB and range reads
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.file_encryption import ENCRYPTION_CHUNK_SIZE, DecryptingReader, encrypt_file
+
+CHUNK = 1024 * 1024
+
+def _timed(fn, repeats: int) -> float:
+    """Median wall time of fn in seconds"""
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+def _drain(reader):
+    while reader.read(CHUNK):
+        pass
+
+def benchmark(sizes_mb, repeats: int, range_reads: int):
+    workdir = Path(tempfile.mkdtemp(prefix="hrthis-crypto-bench-"))
+    data_key = os.urandom(32)
+    rng = random.Random(42)
+    print(f"Chunk size {ENCRYPTION_CHUNK_SIZE // 1024}KB, median of {repeats} runs")
+
+    try:
+        for size_mb in sizes_mb:
+            plain = workdir / f"plain-{size_mb}"
+            sealed = workdir / f"sealed-{size_mb}"
+            copy = workdir / f"copy-{size_mb}"
+            with open(plain, "wb") as f:
+                for _ in range(size_mb):
+                    f.write(os.urandom(CHUNK))
+
+            # Baselines: what storing and serving the file costs without encryption
+            copy_time = _timed(lambda: shutil.copyfile(plain, copy), repeats)
+            def read():
+                with open(plain, "rb") as f:
+                    _drain(f)
+            read_time = _timed(read, repeats)
+
+            encrypt_time = _timed(lambda: encrypt_file(plain, sealed, data_key), repeats)
+
+            def decrypt():
+                with DecryptingReader(sealed, data_key) as reader:
+                    _drain(reader)
+            decrypt_time = _timed(decrypt, repeats)
+
+            size = plain.stat().st_size
+            with DecryptingReader(sealed, data_key) as reader:
+                range_samples = []
+                for _ in range(range_reads):
+                    offset = rng.randrange(0, max(size - 4096, 1))
+                    started = time.perf_counter()
+                    reader.seek(offset)
+                    reader.read(4096)
+                    range_samples.append((time.perf_counter() - started) * 1000)
+
+            print(f"✅ {size_mb:5}MB | encrypt {size_mb / encrypt_time:7.0f}MB/s (+{(encrypt_time - copy_time) * 1000 / size_mb:5.2f}ms/MB vs copy) "
+                  f"| decrypt {size_mb / decrypt_time:7.0f}MB/s (+{(decrypt_time - read_time) * 1000 / size_mb:5.2f}ms/MB vs read) "
+                  f"| 4KB range read p50 {statistics.median(range_samples):.3f}ms "
+                  f"| on disk +{(sealed.stat().st_size - size) / size * 100:.3f}%")
+
+            for path in (plain, sealed, copy):
+                path.unlink(missing_ok=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100], help="File sizes in MB")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--range-reads", type=int, default=200)
+    args = parser.parse_args()
+
+    benchmark(args.sizes, args.repeats, args.range_reads)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+File search benchmark
+Fills a throwaway SQLite database with synthetic documents and measures
+index maintenance cost and query latency of the full-text search
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+WORDS = (
+    "arbeitsvertrag gehalt urlaub krankmeldung zeugnis bewerbung schulung zertifikat "
+    "führerschein versicherung bank überweisung kündigung probezeit arbeitszeit "
+    "homeoffice dienstwagen reisekosten abrechnung steuer sozialversicherung "
+    "datenschutz vertraulich personalakte abmahnung beförderung elternzeit rente"
+).split()
+FILLER = [f"wort{i}" for i in range(5000)]
+QUERIES = ["arbeitsvertrag", "kündigung probezeit", "zert", "reisekosten abrechnung", "datenschutz vertraulich", "wort4999"]
+
+def _document(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=20) + rng.choices(FILLER, k=rng.randint(200, 800))
+    rng.shuffle(words)
+    return " ".join(words)
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+def benchmark(documents: int, batch_size: int, repeats: int):
+    workdir = tempfile.mkdtemp(prefix="hrthis-search-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+
+    from app.core import database
+    database.engine.echo = False
+    from app.core.database import SessionLocal, create_tables, engine
+    from app.models.employee import Employee, UserRole
+    from app.models.file import FileMetadata
+    from app.services.file_search import ranked_matches, search_files
+    from sqlalchemy import func, insert, or_
+
+    create_tables()
+    rng = random.Random(42)
+
+    # Inserts go through the FTS triggers, so this measures incremental indexing cost
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, documents, batch_size):
+            rows = [{
+                "id": str(uuid.uuid4()),
+                "filename": f"{rng.choice(WORDS)}_{offset + i}.pdf",
+                "stored_filename": "x",
+                "file_path": "x",
+                "file_size": 1000,
+                "mime_type": "application/pdf",
+                "description": " ".join(rng.choices(WORDS, k=5)),
+                "extracted_text": _document(rng),
+                "uploaded_by": "bench",
+                "is_confidential": rng.choice(("0", "1"))
+            } for i in range(min(batch_size, documents - offset))]
+            conn.execute(insert(FileMetadata), rows)
+    elapsed = time.perf_counter() - started
+    print(f"✅ Indexed {documents} documents in {elapsed:.1f}s ({documents / elapsed:.0f} docs/s)")
+
+    db = SessionLocal()
+    user = Employee(id="bench", role=UserRole.USER)
+    try:
+        for query in QUERIES:
+            fts, like = [], []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                search_files(db, query, user, limit=20)
+                fts.append((time.perf_counter() - started) * 1000)
+
+            # Baseline: substring scan, ordered like a listing page so it cannot stop early
+            pattern = f"%{query.split()[0]}%"
+            for _ in range(max(1, repeats // 5)):
+                started = time.perf_counter()
+                db.query(FileMetadata).filter(or_(
+                    FileMetadata.filename.ilike(pattern),
+                    FileMetadata.description.ilike(pattern),
+                    FileMetadata.extracted_text.ilike(pattern)
+                )).order_by(FileMetadata.uploaded_at.desc()).limit(20).all()
+                like.append((time.perf_counter() - started) * 1000)
+
+            ranked = ranked_matches(db, query)
+            matches = db.query(func.count()).select_from(ranked).scalar()
+            print(f"  {query!r:28} {matches:6} matches | FTS p50 {statistics.median(fts):7.1f}ms p95 {_percentile(fts, 95):7.1f}ms "
+                  f"| LIKE p50 {statistics.median(like):8.1f}ms")
+    finally:
+        db.close()
+
+    print(f"Database kept at {workdir}/bench.db")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    benchmark(args.documents, args.batch_size, args.repeats)
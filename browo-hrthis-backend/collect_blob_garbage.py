@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Reclaim unreferenced file blobs
+Deletes content-addressed blobs whose reference count dropped to zero
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.database import SessionLocal
+from app.services.file_storage import BLOB_GC_GRACE_SECONDS, collect_unreferenced_blobs
+
+def collect_garbage(grace_seconds: int, batch_size: int):
+    """Run GC batches until no candidates are left"""
+    db = SessionLocal()
+    total = {"deleted": 0, "bytes_freed": 0, "skipped": 0}
+
+    try:
+        while True:
+            stats = collect_unreferenced_blobs(db, grace_seconds=grace_seconds, limit=batch_size)
+            for key in total:
+                total[key] += stats[key]
+            if stats["scanned"] < batch_size or stats["deleted"] == 0:
+                break
+
+        print(f"✅ Deleted {total['deleted']} blobs, freed {total['bytes_freed'] / (1024 * 1024):.2f}MB "
+              f"({total['skipped']} re-referenced during GC)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--grace-seconds", type=int, default=BLOB_GC_GRACE_SECONDS,
+                        help="Only collect blobs unreferenced for at least this long")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    collect_garbage(args.grace_seconds, args.batch_size)
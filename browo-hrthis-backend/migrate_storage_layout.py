@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Migrate stored files to the sharded blob layout
+Safe to run while the API is serving and to interrupt and re-run
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.database import SessionLocal
+from app.services.storage_migration import migrate_storage_layout
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--pause", type=float, default=0.1, help="Seconds to sleep between batches")
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be migrated")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = migrate_storage_layout(
+            db,
+            batch_size=args.batch_size,
+            pause_seconds=args.pause,
+            dry_run=args.dry_run,
+            max_batches=args.max_batches
+        )
+    finally:
+        db.close()
+
+    verb = "Would migrate" if report.dry_run else "Migrated"
+    print(f"✅ {verb} {report.blobs_moved} blobs and {report.legacy_converted} legacy files "
+          f"({report.deduplicated} deduplicated, {report.missing} missing on disk, {report.failed} failed)")
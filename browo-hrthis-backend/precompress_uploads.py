@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Precompress static uploads
+Writes .br and .gz siblings next to compressible files under ./uploads so the
+/uploads mount can serve them without compressing per request. Only missing or
+stale siblings are rebuilt; run after deploys or migrations, or from cron.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.static_files import brotli, precompress_directory
+from app.services.file_storage import UPLOAD_DIR
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--root", type=Path, default=UPLOAD_DIR)
+    parser.add_argument("--force", action="store_true", help="Rebuild siblings that are up to date")
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("Warning: brotli is not installed, writing .gz siblings only")
+
+    report = precompress_directory(args.root, force=args.force)
+    saved = report["bytes_in"] - report["bytes_out"]
+    print(f"✅ Scanned {report['scanned']} files, {report['eligible']} eligible")
+    print(f"   Wrote {report['written']} siblings, {saved / (1024 * 1024):.2f}MB smaller than the originals")
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Reconcile file statistics
+Rebuilds the file_stats summary table from file_metadata (run e.g. nightly)
+"""
+
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.database import SessionLocal
+from app.services.file_stats import reconcile_file_stats
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        result = reconcile_file_stats(db)
+    finally:
+        db.close()
+
+    print(f"✅ Rebuilt {result['buckets']} stats buckets ({result['drifted']} had drifted)")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Reconcile ./uploads with the database
+Reports files no row references and rows whose file is gone; with --repair,
+removes orphan and stale files past the grace period and unreferenced blob
+rows without a file. Safe to run while the API is serving.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.database import SessionLocal
+from app.services.file_storage import BLOB_GC_GRACE_SECONDS
+from app.services.storage_reconcile import RECONCILE_BATCH_SIZE, RECONCILE_MAX_ENTRIES_PER_SECOND, reconcile_storage
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repair", action="store_true", help="Delete orphans instead of only reporting them")
+    parser.add_argument("--batch-size", type=int, default=RECONCILE_BATCH_SIZE)
+    parser.add_argument("--max-entries-per-second", type=float, default=RECONCILE_MAX_ENTRIES_PER_SECOND,
+                        help="Throttle filesystem scanning (0 = unthrottled)")
+    parser.add_argument("--grace-seconds", type=int, default=BLOB_GC_GRACE_SECONDS,
+                        help="Never touch files modified more recently than this")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = reconcile_storage(
+            db,
+            repair=args.repair,
+            batch_size=args.batch_size,
+            max_entries_per_second=args.max_entries_per_second,
+            grace_seconds=args.grace_seconds
+        )
+    finally:
+        db.close()
+
+    print(f"✅ Scanned {report.files_scanned} files and {report.blob_rows_scanned} blob rows")
+    print(f"   Orphan files: {report.orphan_files} ({report.orphan_bytes / (1024 * 1024):.2f}MB), "
+          f"stale temp files: {report.stale_temp_files}, skipped (recent): {report.skipped_recent}")
+    print(f"   Blob rows without file: {report.missing_blob_files}, documents with lost content: {report.dangling_files}")
+    if report.repair:
+        print(f"   Removed {report.files_removed} files ({report.bytes_freed / (1024 * 1024):.2f}MB) "
+              f"and {report.blob_rows_removed} blob rows")
+    for finding, values in report.examples.items():
+        print(f"   {finding}: {', '.join(values)}")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Rotate the JWT signing key
+Generates a new key in JWT_KEYS_DIR. It is published in the JWKS at once and
+starts signing after JWT_KEY_ACTIVATION_DELAY_SECONDS, once cached JWKS copies
+know it; --activate switches to a key right away. Tokens signed with older keys
+keep verifying until their key files are deleted
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Optional
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.auth import ALGORITHM
+from app.services.jwt_keys import ASYMMETRIC_ALGORITHMS, JWT_ACTIVE_KID, JWT_KEY_ACTIVATION_DELAY_SECONDS, get_key_ring
+
+def rotate_key(list_only: bool, activate_kid: Optional[str] = None):
+    """Generate a new signing key for the configured algorithm, or activate an existing one"""
+    if ALGORITHM not in ASYMMETRIC_ALGORITHMS:
+        print(f"❌ ALGORITHM={ALGORITHM} signs with SECRET_KEY; key rotation needs RS256 or EdDSA")
+        sys.exit(1)
+
+    key_ring = get_key_ring(ALGORITHM)
+    if activate_kid:
+        try:
+            key_ring.activate(activate_kid)
+        except KeyError:
+            print(f"❌ No key {activate_kid} in the key directory")
+            sys.exit(1)
+        print(f"✅ Activated signing key {activate_kid}")
+        print("⚠️  Verifiers whose cached JWKS predates this key reject its tokens until they refetch")
+    elif not list_only:
+        kid = key_ring.rotate()
+        print(f"✅ Generated {ALGORITHM} signing key {kid}")
+        print(f"   It is published now and signs after {JWT_KEY_ACTIVATION_DELAY_SECONDS}s "
+              f"(use --activate {kid} to switch immediately)")
+
+    if JWT_ACTIVE_KID:
+        print(f"⚠️  JWT_ACTIVE_KID={JWT_ACTIVE_KID} is set and overrides the active key")
+    print(f"Keys: {', '.join(sorted(key_ring.kids))} (active: {key_ring.active_key.kid})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--list", action="store_true", help="Only list the keys on disk")
+    parser.add_argument("--activate", metavar="KID", help="Make an existing key active now, skipping the delay")
+    args = parser.parse_args()
+
+    rotate_key(args.list, args.activate)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Text extraction worker
+Runs the extraction queue outside the API process (set EXTRACTION_WORKER_ENABLED=false
+on the API to use this instead of the in-process worker)
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.database import SessionLocal, create_tables
+from app.models.file import ExtractionJob, FileMetadata
+from app.services.text_extraction import EXTRACTION_WORKERS, ExtractionWorker, enqueue_extraction
+
+def backfill(batch_size: int = 500) -> int:
+    """Queue extraction for existing files that were never processed"""
+    db = SessionLocal()
+    queued = 0
+    last_id = ""
+    try:
+        while True:
+            files = db.query(FileMetadata).filter(
+                FileMetadata.id > last_id,
+                FileMetadata.extracted_text.is_(None),
+                ~FileMetadata.id.in_(db.query(ExtractionJob.file_id))
+            ).order_by(FileMetadata.id).limit(batch_size).all()
+            if not files:
+                break
+            for file_metadata in files:
+                if enqueue_extraction(db, file_metadata) is not None:
+                    queued += 1
+            last_id = files[-1].id
+            db.commit()
+    finally:
+        db.close()
+    return queued
+
+async def run(workers: int, once: bool):
+    worker = ExtractionWorker(workers=workers)
+    try:
+        if once:
+            total = 0
+            while (handled := await worker.run_once()):
+                total += handled
+            print(f"✅ Processed {total} extraction jobs")
+        else:
+            await worker.run()
+    finally:
+        worker.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=EXTRACTION_WORKERS)
+    parser.add_argument("--backfill", action="store_true", help="Queue all unprocessed existing files first")
+    parser.add_argument("--once", action="store_true", help="Drain the queue and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    create_tables()
+    if args.backfill:
+        print(f"✅ Queued {backfill()} files for extraction")
+    try:
+        asyncio.run(run(args.workers, args.once))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Delete documents past their retention date
+Run from cron (or rely on the in-app schedule, RETENTION_SWEEP_INTERVAL_HOURS);
+use --dry-run to see what would be removed
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.retention import RETENTION_BATCH_SIZE, RETENTION_MAX_FILES_PER_SECOND, sweep_expired_files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true", help="Report expired files without deleting anything")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--max-files-per-second", type=float, default=RETENTION_MAX_FILES_PER_SECOND,
+                        help="Throttle deletes (0 = unthrottled)")
+    parser.add_argument("--max-batches", type=int, default=None, help="Stop after this many batches")
+    args = parser.parse_args()
+
+    report = sweep_expired_files(
+        batch_size=args.batch_size,
+        max_files_per_second=args.max_files_per_second,
+        dry_run=args.dry_run,
+        max_batches=args.max_batches
+    )
+
+    verb = "Would delete" if report.dry_run else "Deleted"
+    print(f"✅ {verb} {report.files} files ({report.bytes / (1024 * 1024):.2f}MB) in {report.batches} batches")
+    for category, count in sorted(report.by_category.items()):
+        print(f"   {category}: {count}")
+    if report.oldest_retention_date:
+        print(f"   Oldest retention date: {report.oldest_retention_date:%Y-%m-%d}")
+    if not report.dry_run:
+        print(f"   Blobs removed: {report.blobs_deleted}, freed {report.bytes_freed / (1024 * 1024):.2f}MB")